@@ -3,15 +3,132 @@ import sys
 import os
 import plotly.express as px
 import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import pandas as pd
 
-from utils.visualization import load_css, style_plot, display_active_filters
-from utils.data_loader import sidebar_filters
-from utils.rfm_calculator import compute_rfm
-from utils.cohort_calculator import compute_cohorts
+from utils.visualization import load_css, style_plot, display_active_filters, cached_figure
+from utils.tracing import trace_section, render_trace_panel
+from utils.data_loader import sidebar_filters, active_filters, month_label
+from utils.rfm_calculator import cached_rfm
+from utils.segment_rules import load_segment_rules
+from utils.cohort_calculator import cohort_month_index, customer_activity, bootstrap_retention_curve
+from utils.kpi_cube import get_daily_cube, get_distinct_sketches, rollup_kpis, rollup_timeseries
+from utils.timeseries import time_series_trace
+from utils.hyperloglog import hll_relative_error
 from utils.kpi_helpers import get_kpi_help, KPI_DEFINITIONS
 
+
+# Granularités du graphique CA / clients actifs (libellé affiché -> grain du cube)
+TIME_GRAINS = {"Mois": "month", "Semaine": "week", "Jour": "day"}
+
+
+# ============ CONSTRUCTION DES FIGURES (mises en cache par empreinte des agrégats) ============
+def build_country_bar(top_countries):
+    fig_country = px.bar(
+        top_countries, 
+        x='TotalPrice', 
+        y='Country', 
+        orientation='h', 
+        text_auto='.2s',
+        color='TotalPrice', 
+        color_continuous_scale='Purples',
+        labels={'TotalPrice': 'CA (£)', 'Country': 'Pays'}
+    )
+    fig_country.update_layout(yaxis={'categoryorder': 'total ascending'})
+    fig_country.update_xaxes(title_text="Chiffre d'Affaires (£)")
+    fig_country.update_yaxes(title_text="Pays")
+    return style_plot(fig_country, " Top 8 Marchés par CA")
+
+
+def build_segment_pie(seg_counts):
+    fig_pie = px.pie(
+        seg_counts, 
+        names='Segment', 
+        values='Count', 
+        hole=0.6,
+        color_discrete_sequence=px.colors.qualitative.Prism
+    )
+    fig_pie.update_traces(textposition='inside', textinfo='percent+label')
+    return style_plot(fig_pie, " Répartition Segments RFM")
+
+
+def build_monthly_chart(monthly_ca):
+    from plotly.subplots import make_subplots  # import différé : seulement si la figure n'est pas en cache
+
+    fig_time = make_subplots(specs=[[{"secondary_y": True}]])
+    fig_time.add_trace(
+        go.Bar(
+            x=monthly_ca['YearMonth'], 
+            y=monthly_ca['TotalPrice'], 
+            name="CA",
+            marker_color='#4F46E5'
+        ), 
+        secondary_y=False
+    )
+    fig_time.add_trace(
+        go.Scatter(
+            x=monthly_ca['YearMonth'], 
+            y=monthly_ca['Customer ID'], 
+            name="Clients Actifs",
+            mode='lines+markers', 
+            marker_color='#10B981',
+            line=dict(width=3)
+        ), 
+        secondary_y=True
+    )
+    fig_time.update_xaxes(title_text="Mois", tickangle=-45)
+    fig_time.update_yaxes(title_text="CA (£)", secondary_y=False)
+    fig_time.update_yaxes(title_text="Clients Actifs", secondary_y=True)
+    fig_time.update_layout(
+        hovermode='x unified',
+        height=450,
+        title_text=" CA Mensuel & Clients Actifs"
+    )
+    return style_plot(fig_time)
+
+
+def build_revenue_timeseries(series, grain_label):
+    # Séries longues (jour, semaine) : sous-échantillonnage LTTB et WebGL au-delà du seuil
+    from plotly.subplots import make_subplots
+
+    fig_time = make_subplots(specs=[[{"secondary_y": True}]])
+    fig_time.add_trace(
+        time_series_trace(
+            series['Date'].to_numpy(),
+            series['TotalPrice'].to_numpy(),
+            name="CA",
+            mode='lines',
+            line=dict(color='#4F46E5', width=1.5)
+        ),
+        secondary_y=False
+    )
+    fig_time.add_trace(
+        time_series_trace(
+            series['Date'].to_numpy(),
+            series['Customer ID'].to_numpy(),
+            name="Clients Actifs",
+            mode='lines',
+            line=dict(color='#10B981', width=1.5)
+        ),
+        secondary_y=True
+    )
+    fig_time.update_xaxes(title_text=grain_label)
+    fig_time.update_yaxes(title_text="CA (£)", secondary_y=False)
+    fig_time.update_yaxes(title_text="Clients Actifs", secondary_y=True)
+    fig_time.update_layout(
+        hovermode='x unified',
+        height=450,
+        title_text=f" CA & Clients Actifs par {grain_label.lower()}"
+    )
+    return style_plot(fig_time)
+
+
+def build_score_distribution(dist, axis_title, title):
+    fig = px.bar(dist, labels={'index': axis_title, 'value': 'Clients'}, color=dist.index)
+    fig.update_xaxes(title_text=axis_title)
+    fig.update_yaxes(title_text="Nombre de Clients")
+    return style_plot(fig, title)
+
+
 load_css()
 df, analysis_date = sidebar_filters()
 
@@ -19,7 +136,9 @@ if df is not None:
     st.title(" Tableau de Bord Exécutif")
     
     # Afficher les filtres actifs
-    from utils.data_loader import date_range, selected_countries, return_mode
+    filters = active_filters()
+    date_range, selected_countries, return_mode = filters['date_range'], filters['countries'], filters['return_mode']
+    approx_distinct = filters['approx_distinct']
     st.sidebar.markdown("---")
     st.sidebar.markdown("###  Filtres Actifs")
     st.sidebar.markdown(f"**Période** : {date_range[0].strftime('%d/%m/%y')} → {date_range[1].strftime('%d/%m/%y')}")
@@ -31,14 +150,19 @@ if df is not None:
     else:
         st.sidebar.markdown("**📦 Retours** : ✅ Inclus")
     
-    rfm_df = compute_rfm(df, analysis_date)
+    rfm_df = cached_rfm(df, filters['key'], analysis_date, load_segment_rules())
     
     # ============ KPIs PRINCIPAUX ============
+    trace_section("KPIs PRINCIPAUX")
     st.markdown("###  KPIs Clés")
     
-    nb_clients = df['Customer ID'].nunique()
-    ca_total = df['TotalPrice'].sum()
-    panier_moyen = df['TotalPrice'].sum() / df['Invoice'].nunique() if df['Invoice'].nunique() > 0 else 0
+    # KPIs agrégés depuis le cube quotidien (aucune relecture des transactions)
+    data_version = filters['data_version']
+    kpis = rollup_kpis(get_daily_cube(data_version), date_range, selected_countries, return_mode,
+                       sketches=get_distinct_sketches(data_version) if approx_distinct else None)
+    nb_clients = kpis['n_customers']
+    ca_total = kpis['ca_total']
+    panier_moyen = kpis['panier_moyen']
     clv_hist = rfm_df['Monetary'].mean()
     
     col1, col2, col3, col4 = st.columns(4)
@@ -71,87 +195,44 @@ if df is not None:
             help=f"{get_kpi_help('clv_historique')}"
         )
 
+    if approx_distinct:
+        st.caption(f"Clients actifs estimés par HyperLogLog (erreur type ±{hll_relative_error():.1%}).")
+
     st.markdown("###")
     
     # ============ GRAPHIQUES PRINCIPAUX ============
+    trace_section("GRAPHIQUES PRINCIPAUX")
     st.markdown("###  Vue d'Ensemble")
     
     col1, col2 = st.columns([3, 2])
 
     with col1:
         # Top pays
-        top_countries = df.groupby('Country')['TotalPrice'].sum().reset_index().sort_values('TotalPrice', ascending=False).head(8)
-        fig_country = px.bar(
-            top_countries, 
-            x='TotalPrice', 
-            y='Country', 
-            orientation='h', 
-            text_auto='.2s',
-            color='TotalPrice', 
-            color_continuous_scale='Purples',
-            labels={'TotalPrice': 'CA (£)', 'Country': 'Pays'}
-        )
-        fig_country.update_layout(yaxis={'categoryorder': 'total ascending'})
-        fig_country.update_xaxes(title_text="Chiffre d'Affaires (£)")
-        fig_country.update_yaxes(title_text="Pays")
-        st.plotly_chart(style_plot(fig_country, " Top 8 Marchés par CA"), use_container_width=True)
+        top_countries = kpis['top_countries']
+        st.plotly_chart(cached_figure(build_country_bar, top_countries), use_container_width=True)
 
     with col2:
         # Répartition segments
         seg_counts = rfm_df['Segment_Label'].value_counts().reset_index()
         seg_counts.columns = ['Segment', 'Count']
-        fig_pie = px.pie(
-            seg_counts, 
-            names='Segment', 
-            values='Count', 
-            hole=0.6,
-            color_discrete_sequence=px.colors.qualitative.Prism
-        )
-        fig_pie.update_traces(textposition='inside', textinfo='percent+label')
-        st.plotly_chart(style_plot(fig_pie, " Répartition Segments RFM"), use_container_width=True)
+        st.plotly_chart(cached_figure(build_segment_pie, seg_counts), use_container_width=True)
 
     # ============ ÉVOLUTION TEMPORELLE ============
+    trace_section("ÉVOLUTION TEMPORELLE")
     st.markdown("---")
     st.markdown("###  Saisonnalité & Tendances")
     
-    df['YearMonth'] = df['InvoiceDate'].dt.to_period('M')
-    monthly_ca = df.groupby('YearMonth').agg({
-        'TotalPrice': 'sum',
-        'Customer ID': 'nunique'
-    }).reset_index()
-    monthly_ca['YearMonth'] = monthly_ca['YearMonth'].astype(str)
+    grain_label = st.radio("Granularité", list(TIME_GRAINS), horizontal=True, key="kpi_time_grain")
     
     # Graphique double axe CA et clients
-    fig_time = make_subplots(specs=[[{"secondary_y": True}]])
-    fig_time.add_trace(
-        go.Bar(
-            x=monthly_ca['YearMonth'], 
-            y=monthly_ca['TotalPrice'], 
-            name="CA",
-            marker_color='#4F46E5'
-        ), 
-        secondary_y=False
-    )
-    fig_time.add_trace(
-        go.Scatter(
-            x=monthly_ca['YearMonth'], 
-            y=monthly_ca['Customer ID'], 
-            name="Clients Actifs",
-            mode='lines+markers', 
-            marker_color='#10B981',
-            line=dict(width=3)
-        ), 
-        secondary_y=True
-    )
-    fig_time.update_xaxes(title_text="Mois", tickangle=-45)
-    fig_time.update_yaxes(title_text="CA (£)", secondary_y=False)
-    fig_time.update_yaxes(title_text="Clients Actifs", secondary_y=True)
-    fig_time.update_layout(
-        hovermode='x unified',
-        height=450,
-        title_text=" CA Mensuel & Clients Actifs"
-    )
-    st.plotly_chart(style_plot(fig_time), use_container_width=True)
+    if TIME_GRAINS[grain_label] == "month":
+        monthly_ca = kpis['monthly']
+        st.plotly_chart(cached_figure(build_monthly_chart, monthly_ca), use_container_width=True)
+    else:
+        series = rollup_timeseries(get_daily_cube(data_version), date_range, selected_countries, return_mode,
+                                   grain=TIME_GRAINS[grain_label],
+                                   sketches=get_distinct_sketches(data_version) if approx_distinct else None)
+        st.plotly_chart(cached_figure(build_revenue_timeseries, series, grain_label), use_container_width=True)
     
     st.markdown("""
      **Lecture** : Les pics de CA correspondent-ils aux périodes de forte acquisition (Noël, Black Friday)? 
@@ -159,40 +240,39 @@ if df is not None:
     """)
 
     # ============ RÉTENTION & CLV ============
+    trace_section("RÉTENTION & CLV")
     st.markdown("---")
     st.markdown("###  Rétention & CLV par Cohorte")
     
     col1, col2 = st.columns(2)
     
     with col1:
-        # Calcul rétention moyen
-        retention_matrix, cohort_size = compute_cohorts(df)
-        
-        # Rétention moyenne par période
-        avg_retention_by_period = {}
-        for col in retention_matrix.columns:
-            if col <= 12:  # Jusqu'à M+12
-                avg_ret = retention_matrix[col].mean()
-                if not pd.isna(avg_ret):
-                    avg_retention_by_period[f"M+{col}"] = avg_ret
+        # Rétention moyenne par période (avec IC 95% bootstrap)
+        active, cohort_month, last_month = customer_activity(df)
+        retention_curve = bootstrap_retention_curve(active, cohort_month, last_month)
         
-        if avg_retention_by_period:
-            df_ret = pd.DataFrame(list(avg_retention_by_period.items()), columns=['Période', 'Rétention'])
+        if not retention_curve.empty:
+            df_ret = pd.DataFrame({
+                'Période': [f"M+{p}" for p in retention_curve.index],
+                'Rétention': retention_curve['Rétention'].values
+            })
             fig_ret = px.bar(
                 df_ret, 
                 x='Période', 
                 y='Rétention',
                 text_auto='.0%',
                 color='Rétention',
-                color_continuous_scale='Greens'
+                color_continuous_scale='Greens',
+                error_y=(retention_curve['Borne_Haute'] - retention_curve['Rétention']).values,
+                error_y_minus=(retention_curve['Rétention'] - retention_curve['Borne_Basse']).values
             )
             fig_ret.update_yaxes(tickformat='.0%')
             st.plotly_chart(style_plot(fig_ret, " Rétention Moyenne par Période"), use_container_width=True)
     
     with col2:
         # CLV empirique par cohorte
-        clv_by_cohort = df.copy()
-        clv_by_cohort['CohortMonth'] = clv_by_cohort.groupby('Customer ID')['InvoiceDate'].transform('min').dt.to_period('M')
+        clv_by_cohort = df[['Customer ID', 'TotalPrice']].copy()
+        clv_by_cohort['CohortMonth'] = cohort_month_index(df)
         
         clv_data = clv_by_cohort.groupby('CohortMonth').agg({
             'TotalPrice': 'sum',
@@ -200,7 +280,7 @@ if df is not None:
         }).reset_index()
         
         clv_data['CLV'] = clv_data['TotalPrice'] / clv_data['Customer ID']
-        clv_data['CohortMonth'] = clv_data['CohortMonth'].astype(str)
+        clv_data['CohortMonth'] = month_label(clv_data['CohortMonth'])
         
         fig_clv = px.bar(
             clv_data, 
@@ -215,34 +295,28 @@ if df is not None:
         st.plotly_chart(style_plot(fig_clv, " CLV Empirique par Cohorte"), use_container_width=True)
 
     # ============ RFM SCORE DISTRIBUTION ============
+    trace_section("RFM SCORE DISTRIBUTION")
     st.markdown("---")
     st.markdown("###  Distribution des Scores RFM")
     
     col1, col2, col3 = st.columns(3)
     
     with col1:
-        r_dist = pd.Series(rfm_df['R_Score'].value_counts().sort_index())
-        fig_r = px.bar(r_dist, labels={'index': 'R Score', 'value': 'Clients'}, color=r_dist.index)
-        fig_r.update_xaxes(title_text="Récence Score")
-        fig_r.update_yaxes(title_text="Nombre de Clients")
-        st.plotly_chart(style_plot(fig_r, " Récence"), use_container_width=True)
+        r_dist = rfm_df['R_Score'].value_counts().sort_index()
+        st.plotly_chart(cached_figure(build_score_distribution, r_dist, "Récence Score", " Récence"), use_container_width=True)
     
     with col2:
-        f_dist = pd.Series(rfm_df['F_Score'].value_counts().sort_index())
-        fig_f = px.bar(f_dist, labels={'index': 'F Score', 'value': 'Clients'}, color=f_dist.index)
-        fig_f.update_xaxes(title_text="Fréquence Score")
-        fig_f.update_yaxes(title_text="Nombre de Clients")
-        st.plotly_chart(style_plot(fig_f, " Fréquence"), use_container_width=True)
+        f_dist = rfm_df['F_Score'].value_counts().sort_index()
+        st.plotly_chart(cached_figure(build_score_distribution, f_dist, "Fréquence Score", " Fréquence"), use_container_width=True)
     
     with col3:
-        m_dist = pd.Series(rfm_df['M_Score'].value_counts().sort_index())
-        fig_m = px.bar(m_dist, labels={'index': 'M Score', 'value': 'Clients'}, color=m_dist.index)
-        fig_m.update_xaxes(title_text="Montant Score")
-        fig_m.update_yaxes(title_text="Nombre de Clients")
-        st.plotly_chart(style_plot(fig_m, " Montant"), use_container_width=True)
+        m_dist = rfm_df['M_Score'].value_counts().sort_index()
+        st.plotly_chart(cached_figure(build_score_distribution, m_dist, "Montant Score", " Montant"), use_container_width=True)
     
     st.markdown("""
      **Interprétation** : 
     - Score 4 = clients excellents (récents, fréquents, haut montant)
     - Score 1 = clients critiques (anciens, peu fréquents, bas montant)
     """)
+
+render_trace_panel()
@@ -5,9 +5,78 @@ import plotly.graph_objects as go
 import plotly.express as px
 import pandas as pd
 
-from utils.visualization import load_css, style_plot
+from utils.visualization import load_css, style_plot, retention_heatmap, figure_payload_bytes
+from utils.tracing import traced, trace_section, render_trace_panel, TRACE_TOGGLE_KEY
 from utils.data_loader import sidebar_filters
-from utils.cohort_calculator import compute_cohorts
+from utils.cohort_calculator import compute_cohorts, cohort_month_index, customer_activity, bootstrap_retention_curve
+
+
+@st.fragment
+@traced()
+def cohort_focus(retention_matrix, cohort_size):
+    """Focus sur une cohorte : seul ce bloc se ré-exécute quand la cohorte sélectionnée change."""
+    cohorts_list = retention_matrix.index.astype(str).tolist()
+    selected_cohort = st.selectbox(
+        "Sélectionner une cohorte pour analyser",
+        options=cohorts_list,
+        index=len(cohorts_list) - 1 if len(cohorts_list) > 0 else 0,
+        help="Affiche la courbe de rétention d'une cohorte particulière"
+    )
+    
+    if selected_cohort in retention_matrix.index.astype(str).values:
+        cohort_retention = retention_matrix.loc[selected_cohort]
+        cohort_retention = cohort_retention.dropna()
+        
+        if not cohort_retention.empty:
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                st.metric(
+                    f"Taille de la Cohorte {selected_cohort}",
+                    f"{int(cohort_size.get(selected_cohort, 0)):,} clients",
+                    help="Nombre de clients acquis ce mois-là"
+                )
+            
+            with col2:
+                first_month_ret = cohort_retention.iloc[0] if len(cohort_retention) > 0 else 0
+                st.metric(
+                    "Rétention M+1",
+                    f"{first_month_ret:.0%}",
+                    help=f"% des {int(cohort_size.get(selected_cohort, 0)):,} clients qui ont acheté le mois suivant"
+                )
+        
+        # Graphique de la cohorte sélectionnée (EN DEHORS DES COLONNES)
+        if not cohort_retention.empty:
+            cohort_ret_df = pd.DataFrame({
+                'Période': [f"M+{i}" for i in cohort_retention.index],
+                'Rétention': cohort_retention.values
+            })
+            
+            fig_cohort_detail = px.bar(
+                cohort_ret_df,
+                x='Période',
+                y='Rétention',
+                color='Rétention',
+                color_continuous_scale='Greens',
+                text_auto='.0%'
+            )
+            fig_cohort_detail.update_yaxes(tickformat='.0%')
+            fig_cohort_detail.update_layout(height=400)
+            
+            st.plotly_chart(style_plot(fig_cohort_detail, f" Courbe de Rétention Cohorte {selected_cohort}"), 
+                           use_container_width=True)
+            
+            # Analyse textuelle
+            ret_m1 = f"{cohort_retention.iloc[0]:.0%}" if len(cohort_retention) > 0 else 'N/A'
+            ret_m3 = f"{cohort_retention.iloc[3]:.0%}" if len(cohort_retention) > 3 else 'N/A'
+            ret_m6 = f"{cohort_retention.iloc[6]:.0%}" if len(cohort_retention) > 6 else 'N/A'
+            
+            st.markdown(f"""**Analyse pour {selected_cohort}** :
+- Taille initiale : {int(cohort_size.get(selected_cohort, 0)):,} clients
+- Rétention M+1 : {ret_m1}
+- Rétention M+3 : {ret_m3}
+- Rétention M+6 : {ret_m6}""")
+
 
 load_css()
 df, _ = sidebar_filters()
@@ -16,6 +85,7 @@ if df is not None:
     st.title(" Analyse de Rétention par Cohortes")
 
     # ============ GUIDE DES COHORTES ============
+    trace_section("GUIDE DES COHORTES")
     with st.expander(" Comprendre la Heatmap de Rétention", expanded=False):
         st.markdown("""
         ### Qu'est-ce qu'une Cohorte?
@@ -46,22 +116,12 @@ if df is not None:
         """)
 
     # ============ HEATMAP DE RÉTENTION ============
+    trace_section("HEATMAP DE RÉTENTION")
     st.markdown("###  HEATMAP de Rétention")
     
     retention_matrix, cohort_size = compute_cohorts(df)
 
-    fig_cohort = go.Figure(data=go.Heatmap(
-        z=retention_matrix.values,
-        x=retention_matrix.columns,
-        y=retention_matrix.index.astype(str),
-        colorscale='Purples',
-        text=retention_matrix.applymap(lambda x: f"{x:.0%}" if not pd.isna(x) else "").values,
-        texttemplate="%{text}",
-        xgap=2,
-        ygap=2,
-        colorbar=dict(title="Rétention %"),
-        hovertemplate="Cohorte: %{y}<br>M+%{x}<br>Rétention: %{z:.0%}<extra></extra>"
-    ))
+    fig_cohort, heatmap_info = retention_heatmap(retention_matrix, cohort_size)
     
     fig_cohort.update_layout(
         height=700,
@@ -70,18 +130,30 @@ if df is not None:
         yaxis_title="Cohorte",
         title_text="📊 Heatmap de Rétention par Cohorte d'Acquisition"
     )
+    fig_cohort = style_plot(fig_cohort)
     
-    st.plotly_chart(style_plot(fig_cohort), use_container_width=True)
+    st.plotly_chart(fig_cohort, use_container_width=True)
+    
+    # Taille du JSON envoyé : sérialisation complète de la figure, calculée en mode debug seulement
+    payload_text = ""
+    if st.session_state.get(TRACE_TOGGLE_KEY, False):
+        payload_text = f" · {figure_payload_bytes(fig_cohort) / 1024:,.0f} Ko envoyés"
+    if heatmap_info['row_factor'] > 1 or heatmap_info['col_factor'] > 1:
+        st.caption(
+            f"Affichage agrégé : {heatmap_info['cells']:,} cellules regroupées en {heatmap_info['displayed_cells']:,} "
+            f"(blocs de {heatmap_info['row_factor']} cohorte(s) × {heatmap_info['col_factor']} mois){payload_text}"
+        )
+    else:
+        st.caption(f"{heatmap_info['cells']:,} cellules{payload_text}")
 
     # ============ COURBES DE CA PAR ÂGE DE COHORTE ============
+    trace_section("COURBES DE CA PAR ÂGE DE COHORTE")
     st.markdown("---")
     st.markdown("###  Revenu CA par Âge de Cohorte (Densité)")
     
     # Calculer CA par cohorte et âge
-    df_ca = df[['Customer ID', 'InvoiceDate', 'TotalPrice']].copy()
-    df_ca['OrderMonth'] = df_ca['InvoiceDate'].dt.to_period('M')
-    df_ca['CohortMonth'] = df_ca.groupby('Customer ID')['InvoiceDate'].transform('min').dt.to_period('M')
-    df_ca['CohortAge'] = (df_ca['OrderMonth'] - df_ca['CohortMonth']).apply(lambda x: x.n)
+    df_ca = df[['Customer ID', 'MonthIndex', 'TotalPrice']].copy()
+    df_ca['CohortAge'] = df_ca['MonthIndex'] - cohort_month_index(df_ca)
     
     # CA par âge de cohorte (moyenné)
     ca_by_age = df_ca.groupby('CohortAge')['TotalPrice'].agg(['sum', 'mean', 'count']).reset_index()
@@ -112,18 +184,20 @@ if df is not None:
         """)
 
     # ============ COURBES DE RÉTENTION MOYENNE ============
+    trace_section("COURBES DE RÉTENTION MOYENNE")
     st.markdown("---")
     st.markdown("### 📈 Taux de Rétention Moyen par Période")
     
-    avg_retention = {}
-    for col in retention_matrix.columns:
-        if col <= 12:  # Jusqu'à M+12
-            avg_ret = retention_matrix[col].mean()
-            if not pd.isna(avg_ret):
-                avg_retention[f"M+{col}"] = avg_ret
+    active, cohort_month, last_month = customer_activity(df)
+    retention_curve = bootstrap_retention_curve(active, cohort_month, last_month)
     
-    if avg_retention:
-        df_avg = pd.DataFrame(list(avg_retention.items()), columns=['Période', 'Rétention Moyenne'])
+    if not retention_curve.empty:
+        df_avg = pd.DataFrame({
+            'Période': [f"M+{p}" for p in retention_curve.index],
+            'Rétention Moyenne': retention_curve['Rétention'].values,
+            'Borne Basse': retention_curve['Borne_Basse'].values,
+            'Borne Haute': retention_curve['Borne_Haute'].values
+        })
         
         fig_avg = px.line(
             df_avg,
@@ -133,9 +207,19 @@ if df is not None:
             line_shape='spline',
             color_discrete_sequence=['#4F46E5']
         )
+        fig_avg.update_traces(line=dict(width=3), marker=dict(size=8))
+        # Bande de confiance bootstrap (IC 95%)
+        fig_avg.add_trace(go.Scatter(
+            x=df_avg['Période'], y=df_avg['Borne Haute'],
+            mode='lines', line=dict(width=0), showlegend=False, hoverinfo='skip'
+        ))
+        fig_avg.add_trace(go.Scatter(
+            x=df_avg['Période'], y=df_avg['Borne Basse'],
+            mode='lines', line=dict(width=0), fill='tonexty',
+            fillcolor='rgba(79, 70, 229, 0.15)', name='IC 95% (bootstrap)', hoverinfo='skip'
+        ))
         fig_avg.update_yaxes(tickformat='.0%', title_text="Taux de Rétention")
         fig_avg.update_xaxes(title_text="Période")
-        fig_avg.update_traces(line=dict(width=3), marker=dict(size=8))
         
         st.plotly_chart(style_plot(fig_avg, "📈 Rétention Moyenne Toutes Cohortes"), use_container_width=True)
         
@@ -144,94 +228,36 @@ if df is not None:
         - Quelle est la pente du déclin de rétention (M+1 vs M+3 vs M+6)?
         - Y a-t-il un palier (stagnation du taux de départ)?
         - Est-ce que la rétention M+1 est inférieure à 40%? (Problème d'onboarding potentiel)
+        - **Bande violette** : intervalle de confiance à 95% (bootstrap sur les clients) ; elle s'élargit en fin de courbe où peu de cohortes sont observables
         """)
 
     # ============ FOCUS SUR UNE COHORTE ============
+    trace_section("FOCUS SUR UNE COHORTE")
     st.markdown("---")
     st.markdown("### 🔍 Analyse d'une Cohorte Spécifique")
     
-    cohorts_list = retention_matrix.index.astype(str).tolist()
-    selected_cohort = st.selectbox(
-        "Sélectionner une cohorte pour analyser",
-        options=cohorts_list,
-        index=len(cohorts_list) - 1 if len(cohorts_list) > 0 else 0,
-        help="Affiche la courbe de rétention d'une cohorte particulière"
-    )
-    
-    if selected_cohort in retention_matrix.index.astype(str).values:
-        cohort_retention = retention_matrix.loc[selected_cohort]
-        cohort_retention = cohort_retention.dropna()
-        
-        if not cohort_retention.empty:
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                st.metric(
-                    f"Taille de la Cohorte {selected_cohort}",
-                    f"{int(cohort_size.get(selected_cohort, 0)):,} clients",
-                    help="Nombre de clients acquis ce mois-là"
-                )
-            
-            with col2:
-                first_month_ret = cohort_retention.iloc[0] if len(cohort_retention) > 0 else 0
-                st.metric(
-                    "Rétention M+1",
-                    f"{first_month_ret:.0%}",
-                    help=f"% des {int(cohort_size.get(selected_cohort, 0)):,} clients qui ont acheté le mois suivant"
-                )
-        
-        # Graphique de la cohorte sélectionnée (EN DEHORS DES COLONNES)
-        if not cohort_retention.empty:
-            cohort_ret_df = pd.DataFrame({
-                'Période': [f"M+{i}" for i in cohort_retention.index],
-                'Rétention': cohort_retention.values
-            })
-            
-            fig_cohort_detail = px.bar(
-                cohort_ret_df,
-                x='Période',
-                y='Rétention',
-                color='Rétention',
-                color_continuous_scale='Greens',
-                text_auto='.0%'
-            )
-            fig_cohort_detail.update_yaxes(tickformat='.0%')
-            fig_cohort_detail.update_layout(height=400)
-            
-            st.plotly_chart(style_plot(fig_cohort_detail, f" Courbe de Rétention Cohorte {selected_cohort}"), 
-                           use_container_width=True)
-            
-            # Analyse textuelle
-            ret_m1 = f"{cohort_retention.iloc[0]:.0%}" if len(cohort_retention) > 0 else 'N/A'
-            ret_m3 = f"{cohort_retention.iloc[3]:.0%}" if len(cohort_retention) > 3 else 'N/A'
-            ret_m6 = f"{cohort_retention.iloc[6]:.0%}" if len(cohort_retention) > 6 else 'N/A'
-            
-            st.markdown(f"""**Analyse pour {selected_cohort}** :
-- Taille initiale : {int(cohort_size.get(selected_cohort, 0)):,} clients
-- Rétention M+1 : {ret_m1}
-- Rétention M+3 : {ret_m3}
-- Rétention M+6 : {ret_m6}""")
+    cohort_focus(retention_matrix, cohort_size)
 
     # ============ COMPARAISON PAR TYPE DE CLIENT ============
+    trace_section("COMPARAISON PAR TYPE DE CLIENT")
     st.markdown("---")
     st.markdown("###  Rétention par Type de Client (B2B vs B2C)")
     
     # Identifier type client selon quantité
     df['ClientType'] = df['Quantity'].apply(lambda x: 'B2B (Grossiste)' if abs(x) > 50 else 'B2C (Détail)')
     
-    df_c = df[['Customer ID', 'InvoiceDate', 'ClientType']].drop_duplicates()
-    df_c['OrderMonth'] = df_c['InvoiceDate'].dt.to_period('M')
-    df_c['CohortMonth'] = df_c.groupby('Customer ID')['InvoiceDate'].transform('min').dt.to_period('M')
+    df_c = df[['Customer ID', 'MonthIndex']].drop_duplicates()
+    df_c['CohortMonth'] = cohort_month_index(df_c)
+    df_c['PeriodNumber'] = df_c['MonthIndex'] - df_c['CohortMonth']
     
     # Type client dominant pour chaque client
     client_type_map = df.groupby('Customer ID')['ClientType'].agg(lambda x: x.value_counts().index[0]).reset_index()
     client_type_map.columns = ['Customer ID', 'PrimaryType']
     df_c = df_c.merge(client_type_map, on='Customer ID', how='left')
     
-    df_cohort_type = df_c.groupby(['CohortMonth', 'OrderMonth', 'PrimaryType']).agg(
+    df_cohort_type = df_c.groupby(['CohortMonth', 'PeriodNumber', 'PrimaryType']).agg(
         n_customers=('Customer ID', 'nunique')
     ).reset_index()
-    df_cohort_type['PeriodNumber'] = (df_cohort_type.OrderMonth - df_cohort_type.CohortMonth).apply(lambda x: x.n)
     
     retention_by_type = []
     for client_type in df_cohort_type['PrimaryType'].unique():
@@ -275,3 +301,5 @@ if df is not None:
         """)
     else:
         st.info("Pas assez de données pour analyser la rétention par type de client.")
+
+render_trace_panel()
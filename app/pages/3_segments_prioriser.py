@@ -5,18 +5,109 @@ import plotly.express as px
 import plotly.graph_objects as go
 import pandas as pd
 
-from utils.visualization import load_css, style_plot, add_export_button
-from utils.data_loader import sidebar_filters, date_range, selected_countries, return_mode
-from utils.rfm_calculator import compute_rfm
+from utils.visualization import load_css, style_plot, add_export_button, add_export_zip_button, show_table
+from utils.tracing import traced, trace_section, render_trace_panel
+from utils.data_loader import sidebar_filters, filter_state
+from utils.rfm_calculator import cached_rfm, segment_labels
+from utils.rfm_cube import MARGIN_RATE, build_rfm_cube, rollup_rfm_cube
+from utils.customer_table import build_customer_index, customer_explorer
+from utils.segment_rules import (
+    RULE_BOUNDS, load_segment_rules, save_segment_rules, reset_segment_rules,
+    rules_to_frame, frame_to_rules, segment_codes
+)
+
+
+@st.fragment
+@traced()
+def segment_detail(segment_stats):
+    """Détail d'un segment : seul ce bloc se ré-exécute quand le segment sélectionné change."""
+    # Permettre le tri par segment
+    selected_segment = st.selectbox(
+        "Sélectionner un segment pour voir les détails",
+        options=segment_stats.index,
+        index=0,
+        help="Affiche les KPIs détaillés du segment sélectionné"
+    )
+    
+    # Roll-up du cube RFM : aucune relecture des clients
+    segment = segment_stats.loc[selected_segment]
+    total_clients = segment_stats['Clients'].sum()
+    total_ca = segment_stats['Monetary_sum'].sum()
+    
+    # Afficher les métriques détaillées
+    col_s1, col_s2, col_s3 = st.columns(3)
+    col_s1.metric(" Clients", f"{int(segment['Clients']):,}", 
+                 help=f"{segment['Clients']/total_clients*100:.1f}% de la base")
+    col_s2.metric(" CA Total", f"{segment['Monetary_sum']:,.0f} £",
+                 help=f"Génère {segment['Monetary_sum']/total_ca*100:.1f}% du CA")
+    col_s3.metric(" Panier Moyen", f"{segment['Monetary_mean']:.1f} £",
+                 help=f"Valeur moyenne par client")
+    
+    # Ajouter d'autres métriques
+    col_s4, col_s5, col_s6 = st.columns(3)
+    col_s4.metric(" Récence Moy", f"{segment['Recency_mean']:.0f} j",
+                 help="Dernier achat moyen (jours)")
+    col_s5.metric(" Fréquence Moy", f"{segment['Frequency_mean']:.1f}",
+                 help="Nombre moyen d'achats")
+    col_s6.metric(" Marge Estimée", f"{segment['Margin_sum']:,.0f} £",
+                 help=f"Marge totale estimée ({MARGIN_RATE:.0%})")
+
+
+@st.fragment
+@traced()
+def customer_section(index, segments):
+    """Explorateur client : tri, recherche et pagination ne ré-exécutent que ce bloc."""
+    selected = st.multiselect("Segments affichés", segments, default=segments, key="rfm_customers_segments")
+    customer_explorer(index, "rfm_customers", selected)
+
+
+def segment_rules_editor(rules):
+    """Édition des règles de segmentation (ordre des lignes = priorité), enregistrées sur disque."""
+    st.caption(
+        "Bornes incluses sur les scores R, F, M (1 à 4) et FM = (F + M) / 2 ; case vide = sans limite. "
+        "La première règle qui correspond l'emporte, les clients non couverts vont dans « Autres »."
+    )
+    bound_columns = {
+        key: st.column_config.NumberColumn(key, min_value=1, max_value=4, step=0.5 if key.startswith("fm") else 1)
+        for key in RULE_BOUNDS
+    }
+    edited = st.data_editor(
+        rules_to_frame(rules),
+        num_rows="dynamic",
+        hide_index=True,
+        use_container_width=True,
+        column_config={
+            "name": st.column_config.TextColumn("Segment", required=True),
+            "code": st.column_config.TextColumn("Code RFM", max_chars=3),
+            **bound_columns
+        },
+        key="segment_rules_editor"
+    )
+    col_save, col_reset = st.columns(2)
+    if col_save.button("Enregistrer les règles", type="primary"):
+        try:
+            save_segment_rules(frame_to_rules(edited))
+        except ValueError as e:
+            st.error(str(e))
+        else:
+            st.rerun()
+    if col_reset.button("Réinitialiser (règles par défaut)"):
+        reset_segment_rules()
+        st.session_state.pop("segment_rules_editor", None)
+        st.rerun()
+
 
 load_css()
 df, analysis_date = sidebar_filters()
 
 if df is not None:
     st.title(" Segmentation & Priorisation RFM")
-    rfm_df = compute_rfm(df, analysis_date)
+    filter_key = filter_state()
+    segment_rules = load_segment_rules()
+    rfm_df = cached_rfm(df, filter_key, analysis_date, segment_rules)
 
     # ============ GUIDE DES SEGMENTS ============
+    trace_section("GUIDE DES SEGMENTS")
     with st.expander(" Comprendre les Segments RFM", expanded=False):
         st.markdown("""
         La segmentation RFM identifie 5 groupes de clients basés sur leurs comportements d'achat.
@@ -35,7 +126,11 @@ if df is not None:
         - **M (Montant)** : Total dépensé (4=haut montant, 1=bas montant)
         """)
 
+    with st.expander(" Règles de segmentation", expanded=False):
+        segment_rules_editor(segment_rules)
+
     # ============ TABLE RFM COMPLÈTE ============
+    trace_section("TABLE RFM COMPLÈTE")
     st.markdown("###  Table RFM Complète (Codes, Labels, Volumes, CA, Marge, Panier)")
     
     # Convertir les colonnes score en numériques (au cas où elles seraient catégories)
@@ -53,53 +148,35 @@ if df is not None:
         rfm_df['M_Score'].astype(int).astype(str)
     )
     
-    # Estimer marge (hypothèse: 25% de marge moyenne par transaction)
-    margin_rate = 0.25  # 25% marge hypothétique
-    rfm_df['Marge_Estimée'] = rfm_df['Monetary'] * margin_rate
+    # Table RFM détaillée : agrégat des 64 cellules (R, F, M), sans regrouper les clients
+    # (marge estimée = CA × MARGIN_RATE, hypothèse de 25% de marge moyenne)
+    rfm_cube = build_rfm_cube(rfm_df)
+    cell_segments = segment_labels(rfm_cube['R_Score'], rfm_cube['F_Score'], rfm_cube['M_Score'], segment_rules)
+    segment_stats = rollup_rfm_cube(rfm_cube, cell_segments)
+    rfm_table = segment_stats.reset_index()
+    rfm_table = rfm_table[['Segment', 'Clients', 'Monetary_sum', 'Monetary_mean', 'Margin_sum', 'Margin_mean',
+                           'Recency_mean', 'Frequency_mean', 'R_Avg', 'F_Avg', 'M_Avg']]
     
-    # Construire table RFM détaillée - SANS 'first' sur RFM_Code (qui est string)
-    rfm_table = rfm_df.groupby('Segment_Label').agg({
-        'CustomerID': 'count',
-        'Monetary': ['sum', 'mean'],
-        'Marge_Estimée': ['sum', 'mean'],
-        'Recency': 'mean',
-        'Frequency': 'mean',
-        'R_Score': 'mean',
-        'F_Score': 'mean',
-        'M_Score': 'mean'
-    }).reset_index()
-    
-    # Aplatir les colonnes multi-niveaux
+    # Colonnes de la table historique
     rfm_table.columns = ['Segment', 'Volume (Clients)', 'CA_Total', 'Panier_Moyen', 
                          'Marge_Total', 'Marge_Moyen', 'Récence_Moy', 'Fréquence_Moy',
                          'R_Avg', 'F_Avg', 'M_Avg']
     rfm_table = rfm_table.sort_values('CA_Total', ascending=False)
     
-    # Ajouter code RFM représentatif (ex: "444" pour Champions)
-    code_map = {
-        'Champions': '444',
-        'Loyaux Potentiels': '343',
-        'Nouveaux Prometteurs': '441',
-        'À Risque': '244',
-        'Hibernants': '111'
-    }
-    rfm_table['Code_RFM'] = rfm_table['Segment'].map(code_map).fillna('---')
+    # Ajouter code RFM représentatif (ex: "444" pour Champions), défini avec chaque règle
+    rfm_table['Code_RFM'] = rfm_table['Segment'].map(segment_codes(segment_rules)).fillna('---')
     
-    # Formater pour affichage
     rfm_table_display = rfm_table.copy()
-    rfm_table_display['Volume (Clients)'] = rfm_table_display['Volume (Clients)'].astype(int).apply(lambda x: f"{x:,}")
-    rfm_table_display['CA_Total'] = rfm_table_display['CA_Total'].apply(lambda x: f"£{x:,.0f}")
-    rfm_table_display['Panier_Moyen'] = rfm_table_display['Panier_Moyen'].apply(lambda x: f"£{x:.1f}")
-    rfm_table_display['Marge_Total'] = rfm_table_display['Marge_Total'].apply(lambda x: f"£{x:,.0f}")
-    rfm_table_display['Marge_Moyen'] = rfm_table_display['Marge_Moyen'].apply(lambda x: f"£{x:.1f}")
-    rfm_table_display['Récence_Moy'] = rfm_table_display['Récence_Moy'].apply(lambda x: f"{int(x)} j")
-    rfm_table_display['Fréquence_Moy'] = rfm_table_display['Fréquence_Moy'].apply(lambda x: f"{x:.1f}")
-    rfm_table_display['Priorité'] = [' CRITIQUE', ' HAUTE', ' MOYEN', ' BASSE', ' MINIMAL'][:len(rfm_table_display)]
+    priorities = [' CRITIQUE', ' HAUTE', ' MOYEN', ' BASSE']
+    rfm_table_display['Priorité'] = (priorities + [' MINIMAL'] * len(rfm_table_display))[:len(rfm_table_display)]
     
-    # Afficher table
+    # Afficher table (formats appliqués par le navigateur, colonnes numériques triables)
     display_cols = ['Segment', 'Code_RFM', 'Volume (Clients)', 'CA_Total', 'Panier_Moyen', 
                     'Marge_Total', 'Priorité']
-    st.dataframe(rfm_table_display[display_cols], use_container_width=True, hide_index=True)
+    show_table(
+        rfm_table_display[display_cols],
+        formats={'Volume (Clients)': 'int', 'CA_Total': 'gbp', 'Panier_Moyen': 'gbp_decimal', 'Marge_Total': 'gbp'}
+    )
     
     st.markdown("""
     **Légende** :
@@ -112,6 +189,7 @@ if df is not None:
     """)
 
     # ============ RÉSUMÉ PAR SEGMENT ============
+    trace_section("RÉSUMÉ PAR SEGMENT")
     st.markdown("---")
     st.markdown("###  Vue d'Ensemble des Segments")
     
@@ -126,15 +204,22 @@ if df is not None:
     # Ajouter le % du total
     summary['% Clients'] = (summary['Clients'] / summary['Clients'].sum() * 100).round(1)
     
-    # Formater pour affichage
-    display_summary = summary.copy()
-    display_summary['Clients'] = display_summary['Clients'].astype(int).apply(lambda x: f"{x:,}")
-    display_summary['CA Total'] = display_summary['CA Total'].apply(lambda x: f"{x:,.0f} £")
-    display_summary['Panier Moyen'] = display_summary['Panier Moyen'].apply(lambda x: f"{x:.1f} £")
-    display_summary['Récence_Moy'] = display_summary['Récence_Moy'].apply(lambda x: f"{int(x)} j")
-    display_summary['Fréquence_Moy'] = display_summary['Fréquence_Moy'].apply(lambda x: f"{x:.1f}")
-    
-    st.dataframe(display_summary, use_container_width=True, hide_index=True)
+    show_table(
+        summary,
+        formats={
+            'Clients': 'int',
+            'CA Total': 'gbp',
+            'Panier Moyen': 'gbp_decimal',
+            'Marge_Total': 'gbp',
+            'Marge_Moyen': 'gbp_decimal',
+            'Récence_Moy': 'days',
+            'Fréquence_Moy': 'decimal',
+            'R_Avg': 'decimal',
+            'F_Avg': 'decimal',
+            'M_Avg': 'decimal',
+            '% Clients': 'percent'
+        }
+    )
 
     st.markdown("###")
     
@@ -145,33 +230,7 @@ if df is not None:
     # Tableau de détail - EN HAUT
     st.markdown("####  Tableau de Détail par Segment")
     
-    # Permettre le tri par segment
-    selected_segment = st.selectbox(
-        "Sélectionner un segment pour voir les détails",
-        options=rfm_df['Segment_Label'].unique(),
-        index=0,
-        help="Affiche les KPIs détaillés du segment sélectionné"
-    )
-    
-    segment_data = rfm_df[rfm_df['Segment_Label'] == selected_segment]
-    
-    # Afficher les métriques détaillées
-    col_s1, col_s2, col_s3 = st.columns(3)
-    col_s1.metric(" Clients", f"{len(segment_data):,}", 
-                 help=f"{len(segment_data)/len(rfm_df)*100:.1f}% de la base")
-    col_s2.metric(" CA Total", f"{segment_data['Monetary'].sum():,.0f} £",
-                 help=f"Génère {segment_data['Monetary'].sum()/rfm_df['Monetary'].sum()*100:.1f}% du CA")
-    col_s3.metric(" Panier Moyen", f"{segment_data['Monetary'].mean():.1f} £",
-                 help=f"Valeur moyenne par client")
-    
-    # Ajouter d'autres métriques
-    col_s4, col_s5, col_s6 = st.columns(3)
-    col_s4.metric(" Récence Moy", f"{segment_data['Recency'].mean():.0f} j",
-                 help="Dernier achat moyen (jours)")
-    col_s5.metric(" Fréquence Moy", f"{segment_data['Frequency'].mean():.1f}",
-                 help="Nombre moyen d'achats")
-    col_s6.metric(" Marge Estimée", f"{segment_data['Marge_Estimée'].sum():,.0f} £",
-                 help="Marge totale estimée (25%)")
+    segment_detail(segment_stats)
     
     # Espacement
     st.markdown("###")
@@ -212,6 +271,7 @@ if df is not None:
     - **Haut-Droite (Critique)** : Hibernants - Anciens, basse valeur
     """)
     # ============ CLV PAR SEGMENT ============
+    trace_section("CLV PAR SEGMENT")
     st.markdown("---")
     st.markdown("###  Valeur & Potentiel par Segment")
     
@@ -253,7 +313,13 @@ if df is not None:
         fig_clv_total.update_yaxes(title_text="")
         st.plotly_chart(style_plot(fig_clv_total, " Contribution Totale au CA"), use_container_width=True)
 
+    add_export_zip_button(
+        {"matrice_valeur_risque": fig_scat, "clv_moyenne_segment": fig_clv, "contribution_ca_segment": fig_clv_total},
+        "segments_graphiques"
+    )
+
     # ============ ACTIONS RECOMMANDÉES ============
+    trace_section("ACTIONS RECOMMANDÉES")
     st.markdown("---")
     st.markdown("###  Plan d'Action Recommandé")
     
@@ -294,20 +360,30 @@ if df is not None:
             )
 
     # ============ STATISTIQUES DÉTAILLÉES ============
+    trace_section("STATISTIQUES DÉTAILLÉES")
     st.markdown("---")
     st.markdown("###  Statistiques Détaillées par Segment")
     
-    for segment in rfm_df['Segment_Label'].unique():
+    total_clients = segment_stats['Clients'].sum()
+    for segment, seg_stats in segment_stats.iterrows():
         with st.expander(f"Détails : {segment}"):
-            seg_data = rfm_df[rfm_df['Segment_Label'] == segment]
-            
             col1, col2, col3, col4 = st.columns(4)
-            col1.metric("Clients", f"{len(seg_data):,}")
-            col2.metric("CA Total", f"{seg_data['Monetary'].sum():,.0f} £")
-            col3.metric("Panier Moyen", f"{seg_data['Monetary'].mean():.1f} £")
-            col4.metric("Valeur Parc", f"{seg_data['Monetary'].sum():,.0f} £")
+            col1.metric("Clients", f"{int(seg_stats['Clients']):,}")
+            col2.metric("CA Total", f"{seg_stats['Monetary_sum']:,.0f} £")
+            col3.metric("Panier Moyen", f"{seg_stats['Monetary_mean']:.1f} £")
+            col4.metric("Valeur Parc", f"{seg_stats['Monetary_sum']:,.0f} £")
             
             col5, col6, col7 = st.columns(3)
-            col5.metric("Récence Moy", f"{seg_data['Recency'].mean():.0f} jours")
-            col6.metric("Fréquence Moy", f"{seg_data['Frequency'].mean():.1f} achats")
-            col7.metric("% du Total", f"{len(seg_data)/len(rfm_df)*100:.1f}%")
+            col5.metric("Récence Moy", f"{seg_stats['Recency_mean']:.0f} jours")
+            col6.metric("Fréquence Moy", f"{seg_stats['Frequency_mean']:.1f} achats")
+            col7.metric("% du Total", f"{seg_stats['Clients']/total_clients*100:.1f}%")
+
+    # ============ EXPLORATEUR CLIENTS ============
+    trace_section("EXPLORATEUR CLIENTS")
+    st.markdown("---")
+    st.markdown("###  Explorateur Clients")
+    st.caption("Tri, recherche et pagination côté serveur : seule la page affichée est envoyée au navigateur.")
+    customer_index = build_customer_index(rfm_df, filter_key, segment_rules)
+    customer_section(customer_index, customer_index['segments'])
+
+render_trace_panel()
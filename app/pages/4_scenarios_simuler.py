@@ -6,23 +6,171 @@ import plotly.graph_objects as go
 import plotly.express as px
 import pandas as pd
 
-from utils.visualization import load_css, style_plot
-from utils.data_loader import sidebar_filters
-from utils.rfm_calculator import compute_rfm
+from utils.visualization import load_css, style_plot, cached_figure, show_table
+from utils.tracing import traced, render_trace_panel
+from utils.data_loader import sidebar_filters, filter_state
+from utils.rfm_calculator import cached_rfm
+from utils.segment_rules import load_segment_rules
+from utils.kpi_calculator import compute_kpis
 from utils.kpi_helpers import get_kpi_help
+from utils.clv_engine import (
+    CLV_BASELINE, SURFACE_POINTS, CURVE_POINTS, clv_sweep,
+    segment_profiles, scenario_unit_clv, customer_scenario_matrix, scenario_rollup
+)
+from utils.clv_models import CLV_HORIZON_MONTHS, fit_clv_models, predict_clv
+from utils.monte_carlo import MC_DEFAULT_PATHS, MC_PATH_OPTIONS, MC_RETENTION_CONCENTRATION, simulate_clv
 
-load_css()
-df, analysis_date = sidebar_filters()
+# Clients affichés dans le classement des gains par client
+TOP_CUSTOMERS = 20
 
-if df is not None:
-    st.title(" Simulateur d'Impact Business")
-    rfm_df = compute_rfm(df, analysis_date)
+def build_clv_surface(avg_spend, discount_rate):
+    """Surface de sensibilité CLV (marge × rétention), mise en cache par cached_figure."""
+    sweep = clv_sweep(avg_spend, (0.1, 0.4, SURFACE_POINTS), (0.3, 0.9, SURFACE_POINTS), discount_rate)
+    
+    fig_3d = go.Figure(data=[go.Surface(
+        z=sweep["clv"][:, :, 0],
+        x=sweep["retention"],
+        y=sweep["margin"],
+        colorscale='Purples',
+        colorbar=dict(title="CLV (£)")
+    )])
+    fig_3d.update_layout(
+        scene=dict(
+            xaxis_title='Rétention (r)',
+            yaxis_title='Marge (%)',
+            zaxis_title='CLV (£)',
+            xaxis=dict(backgroundcolor="rgb(240, 240, 240)", gridcolor="white"),
+            yaxis=dict(backgroundcolor="rgb(240, 240, 240)", gridcolor="white"),
+            zaxis=dict(backgroundcolor="rgb(240, 240, 240)", gridcolor="white")
+        ),
+        height=600,
+        title_text=" Surface de Sensibilité CLV"
+    )
+    return fig_3d
 
-    st.markdown("""
-    Ajustez les paramètres ci-dessous pour simuler l'impact sur la **CLV**, le **CA** et la **Rétention**.
-    Cette analyse aide à **prioriser les investissements marketing** et **quantifier le ROI** des initiatives.
-    """)
 
+@st.fragment
+@traced()
+def roi_block(clv_sim, clv_baseline, nb_clients, mc_result=None):
+    """Calcul du ROI : les saisies coût / clients affectés ne ré-exécutent que ce bloc."""
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        initiative_cost = st.number_input(
+            " Coût de l'initiative (£)",
+            min_value=0.0,
+            value=5000.0,
+            step=100.0,
+            help="Budget marketing pour une campagne de rétention / acquisition"
+        )
+    
+    with col2:
+        affected_customers = st.number_input(
+            " Clients affectés",
+            min_value=0,
+            value=int(nb_clients / 10),
+            step=100,
+            help="Nombre de clients atteints par cette initiative"
+        )
+    
+    if affected_customers > 0:
+        value_created = (clv_sim - clv_baseline) * affected_customers
+        roi = ((value_created - initiative_cost) / initiative_cost * 100) if initiative_cost > 0 else 0
+        
+        col1, col2, col3 = st.columns(3)
+        col1.metric(" Valeur Créée", f"{value_created:,.0f} £")
+        col2.metric(" ROI", f"{roi:+.1f}%", delta_color="normal" if roi >= 0 else "inverse")
+        col3.metric(" Payback", f"{initiative_cost / (value_created / 365) if value_created > 0 else float('inf'):.0f} jours")
+        
+        if roi >= 0:
+            st.success(f" Initiative rentable ! ROI positif de {roi:.1f}%")
+        else:
+            st.error(f" Initiative non rentable. ROI négatif de {roi:.1f}%")
+
+        if mc_result is not None and initiative_cost > 0:
+            # Le bruit individuel se compense sur les clients affectés : le risque de l'initiative
+            # vient de l'incertitude sur la rétention (percentiles de la CLV espérée)
+            st.markdown("**Distribution Monte Carlo du ROI** (incertitude sur la rétention) :")
+            cols = st.columns(len(mc_result['expected_clv']))
+            for col, (pct, expected) in zip(cols, mc_result['expected_clv'].items()):
+                value_pct = (expected - clv_baseline) * affected_customers
+                roi_pct = (value_pct - initiative_cost) / initiative_cost * 100
+                payback = f"{initiative_cost / (value_pct / 365):.0f} j" if value_pct > 0 else "jamais"
+                col.metric(f" ROI P{pct}", f"{roi_pct:+.1f}%", help=f"Valeur créée {value_pct:,.0f} £, payback {payback}")
+
+
+@st.fragment
+@traced()
+def customer_simulation(rfm_df, profiles, scenarios):
+    """Simulation par client : l'édition des scénarios ne ré-exécute que ce bloc."""
+    edited = st.data_editor(
+        pd.DataFrame(scenarios, columns=["name", "margin", "retention", "discount"]),
+        num_rows="dynamic",
+        hide_index=True,
+        use_container_width=True,
+        column_config={
+            "name": st.column_config.TextColumn("Scénario", required=True),
+            "margin": st.column_config.NumberColumn("Marge", min_value=0.0, max_value=1.0, step=0.01, format="%.2f"),
+            "retention": st.column_config.NumberColumn("Rétention", min_value=0.0, max_value=0.95, step=0.01, format="%.2f"),
+            "discount": st.column_config.NumberColumn("Actualisation", min_value=0.0, max_value=1.0, step=0.01, format="%.2f")
+        },
+        key="customer_scenarios"
+    ).dropna()
+    names = edited["name"].astype(str).str.strip()
+    if edited.empty:
+        st.info("Ajoutez au moins un scénario.")
+        return
+    if names.duplicated().any():
+        st.warning("Chaque scénario doit avoir un nom unique.")
+        return
+
+    unit_clv = scenario_unit_clv(profiles, edited.to_dict("records"))
+    rollup = scenario_rollup(profiles, unit_clv, names)
+
+    # Roll-up par segment : panier total du segment × CLV unitaire (aucune relecture des clients)
+    rollup_table = rollup.copy()
+    rollup_table.loc["Total"] = rollup_table.sum()
+    rollup_table.insert(0, "Rétention empirique", list(profiles["Retention"] * 100) + [np.nan])
+    rollup_table.insert(0, "Clients", list(profiles["Clients"]) + [profiles["Clients"].sum()])
+    show_table(
+        rollup_table.reset_index(),
+        formats={"Clients": "int", "Rétention empirique": "percent", **{name: "gbp" for name in names}}
+    )
+
+    fig_rollup = go.Figure([
+        go.Bar(x=rollup.index, y=rollup[name], name=name) for name in names
+    ])
+    fig_rollup.update_layout(barmode="group", xaxis_title="Segment", yaxis_title="Valeur du parc (£)")
+    st.plotly_chart(style_plot(fig_rollup, " Valeur du Parc par Segment et Scénario"), use_container_width=True)
+
+    if len(names) < 2:
+        return
+
+    # Matrice clients × scénarios : gains individuels face au premier scénario (référence)
+    target = st.selectbox(f"Clients qui gagnent le plus face à « {names.iloc[0]} »", names.iloc[1:])
+    segment_codes = pd.Categorical(rfm_df["Segment_Label"], categories=profiles.index).codes
+    matrix = customer_scenario_matrix(rfm_df["Monetary"].to_numpy(), segment_codes, unit_clv)
+    gain = matrix[:, names.tolist().index(target)] - matrix[:, 0]
+    top = np.argpartition(-gain, min(TOP_CUSTOMERS, len(gain)) - 1)[:TOP_CUSTOMERS]
+    top = top[np.argsort(-gain[top])]
+    show_table(
+        pd.DataFrame({
+            "Customer ID": rfm_df["CustomerID"].to_numpy()[top],
+            "Segment": rfm_df["Segment_Label"].to_numpy()[top],
+            "Panier (£)": rfm_df["Monetary"].to_numpy()[top],
+            f"CLV {names.iloc[0]}": matrix[top, 0],
+            f"CLV {target}": matrix[top, names.tolist().index(target)],
+            "Gain (£)": gain[top]
+        }),
+        formats={"Panier (£)": "gbp", f"CLV {names.iloc[0]}": "gbp_decimal", f"CLV {target}": "gbp_decimal", "Gain (£)": "gbp_decimal"}
+    )
+    st.caption(f"Matrice {matrix.shape[0]:,} clients × {matrix.shape[1]} scénarios ({matrix.nbytes / 2 ** 20:.1f} Mo).")
+
+
+@st.fragment
+@traced()
+def simulation(rfm_df, filter_key, nb_clients, profiles):
+    """Paramètres, graphiques et scénarios : les curseurs ne relancent ni les filtres ni le calcul RFM."""
     # ============ PARAMÈTRES DE SIMULATION ============
     st.markdown("###  Paramètres de Simulation")
     
@@ -62,15 +210,23 @@ if df is not None:
     avg_spend = rfm_df['Monetary'].mean()
     
     # CLV Baseline (défaut: marge 20%, rétention 60%, d=10%)
-    baseline_margin = 0.20
-    baseline_retention = 0.60
-    baseline_discount = 0.10
+    baseline_margin = CLV_BASELINE["margin"]
+    baseline_retention = CLV_BASELINE["retention"]
+    baseline_discount = CLV_BASELINE["discount"]
     
-    denom_baseline = (1 + baseline_discount - baseline_retention)
-    denom_sim = (1 + discount_rate - sim_retention)
+    # Baseline, simulation et scénarios pré-définis : un seul balayage de points appariés
+    scenarios = {
+        "Optimiste (+10% rétention)": {"retention": baseline_retention + 0.10, "margin": baseline_margin, "name": "Optimiste"},
+        "Agressif (+10% marge)": {"retention": baseline_retention, "margin": baseline_margin + 0.10, "name": "Agressif"},
+        "Conservateur (-5% retours)": {"retention": baseline_retention - 0.05, "margin": baseline_margin, "name": "Conservateur"},
+    }
+    point_margins = (baseline_margin, sim_margin, *(params["margin"] for params in scenarios.values()))
+    point_retentions = (baseline_retention, sim_retention, *(params["retention"] for params in scenarios.values()))
+    point_discounts = (baseline_discount, discount_rate, *[discount_rate] * len(scenarios))
+    # CLV par £ de panier : le panier (moyen ou par segment) s'applique ensuite par simple produit
+    unit_clv = clv_sweep(1.0, point_margins, point_retentions, point_discounts, grid=False)["clv"]
     
-    clv_baseline = (avg_spend * baseline_margin * baseline_retention) / denom_baseline if denom_baseline != 0 else 0
-    clv_sim = (avg_spend * sim_margin * sim_retention) / denom_sim if denom_sim != 0 else 0
+    clv_baseline, clv_sim = avg_spend * unit_clv[0], avg_spend * unit_clv[1]
     
     delta_clv = clv_sim - clv_baseline
     delta_clv_pct = (delta_clv / clv_baseline * 100) if clv_baseline != 0 else 0
@@ -98,13 +254,13 @@ if df is not None:
     with col3:
         st.metric(
             " Parc Client",
-            f"{df['Customer ID'].nunique():,}",
+            f"{nb_clients:,}",
             help="Nombre de clients actifs dans la période"
         )
     
     with col4:
-        total_value_scenario = clv_sim * df['Customer ID'].nunique()
-        total_value_baseline = clv_baseline * df['Customer ID'].nunique()
+        total_value_scenario = clv_sim * nb_clients
+        total_value_baseline = clv_baseline * nb_clients
         delta_value = total_value_scenario - total_value_baseline
         
         st.metric(
@@ -144,8 +300,8 @@ if df is not None:
         # Impact par segment
         avg_spend_by_seg = rfm_df.groupby('Segment_Label')['Monetary'].mean().reset_index()
         avg_spend_by_seg.columns = ['Segment', 'CA Historique']
-        avg_spend_by_seg['CLV Baseline'] = (avg_spend_by_seg['CA Historique'] * baseline_margin * baseline_retention) / denom_baseline
-        avg_spend_by_seg['CLV Simulation'] = (avg_spend_by_seg['CA Historique'] * sim_margin * sim_retention) / denom_sim
+        avg_spend_by_seg['CLV Baseline'] = avg_spend_by_seg['CA Historique'] * unit_clv[0]
+        avg_spend_by_seg['CLV Simulation'] = avg_spend_by_seg['CA Historique'] * unit_clv[1]
         
         fig_seg = go.Figure()
         fig_seg.add_trace(go.Bar(
@@ -174,47 +330,16 @@ if df is not None:
     """)
 
     # Surface 3D
-    r_range = np.linspace(0.3, 0.9, 15)
-    m_range = np.linspace(0.1, 0.4, 15)
-    z = [[
-        (avg_spend * m * r) / (1 + discount_rate - r) if (1 + discount_rate - r) != 0 else 0
-        for r in r_range
-    ] for m in m_range]
-    
-    fig_3d = go.Figure(data=[go.Surface(
-        z=z,
-        x=r_range,
-        y=m_range,
-        colorscale='Purples',
-        colorbar=dict(title="CLV (£)")
-    )])
-    fig_3d.update_layout(
-        scene=dict(
-            xaxis_title='Rétention (r)',
-            yaxis_title='Marge (%)',
-            zaxis_title='CLV (£)',
-            xaxis=dict(backgroundcolor="rgb(240, 240, 240)", gridcolor="white"),
-            yaxis=dict(backgroundcolor="rgb(240, 240, 240)", gridcolor="white"),
-            zaxis=dict(backgroundcolor="rgb(240, 240, 240)", gridcolor="white")
-        ),
-        height=600,
-        title_text=" Surface de Sensibilité CLV"
-    )
-    
-    st.plotly_chart(fig_3d, use_container_width=True)
+    st.plotly_chart(cached_figure(build_clv_surface, avg_spend, discount_rate), use_container_width=True)
 
     # Courbe 2D : CLV en fonction de la rétention pour une marge fixée (marge simulée)
-    clv_vs_r = []
-    for r in r_range:
-        denom_r = (1 + discount_rate - r)
-        clv_r = (avg_spend * sim_margin * r) / denom_r if denom_r != 0 else 0
-        clv_vs_r.append(clv_r)
+    curve = clv_sweep(avg_spend, sim_margin, (0.3, 0.9, CURVE_POINTS), discount_rate)
 
     fig_line = go.Figure()
     fig_line.add_trace(go.Scatter(
-        x=r_range,
-        y=clv_vs_r,
-        mode='lines+markers',
+        x=curve["retention"],
+        y=curve["clv"][0, :, 0],
+        mode='lines',
         name='CLV vs Rétention',
         line=dict(color='#4F46E5')
     ))
@@ -236,16 +361,9 @@ if df is not None:
     st.markdown("---")
     st.markdown("###  Scénarios Pré-définis")
     
-    scenarios = {
-        "Optimiste (+10% rétention)": {"retention": baseline_retention + 0.10, "margin": baseline_margin, "name": "Optimiste"},
-        "Agressif (+10% marge)": {"retention": baseline_retention, "margin": baseline_margin + 0.10, "name": "Agressif"},
-        "Conservateur (-5% retours)": {"retention": baseline_retention - 0.05, "margin": baseline_margin, "name": "Conservateur"},
-    }
-    
     scenario_results = []
-    for scenario_name, params in scenarios.items():
-        denom_sc = (1 + discount_rate - params["retention"])
-        clv_sc = (avg_spend * params["margin"] * params["retention"]) / denom_sc if denom_sc != 0 else 0
+    for params, unit in zip(scenarios.values(), unit_clv[2:]):
+        clv_sc = avg_spend * unit
         scenario_results.append({
             "Scénario": params["name"],
             "CLV": clv_sc,
@@ -269,42 +387,123 @@ if df is not None:
                 delta_color=delta_color
             )
 
-    # ============ IMPACT ROI ============
+    # ============ SIMULATION PAR CLIENT ============
     st.markdown("---")
-    st.markdown("###  Calul du ROI")
-    
-    st.write("**Exemple de ROI pour une initiative** :")
-    
-    col1, col2 = st.columns(2)
+    st.markdown("###  Simulation par Client (toute la base)")
+    st.markdown("""
+    Chaque scénario est évalué **client par client** : panier du client, marge du scénario et rétention
+    **propre à son segment** (part de clients ayant racheté, décalée de l'écart du scénario à la rétention de référence).
+    La première ligne sert de référence pour le classement des gains.
+    """)
+    customer_scenarios = [
+        {"name": "Baseline", **CLV_BASELINE},
+        {"name": "Simulation", "margin": sim_margin, "retention": sim_retention, "discount": discount_rate},
+        *({"name": params["name"], "margin": params["margin"], "retention": params["retention"], "discount": discount_rate}
+          for params in scenarios.values())
+    ]
+    customer_simulation(rfm_df, profiles, customer_scenarios)
+
+    # ============ CLV PROBABILISTE ============
+    st.markdown("---")
+    st.markdown("###  CLV Probabiliste par Client (BG/NBD + Gamma-Gamma)")
     
-    with col1:
-        initiative_cost = st.number_input(
-            " Coût de l'initiative (£)",
-            min_value=0.0,
-            value=5000.0,
-            step=100.0,
-            help="Budget marketing pour une campagne de rétention / acquisition"
+    if st.toggle("Activer les modèles probabilistes", key="probabilistic_clv",
+                 help="Prédit la CLV de chaque client à partir de son historique (fréquence, récence, ancienneté, panier)"):
+        horizon = st.slider("Horizon de prédiction (mois)", min_value=3, max_value=36, value=CLV_HORIZON_MONTHS, step=3)
+        models = fit_clv_models(rfm_df, filter_key)
+        predictions = predict_clv(models, rfm_df, sim_margin, discount_rate, horizon)
+        
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric(" CLV Prédite Moyenne", f"{predictions['CLV'].mean():,.2f} £",
+                    delta=f"{predictions['CLV'].mean() - clv_sim:+.2f} £ vs formule", delta_color="off")
+        col2.metric(" Valeur Parc Prédite", f"{predictions['CLV'].sum():,.0f} £")
+        col3.metric(" P(actif) Moyenne", f"{predictions['P_Alive'].mean():.1%}")
+        col4.metric(" Achats Attendus", f"{predictions['Expected_Purchases'].sum():,.0f}",
+                    help=f"Sur {horizon} mois, tous clients confondus")
+        
+        by_segment = predictions.groupby('Segment_Label')[['CLV', 'P_Alive']].mean()
+        fig_models = go.Figure([
+            go.Bar(x=avg_spend_by_seg['Segment'], y=avg_spend_by_seg['CLV Simulation'], name='Formule fermée',
+                   marker_color='#94A3B8'),
+            go.Bar(x=by_segment.index, y=by_segment['CLV'], name='BG/NBD + Gamma-Gamma', marker_color='#4F46E5')
+        ])
+        fig_models.update_layout(barmode='group', xaxis_title="Segment", yaxis_title="CLV moyenne (£)")
+        st.plotly_chart(style_plot(fig_models, " CLV Moyenne par Segment : Formule vs Modèles"), use_container_width=True)
+        
+        top = predictions.nlargest(TOP_CUSTOMERS, 'CLV')
+        show_table(
+            top.rename(columns={'CustomerID': 'Customer ID', 'Segment_Label': 'Segment', 'P_Alive': 'P(actif) %',
+                                'Expected_Purchases': 'Achats attendus', 'Expected_Spend': 'Panier attendu',
+                                'CLV': 'CLV prédite'}).assign(**{'P(actif) %': top['P_Alive'] * 100}),
+            formats={'P(actif) %': 'percent', 'Achats attendus': 'decimal_2', 'Panier attendu': 'gbp', 'CLV prédite': 'gbp_decimal'}
         )
-    
-    with col2:
-        affected_customers = st.number_input(
-            " Clients affectés",
-            min_value=0,
-            value=int(df['Customer ID'].nunique() / 10),
-            step=100,
-            help="Nombre de clients atteints par cette initiative"
+        bgnbd, gamma_gamma = models['bgnbd'], models['gamma_gamma']
+        st.caption(
+            f"BG/NBD : r={bgnbd['r']:.3g}, α={bgnbd['alpha']:.3g}, a={bgnbd['a']:.3g}, b={bgnbd['b']:.3g} ; "
+            f"Gamma-Gamma : p={gamma_gamma['p']:.3g}, q={gamma_gamma['q']:.3g}, v={gamma_gamma['v']:.3g}. "
+            f"Ajustés sur {models['n_tuples']:,} triplets (fréquence, récence, ancienneté) distincts pour "
+            f"{models['n_customers']:,} clients ; marge et actualisation du scénario simulé."
         )
+
+    # ============ MONTE CARLO ============
+    st.markdown("---")
+    st.markdown("###  Distribution Monte Carlo (Scénario simulé)")
     
-    if affected_customers > 0:
-        value_created = (clv_sim - clv_baseline) * affected_customers
-        roi = ((value_created - initiative_cost) / initiative_cost * 100) if initiative_cost > 0 else 0
+    mc_result = None
+    if st.toggle("Activer le mode Monte Carlo", key="mc_enabled",
+                 help="Simule des trajectoires client (survie, panier) pour mesurer le risque autour de la CLV et du ROI"):
+        col1, col2 = st.columns(2)
+        n_paths = col1.select_slider("Trajectoires simulées", options=MC_PATH_OPTIONS, value=MC_DEFAULT_PATHS,
+                                     format_func=lambda n: f"{n:,}")
+        seed = col2.number_input("Graine", min_value=0, value=0, step=1, help="Même graine = mêmes résultats")
         
-        col1, col2, col3 = st.columns(3)
-        col1.metric(" Valeur Créée", f"{value_created:,.0f} £")
-        col2.metric(" ROI", f"{roi:+.1f}%", delta_color="normal" if roi >= 0 else "inverse")
-        col3.metric(" Payback", f"{initiative_cost / (value_created / 365) if value_created > 0 else float('inf'):.0f} jours")
+        spend = rfm_df['Monetary']
+        spend_cv = float(spend.std() / spend.mean()) if len(spend) > 1 and spend.mean() > 0 else 0.0
+        with st.spinner("Simulation Monte Carlo..."):
+            mc_result = simulate_clv(float(avg_spend), spend_cv, sim_margin, sim_retention, discount_rate,
+                                     n_paths, int(seed))
         
-        if roi >= 0:
-            st.success(f" Initiative rentable ! ROI positif de {roi:.1f}%")
-        else:
-            st.error(f" Initiative non rentable. ROI négatif de {roi:.1f}%")
+        col1, col2, col3, col4 = st.columns(4)
+        for col, (pct, value) in zip((col1, col2, col3), mc_result['clv'].items()):
+            col.metric(f" CLV P{pct}", f"{value:,.2f} £")
+        col4.metric(" CLV Moyenne", f"{mc_result['clv_mean']:,.2f} £", delta=f"{mc_result['clv_mean'] - clv_sim:+.2f} £ vs formule",
+                    delta_color="off")
+        
+        counts, edges = mc_result['histogram']
+        fig_mc = go.Figure(go.Bar(x=(edges[:-1] + edges[1:]) / 2, y=counts, marker_color='#4F46E5'))
+        fig_mc.update_layout(xaxis_title="CLV (£)", yaxis_title="Trajectoires", bargap=0.02)
+        st.plotly_chart(style_plot(fig_mc, " Distribution de la CLV individuelle"), use_container_width=True)
+        st.caption(
+            f"{mc_result['n_paths']:,} trajectoires : rétention tirée selon une loi Beta (concentration "
+            f"{MC_RETENTION_CONCENTRATION}), panier Gamma (CV {spend_cv:.2f}), durée de vie géométrique. "
+            "Histogramme tronqué au P99.5."
+        )
+
+    # ============ IMPACT ROI ============
+    st.markdown("---")
+    st.markdown("###  Calul du ROI")
+    
+    st.write("**Exemple de ROI pour une initiative** :")
+    
+    roi_block(clv_sim, clv_baseline, nb_clients, mc_result)
+
+
+load_css()
+df, analysis_date = sidebar_filters()
+
+if df is not None:
+    st.title(" Simulateur d'Impact Business")
+    filter_key = filter_state()
+    segment_rules = load_segment_rules()
+    rfm_df = cached_rfm(df, filter_key, analysis_date, segment_rules)
+    nb_clients = compute_kpis(df, filter_key)['n_customers']
+
+    st.markdown("""
+    Ajustez les paramètres ci-dessous pour simuler l'impact sur la **CLV**, le **CA** et la **Rétention**.
+    Cette analyse aide à **prioriser les investissements marketing** et **quantifier le ROI** des initiatives.
+    """)
+
+    profiles = segment_profiles(rfm_df, filter_key, segment_rules)
+    simulation(rfm_df, filter_key, nb_clients, profiles)
+
+render_trace_panel()
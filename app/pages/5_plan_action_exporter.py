@@ -5,21 +5,26 @@ import pandas as pd
 from datetime import datetime
 
 from utils.visualization import load_css
-from utils.data_loader import sidebar_filters, date_range, selected_countries, return_mode
-from utils.rfm_calculator import compute_rfm
+from utils.tracing import traced, render_trace_panel
+from utils.data_loader import sidebar_filters, active_filters
+from utils.rfm_calculator import cached_rfm
+from utils.segment_rules import load_segment_rules
+from utils.customer_table import build_customer_index, customer_explorer
+from utils.exports import (
+    BUNDLE_FORMATS, CSV_COMPRESSIONS, XLSX_AVAILABLE, XLSX_MIME,
+    match_segments, bundle_download, csv_download, xlsx_download
+)
 
-load_css()
-df, analysis_date = sidebar_filters()
-
-if df is not None:
-    st.title(" Plan d'Action & Exports")
-    rfm_df = compute_rfm(df, analysis_date)
 
-    st.markdown("""
-    Cette page vous permet de **créer des listes activables** pour vos outils CRM, d'emailing ou d'automation.
-    Chaque export inclut les **CustomerID**, **segment RFM**, et **métriques clés** pour piloter vos campagnes.
-    """)
+@st.fragment
+@traced()
+def export_panel(rfm_df, customer_index, filters):
+    """
+    Sélection des segments, aperçu et exports : les boutons et la sélection ne ré-exécutent que ce bloc
 
+    Les filtres (et leur clé de cache) sont ceux de l'exécution complète qui a
+    produit rfm_df : une ré-exécution du fragment seul ne repasse pas par sidebar_filters.
+    """
     # ============ SÉLECTION DES SEGMENTS ============
     st.markdown("###  Sélectionner les Segments à Exporter")
     
@@ -30,11 +35,11 @@ if df is not None:
     
     with col1:
         if st.button(" Champions", key="btn_champs"):
-            st.session_state.selected_segs = ['Champions ']
+            st.session_state.selected_segs = match_segments(all_segments, ['Champions'])
     
     with col2:
         if st.button(" À Risque", key="btn_risk"):
-            st.session_state.selected_segs = ['À Risque ']
+            st.session_state.selected_segs = match_segments(all_segments, ['À Risque'])
     
     with col3:
         if st.button("✅ Tous", key="btn_all"):
@@ -44,7 +49,7 @@ if df is not None:
     target_segs = st.multiselect(
         "Ou sélectionner manuellement",
         options=all_segments,
-        default=['Champions ', 'À Risque '] if 'selected_segs' not in st.session_state else st.session_state.get('selected_segs', []),
+        default=match_segments(all_segments, st.session_state.get('selected_segs', ['Champions', 'À Risque'])),
         help="Choisissez un ou plusieurs segments pour exporter les listes"
     )
 
@@ -85,22 +90,8 @@ if df is not None:
         st.markdown("---")
         st.markdown("###  Prévisualisation des Données")
         
-        # Préparer les colonnes pour l'export
-        export_display = export_df[[
-            'CustomerID', 'Segment_Label', 'Monetary', 'Frequency', 'Recency', 'R_Score', 'F_Score', 'M_Score'
-        ]].copy()
-        export_display.columns = ['Customer ID', 'Segment', 'CLV (£)', 'Fréquence', 'Récence (j)', 'R Score', 'F Score', 'M Score']
-        
-        # Formater pour affichage
-        display_cols = export_display.head(20).copy()
-        display_cols['CLV (£)'] = display_cols['CLV (£)'].apply(lambda x: f"{x:.1f}")
-        display_cols['Fréquence'] = display_cols['Fréquence'].apply(lambda x: f"{int(x)}")
-        display_cols['Récence (j)'] = display_cols['Récence (j)'].apply(lambda x: f"{int(x)}")
-        
-        st.dataframe(display_cols, use_container_width=True, hide_index=True)
-        
-        if len(export_df) > 20:
-            st.caption(f"Affichage des 20 premiers clients. Total : {len(export_df):,} clients")
+        # Table paginée côté serveur (index partagé, seule la page visible est envoyée)
+        customer_explorer(customer_index, "export_customers", target_segs)
         
                 # ============ VUE GRAPHIQUE EXPORTABLE ============
         st.markdown("---")
@@ -139,44 +130,49 @@ if df is not None:
         st.markdown("---")
         st.markdown("###  Téléchargements")
         
-        # CSV Export
-        csv_data = export_display.to_csv(index=False).encode('utf-8')
+        # CSV Export (produit par blocs, uniquement au clic)
+        compression = st.radio(
+            "Compression du CSV",
+            options=list(CSV_COMPRESSIONS),
+            horizontal=True,
+            key="csv_compression",
+            help="gzip / zstd : fichier bien plus léger pour les grandes listes (décompressé par la plupart des CRM)"
+        )
+        extension, mime = CSV_COMPRESSIONS[compression]
         st.download_button(
             label="📄 Télécharger CSV (Liste Complète)",
-            data=csv_data,
-            file_name=f"CRM_Export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-            mime="text/csv",
+            data=csv_download(export_df, compression),
+            file_name=f"CRM_Export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}",
+            mime=mime,
             help="Fichier à importer dans votre CRM ou outil d'emailing (Mailchimp, Sendinblue, etc.)"
         )
         
-        # Excel Export (si openpyxl disponible)
-        try:
-            import openpyxl
-            from openpyxl.utils import get_column_letter
-            
-            # Créer un fichier Excel avec styles
-            from io import BytesIO
-            
-            excel_buffer = BytesIO()
-            with pd.ExcelWriter(excel_buffer, engine='openpyxl') as writer:
-                export_display.to_excel(writer, index=False, sheet_name='Clients')
-                
-                # Format des colonnes
-                workbook = writer.book
-                worksheet = writer.sheets['Clients']
-                for idx, column in enumerate(export_display.columns, 1):
-                    worksheet.column_dimensions[get_column_letter(idx)].width = 18
-            
-            excel_buffer.seek(0)
+        # Excel Export (si openpyxl disponible) : classeur en écriture seule, construit au clic
+        if XLSX_AVAILABLE:
             st.download_button(
                 label=" Télécharger Excel",
-                data=excel_buffer.getvalue(),
+                data=xlsx_download(export_df, filters['key'], load_segment_rules(), target_segs),
                 file_name=f"CRM_Export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
-                mime="application/vnd.ms-excel"
+                mime=XLSX_MIME
             )
-        except ImportError:
+        else:
             st.info("Excel non disponible. Utilisez le CSV.")
 
+        # Lot ZIP : un fichier par segment, construit depuis le RFM en cache
+        bundle_format = st.radio(
+            "Format du lot par segment",
+            options=list(BUNDLE_FORMATS),
+            horizontal=True,
+            key="bundle_format",
+            help="Une archive ZIP contenant un fichier par segment sélectionné (Parquet : outils data / BI)"
+        )
+        st.download_button(
+            label="🗂️ Télécharger le lot par segment (ZIP)",
+            data=bundle_download(export_df, filters['key'], load_segment_rules(), target_segs, bundle_format),
+            file_name=f"CRM_Segments_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip",
+            mime="application/zip"
+        )
+
         # ============ GUIDES D'UTILISATION ============
         st.markdown("---")
         st.markdown("###  Guides d'Utilisation par Segment")
@@ -254,6 +250,7 @@ if df is not None:
         st.markdown("###  Contexte de l'Export")
         
         # Formater les filtres avec valeurs par défaut
+        date_range, selected_countries, return_mode = filters['date_range'], filters['countries'], filters['return_mode']
         periode_text = f"{date_range[0].strftime('%d/%m/%Y')} → {date_range[1].strftime('%d/%m/%Y')}" if date_range else "Toute période"
         pays_text = ', '.join(selected_countries) if selected_countries else "Tous les pays"
         retours_text = 'Exclus' if return_mode == 'Exclure les retours' else ('Uniquement' if return_mode == 'Uniquement les retours' else 'Inclus')
@@ -275,3 +272,23 @@ if df is not None:
 
     else:
         st.info(" Sélectionnez au moins un segment pour afficher les données et créer un export.")
+
+
+load_css()
+df, analysis_date = sidebar_filters()
+
+if df is not None:
+    st.title(" Plan d'Action & Exports")
+    filters = active_filters()
+    segment_rules = load_segment_rules()
+    rfm_df = cached_rfm(df, filters['key'], analysis_date, segment_rules)
+
+    st.markdown("""
+    Cette page vous permet de **créer des listes activables** pour vos outils CRM, d'emailing ou d'automation.
+    Chaque export inclut les **CustomerID**, **segment RFM**, et **métriques clés** pour piloter vos campagnes.
+    """)
+
+    customer_index = build_customer_index(rfm_df, filters['key'], segment_rules)
+    export_panel(rfm_df, customer_index, filters)
+
+render_trace_panel()
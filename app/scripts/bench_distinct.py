@@ -0,0 +1,66 @@
+"""
+Benchmark : comptages distincts exacts (nunique) vs sketches HyperLogLog fusionnés
+
+Usage (depuis la racine du projet) :
+    python app/scripts/bench_distinct.py [chemin_fichier] [--repeat 5]
+"""
+import argparse
+import os
+import sys
+import time
+import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.data_loader import DATA_PATH, load_data, dataset_version, filter_data  # noqa: E402
+from utils.kpi_cube import build_daily_cube, build_distinct_sketches, rollup_kpis  # noqa: E402
+from utils.hyperloglog import hll_relative_error  # noqa: E402
+
+
+def _timed(func, repeat):
+    """Meilleur temps (s) sur `repeat` exécutions et dernier résultat."""
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('file_path', nargs='?', default=DATA_PATH)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    version = dataset_version(args.file_path)
+    df = load_data(args.file_path, version)
+    cube = build_daily_cube(df)
+    start = time.perf_counter()
+    sketches = build_distinct_sketches(df)
+    build_time = time.perf_counter() - start
+
+    first_day = df['InvoiceDate'].min().date()
+    last_day = df['InvoiceDate'].max().date()
+    print(f"{len(df):,} lignes · {len(cube['day']):,} cellules · construction sketches {build_time:.2f}s "
+          f"· erreur type attendue ±{hll_relative_error():.1%}")
+    print(f"{'fenêtre':>10} {'lignes':>10} {'exact (ms)':>11} {'HLL (ms)':>9}  erreurs relatives (clients / produits / factures, exactes)")
+
+    for fraction in (0.1, 0.25, 0.5, 1.0):
+        end = first_day + datetime.timedelta(days=int((last_day - first_day).days * fraction))
+        filters = ((first_day, end), [], "Inclure tout")
+
+        def exact():
+            window = filter_data(df, *filters)
+            return len(window), (window['Customer ID'].nunique(), window['Description'].nunique(),
+                                 window['Invoice'].nunique())
+
+        exact_time, (n_rows, truth) = _timed(exact, args.repeat)
+        hll_time, kpis = _timed(lambda: rollup_kpis(cube, *filters, sketches=sketches), args.repeat)
+        estimates = (kpis['n_customers'], kpis['n_products'], kpis['n_invoices'])
+        errors = " / ".join(f"{(e - t) / t:+.1%}" if t else "n/a" for e, t in zip(estimates, truth))
+        print(f"{fraction:>10.0%} {n_rows:>10,} {exact_time * 1000:>11.1f} {hll_time * 1000:>9.1f}  {errors}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+"""
+Profil de démarrage : temps d'import par page, démarrage à froid du serveur et premier rendu
+
+Usage (depuis la racine du projet) :
+    python app/scripts/bench_startup.py [--repeat 3] [--skip-server] [--skip-render]
+
+Chaque mesure est faite dans un processus Python neuf (caches Streamlit vides) :
+- imports : instructions d'import de premier niveau de chaque page, sous -X importtime,
+  comparées à IMPORT_BUDGET_MS ;
+- serveur : délai entre `streamlit run` et la réponse de /_stcore/health ;
+- premier rendu : première exécution complète de la page (AppTest), chargement des
+  données compris, puis une ré-exécution à chaud. Le rendu navigateur n'est pas inclus.
+
+Code de sortie 1 si un budget est dépassé.
+"""
+import argparse
+import ast
+import glob
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY_POINT = os.path.join(APP_DIR, "streamlit_app.py")
+
+# Budget d'import par page (ms, processus neuf, imports de premier niveau uniquement)
+IMPORT_BUDGET_MS = 1500
+
+# Modules lourds qui ne doivent pas être importés par la page d'accueil
+# (hors ceux déjà chargés par `import streamlit` lui-même, ex : plotly pour son thème)
+HOME_FORBIDDEN_MODULES = ("plotly", "openpyxl", "matplotlib")
+
+# Modules importés au premier export seulement : aucune page ne doit les charger à l'import
+PAGE_FORBIDDEN_MODULES = ("openpyxl",)
+
+SERVER_TIMEOUT_S = 60
+
+
+def _pages():
+    return [ENTRY_POINT] + sorted(glob.glob(os.path.join(APP_DIR, "pages", "*.py")))
+
+
+def _page_name(path):
+    return os.path.relpath(path, APP_DIR)
+
+
+def _child_env():
+    env = dict(os.environ)
+    env["PYTHONPATH"] = APP_DIR + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+
+def page_imports(path):
+    """Instructions d'import de premier niveau d'une page (source Python)."""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    nodes = [node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+    return "\n".join(ast.unparse(node) for node in nodes)
+
+
+def import_profile(code):
+    """
+    Temps d'import (ms) d'un bloc d'imports dans un processus neuf
+
+    Returns:
+        Tuple (total en ms, temps propre par package racine en ms, modules importés)
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=APP_DIR, env=_child_env(), capture_output=True, text=True, check=True
+    )
+    by_package, modules = {}, set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = (field.strip() for field in line[len("import time:"):].split("|"))
+        modules.add(name)
+        root = name.split(".")[0]
+        by_package[root] = by_package.get(root, 0.0) + int(self_us) / 1000
+    return sum(by_package.values()), by_package, modules
+
+
+_RENDER_CHILD = """
+import json, sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(sys.argv[1], default_timeout=600)
+at.run()
+cold = time.perf_counter() - start
+start = time.perf_counter()
+at.run()
+warm = time.perf_counter() - start
+print(json.dumps({"cold": cold, "warm": warm, "exceptions": len(at.exception)}))
+"""
+
+
+def first_render(path):
+    """Première exécution (processus neuf, caches vides) et ré-exécution à chaud d'une page, en secondes."""
+    result = subprocess.run(
+        [sys.executable, "-c", _RENDER_CHILD, path],
+        cwd=APP_DIR, env=_child_env(), capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def server_ready_time():
+    """Délai (s) entre le lancement de `streamlit run` et un /_stcore/health répondant 200."""
+    port = _free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", ENTRY_POINT,
+         "--server.headless", "true", "--server.port", str(port)],
+        env=_child_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - start < SERVER_TIMEOUT_S:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.05)
+        raise TimeoutError(f"Serveur non prêt après {SERVER_TIMEOUT_S} s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3, help="Répétitions par mesure (médiane)")
+    parser.add_argument("--skip-server", action="store_true", help="Ne pas mesurer le démarrage du serveur")
+    parser.add_argument("--skip-render", action="store_true", help="Ne pas mesurer le premier rendu des pages")
+    args = parser.parse_args()
+
+    failures = []
+
+    # Référence : ce que coûte `import streamlit` seul (inévitable pour toute page)
+    baseline_modules = import_profile("import streamlit")[2]
+
+    print(f"Imports de premier niveau (médiane sur {args.repeat}, budget {IMPORT_BUDGET_MS} ms)")
+    for path in _pages():
+        runs = [import_profile(page_imports(path)) for _ in range(args.repeat)]
+        total = statistics.median(run[0] for run in runs)
+        by_package, modules = runs[-1][1], runs[-1][2]
+        heaviest = sorted(by_package.items(), key=lambda item: -item[1])[:4]
+        status = "OK" if total <= IMPORT_BUDGET_MS else "DÉPASSÉ"
+        print(f"  {_page_name(path):<36} {total:8.0f} ms  {status}   "
+              + ", ".join(f"{name} {ms:.0f}" for name, ms in heaviest))
+        if total > IMPORT_BUDGET_MS:
+            failures.append(f"{_page_name(path)} : imports {total:.0f} ms > {IMPORT_BUDGET_MS} ms")
+        extra = {name.split(".")[0] for name in modules - baseline_modules}
+        if path == ENTRY_POINT:
+            loaded = sorted(extra & set(HOME_FORBIDDEN_MODULES))
+            if loaded:
+                failures.append(f"Accueil : modules lourds importés ({', '.join(loaded)})")
+        else:
+            loaded = sorted(extra & set(PAGE_FORBIDDEN_MODULES))
+            if loaded:
+                failures.append(f"{_page_name(path)} : modules importés au chargement ({', '.join(loaded)})")
+
+    if not args.skip_server:
+        ready = statistics.median(server_ready_time() for _ in range(args.repeat))
+        print(f"\nDémarrage serveur (streamlit run -> /_stcore/health) : {ready:.2f} s")
+
+    if not args.skip_render:
+        print("\nPremier rendu (processus neuf, données chargées) / ré-exécution à chaud")
+        for path in _pages():
+            runs = [first_render(path) for _ in range(args.repeat)]
+            cold = statistics.median(run["cold"] for run in runs)
+            warm = statistics.median(run["warm"] for run in runs)
+            errors = max(run["exceptions"] for run in runs)
+            print(f"  {_page_name(path):<36} {cold:6.2f} s  /  {warm:5.2f} s"
+                  + (f"   {errors} exception(s)" if errors else ""))
+            if errors:
+                failures.append(f"{_page_name(path)} : {errors} exception(s) au rendu")
+
+    if failures:
+        print("\nÉchecs :")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Export CRM planifié, sans interface (cron : listes de segments régénérées chaque nuit)
+
+Usage (depuis la racine du projet) :
+    python app/scripts/export_segments.py -o exports/ [--segments Champions "À Risque"]
+        [--start 2010-01-01 --end 2011-12-09] [--countries "United Kingdom" France]
+        [--returns "Exclure les retours"] [--formats csv xlsx bundle]
+        [--compression gzip] [--bundle-format Parquet]
+
+Exemple de crontab (tous les jours à 2 h) :
+    0 2 * * * cd /chemin/du/projet && python app/scripts/export_segments.py -o /srv/crm/exports
+
+Les données passent par le même chargeur que l'application (load_data, filter_data,
+compute_rfm) ; le jeu nettoyé est relu depuis sa copie Parquet persistée, le fichier
+Excel n'est relu qu'à sa modification. Chaque exécution écrit ses fichiers et un
+manifest.json dans un répertoire temporaire du répertoire cible, renommé en une
+seule opération atomique en crm_export_AAAAMMJJ_HHMMSS/ : un répertoire visible
+est toujours complet.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from datetime import datetime
+
+import pandas as pd
+import streamlit.logger
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+# Les caches Streamlit fonctionnent hors serveur mais avertissent à chaque décoration et
+# appel : niveau relevé avant l'import des modules utils
+streamlit.logger.set_log_level("ERROR")
+
+from utils.data_loader import DATA_PATH, dataset_version, load_data, filter_data  # noqa: E402
+from utils.rfm_calculator import compute_rfm  # noqa: E402
+from utils.segment_rules import load_segment_rules  # noqa: E402
+from utils.exports import (  # noqa: E402
+    BUNDLE_FORMATS, CSV_COMPRESSIONS, XLSX_AVAILABLE, match_segments, write_bundle, write_csv, write_xlsx
+)
+
+RETURN_MODES = ("Exclure les retours", "Inclure tout", "Uniquement les retours")
+EXPORT_FORMATS = ("csv", "xlsx", "bundle")
+MANIFEST_NAME = "manifest.json"
+
+
+def file_digest(path, block_size=1 << 20):
+    """Empreinte SHA-256 d'un fichier, lu par blocs."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_exports(export_df, staging_dir, formats, compression, bundle_format):
+    """
+    Écrit les fichiers demandés dans le répertoire de préparation
+
+    Returns:
+        Liste de dictionnaires : name, format, rows, bytes, sha256
+    """
+    files = []
+    for export_format in formats:
+        if export_format == "csv":
+            name = f"CRM_Export.{CSV_COMPRESSIONS[compression][0]}"
+            with open(os.path.join(staging_dir, name), "wb") as f:
+                write_csv(export_df, f, compression)
+        elif export_format == "xlsx":
+            name = "CRM_Export.xlsx"
+            write_xlsx(export_df, os.path.join(staging_dir, name))
+        else:
+            name = "CRM_Segments.zip"
+            write_bundle(export_df, os.path.join(staging_dir, name), bundle_format)
+        path = os.path.join(staging_dir, name)
+        files.append({
+            "name": name,
+            "format": bundle_format if export_format == "bundle" else export_format,
+            "rows": len(export_df),
+            "bytes": os.path.getsize(path),
+            "sha256": file_digest(path)
+        })
+    return files
+
+
+def publish(staging_dir, target_dir):
+    """
+    Rend l'export visible : renommage atomique du répertoire de préparation
+
+    Raises:
+        FileExistsError: Si le répertoire cible existe déjà
+    """
+    if os.path.exists(target_dir):
+        raise FileExistsError(f"Export déjà présent : {target_dir}")
+    os.replace(staging_dir, target_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-o", "--output-dir", required=True, help="Répertoire cible des exports")
+    parser.add_argument("--data", default=DATA_PATH, help="Fichier source des transactions")
+    parser.add_argument("--start", help="Début de période (AAAA-MM-JJ, défaut : première transaction)")
+    parser.add_argument("--end", help="Fin de période et date d'analyse (défaut : dernière transaction)")
+    parser.add_argument("--countries", nargs="*", default=["United Kingdom"], help="Pays retenus (aucun : tous)")
+    parser.add_argument("--returns", choices=RETURN_MODES, default=RETURN_MODES[0], help="Traitement des retours")
+    parser.add_argument("--segments", nargs="*", default=[],
+                        help="Segments exportés, par début de libellé (aucun : tous)")
+    parser.add_argument("--formats", nargs="+", choices=EXPORT_FORMATS, default=["csv"], help="Fichiers produits")
+    parser.add_argument("--compression", choices=list(CSV_COMPRESSIONS), default="gzip", help="Compression du CSV")
+    parser.add_argument("--bundle-format", choices=list(BUNDLE_FORMATS),
+                        default="Parquet" if "Parquet" in BUNDLE_FORMATS else "CSV",
+                        help="Format des fichiers du lot par segment")
+    args = parser.parse_args()
+    if "xlsx" in args.formats and not XLSX_AVAILABLE:
+        parser.error("openpyxl est requis pour le format xlsx")
+
+    start = time.perf_counter()
+    version = dataset_version(args.data) if os.path.exists(args.data) else None
+    df = load_data(args.data, version)
+    if df is None:
+        sys.exit(f"Chargement impossible : {args.data}")
+    date_range = (
+        pd.Timestamp(args.start).date() if args.start else df["InvoiceDate"].min().date(),
+        pd.Timestamp(args.end).date() if args.end else df["InvoiceDate"].max().date()
+    )
+    df = filter_data(df, date_range, args.countries, args.returns)
+    rfm_df = compute_rfm(df, pd.to_datetime(date_range[1]))
+
+    all_segments = sorted(rfm_df["Segment_Label"].unique().tolist())
+    segments = match_segments(all_segments, args.segments) if args.segments else all_segments
+    unmatched = [name for name in args.segments if not match_segments(all_segments, [name])]
+    if unmatched:
+        print(f"Segments introuvables ignorés : {', '.join(unmatched)}", file=sys.stderr)
+    export_df = rfm_df[rfm_df["Segment_Label"].isin(segments)]
+    if export_df.empty:
+        sys.exit("Aucun client à exporter après filtrage.")
+
+    created_at = datetime.now()
+    os.makedirs(args.output_dir, exist_ok=True)
+    run_name = f"crm_export_{created_at.strftime('%Y%m%d_%H%M%S')}"
+    # Préparation dans le répertoire cible (même système de fichiers : renommage atomique)
+    staging_dir = os.path.join(args.output_dir, f".{run_name}.{os.getpid()}.tmp")
+    os.makedirs(staging_dir)
+    try:
+        files = write_exports(export_df, staging_dir, args.formats, args.compression, args.bundle_format)
+        counts = export_df["Segment_Label"].value_counts().sort_index()
+        manifest = {
+            "created_at": created_at.isoformat(timespec="seconds"),
+            "source": {"path": os.path.abspath(args.data), "version": version},
+            "filters": {
+                "start": str(date_range[0]),
+                "end": str(date_range[1]),
+                "countries": args.countries,
+                "returns": args.returns
+            },
+            "segment_rules": load_segment_rules(),
+            "customers": len(export_df),
+            "segments": {segment: int(count) for segment, count in counts.items()},
+            "files": files,
+            "duration_s": round(time.perf_counter() - start, 3)
+        }
+        with open(os.path.join(staging_dir, MANIFEST_NAME), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        target_dir = os.path.join(args.output_dir, run_name)
+        publish(staging_dir, target_dir)
+    except BaseException:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+
+    print(f"{len(export_df):,} clients, {len(files)} fichier(s) en {manifest['duration_s']:.1f} s -> {target_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+Évaluation en lot de scénarios CLV, sans interface (planification marketing, exécutions de nuit)
+
+Usage (depuis la racine du projet) :
+    python app/scripts/run_scenarios.py scenarios.csv -o resultats.csv [--workers 4]
+        [--start 2010-01-01 --end 2011-12-09] [--countries "United Kingdom" France]
+        [--returns "Exclure les retours"] [--mc-paths 100000] [--cost 5000 --affected 1000]
+
+Fichier de scénarios :
+- CSV ou JSON (liste d'objets) avec les colonnes name, margin, retention et discount
+  (discount facultatif : taux de référence) ;
+- ou JSON {"grid": {"margin": [...], "retention": [...], "discount": [...]}} :
+  produit cartésien des valeurs (un scénario par combinaison).
+
+Les données passent par le même chargeur mis en cache que l'application
+(load_data, filter_data, compute_rfm). Les scénarios sont répartis en lots sur
+un pool de processus ; chaque lot est évalué de façon vectorisée (formule fermée
+au panier moyen, simulation par client avec roll-up par segment, Monte Carlo facultatif).
+La table de résultats est écrite en CSV ou Parquet selon l'extension.
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import streamlit.logger
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+# Les caches Streamlit fonctionnent hors serveur mais avertissent à chaque décoration et
+# appel : niveau relevé avant l'import des modules utils (et dans les processus du pool)
+streamlit.logger.set_log_level("ERROR")
+
+from utils.data_loader import DATA_PATH, dataset_version, load_data, filter_data  # noqa: E402
+from utils.rfm_calculator import compute_rfm  # noqa: E402
+from utils.segment_rules import load_segment_rules  # noqa: E402
+from utils.clv_engine import CLV_BASELINE, clv_formula, segment_profiles, scenario_unit_clv  # noqa: E402
+from utils.monte_carlo import simulate_clv_paths  # noqa: E402
+
+RETURN_MODES = ("Exclure les retours", "Inclure tout", "Uniquement les retours")
+
+# Scénarios évalués par tâche du pool
+SCENARIOS_PER_TASK = 25
+
+# Contexte partagé par les processus du pool (initialisé une fois par processus)
+_context = None
+
+
+def load_scenarios(path):
+    """
+    Lit le fichier de scénarios
+
+    Returns:
+        DataFrame : name, margin, retention, discount
+
+    Raises:
+        ValueError: Si le fichier est invalide, une valeur non numérique ou hors domaine
+    """
+    if path.endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            content = json.load(f)
+        if isinstance(content, dict) and "grid" in content:
+            grid = content["grid"]
+            axes = [grid.get(key, [CLV_BASELINE[key]]) for key in ("margin", "retention", "discount")]
+            scenarios = pd.DataFrame(list(itertools.product(*axes)), columns=["margin", "retention", "discount"])
+            scenarios = scenarios.apply(pd.to_numeric, errors="raise")
+            scenarios.insert(0, "name", [f"m{m:g}_r{r:g}_d{d:g}" for m, r, d in scenarios.to_numpy()])
+        else:
+            scenarios = pd.DataFrame(content["scenarios"] if isinstance(content, dict) else content)
+    else:
+        scenarios = pd.read_csv(path)
+
+    if "discount" not in scenarios:
+        scenarios["discount"] = CLV_BASELINE["discount"]
+    missing = {"name", "margin", "retention"} - set(scenarios.columns)
+    if missing:
+        raise ValueError(f"Colonnes manquantes dans {path} : {', '.join(sorted(missing))}")
+    scenarios = scenarios[["name", "margin", "retention", "discount"]].copy()
+    # Valeurs non numériques : ValueError, remontée à l'utilisateur par main()
+    for key in ("margin", "retention", "discount"):
+        try:
+            scenarios[key] = pd.to_numeric(scenarios[key], errors="raise")
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Colonne {key} non numérique dans {path} : {e}") from e
+    if scenarios[["margin", "retention", "discount"]].isna().any().any():
+        raise ValueError(f"Valeurs manquantes dans {path}")
+    if scenarios["name"].duplicated().any():
+        raise ValueError(f"Noms de scénarios en double dans {path}")
+    # Domaine de la formule fermée : rétention < 1 (série convergente), actualisation > 0
+    invalid = scenarios[
+        (scenarios["margin"] < 0)
+        | (scenarios["retention"] < 0) | (scenarios["retention"] >= 1)
+        | (scenarios["discount"] <= 0)
+    ]
+    if not invalid.empty:
+        raise ValueError(
+            f"Paramètres hors domaine dans {path} (marge >= 0, 0 <= rétention < 1, actualisation > 0) : "
+            + ", ".join(invalid["name"].astype(str))
+        )
+    return scenarios.reset_index(drop=True)
+
+
+def _init_worker(context):
+    global _context
+    _context = context
+
+
+def evaluate_scenarios(scenarios, context=None):
+    """
+    Évalue un lot de scénarios (vectorisé sur le lot)
+
+    Args:
+        scenarios: DataFrame name, margin, retention, discount
+        context: Agrégats de la base (défaut : contexte du processus du pool)
+
+    Returns:
+        DataFrame de résultats, une ligne par scénario
+    """
+    context = context or _context
+    profiles = context["profiles"]
+    avg_spend = context["avg_spend"]
+    margin, retention, discount = (scenarios[key].to_numpy(dtype=float) for key in ("margin", "retention", "discount"))
+
+    results = scenarios.copy()
+    results["clv_avg"] = clv_formula(avg_spend, margin, retention, discount)
+    results["clv_delta_pct"] = (results["clv_avg"] / context["clv_baseline"] - 1) * 100 if context["clv_baseline"] else 0.0
+    results["value_closed_form"] = results["clv_avg"] * context["n_customers"]
+
+    # Simulation par client : rétention propre à chaque segment, roll-up par segment
+    # (valeur totale du parc, à comparer à value_closed_form)
+    unit_clv = scenario_unit_clv(profiles, scenarios.to_dict("records"))
+    segment_values = profiles["Monetary_sum"].to_numpy(dtype=float)[:, None] * unit_clv
+    results["value_simulated_total"] = segment_values.sum(axis=0)
+    for segment, values in zip(profiles.index, segment_values):
+        results[f"value_{segment}"] = values
+
+    if context["initiative_cost"]:
+        value_created = (results["clv_avg"] - context["clv_baseline"]) * context["affected_customers"]
+        results["roi_pct"] = (value_created - context["initiative_cost"]) / context["initiative_cost"] * 100
+
+    if context["mc_paths"]:
+        percentiles = []
+        for m, r, d in zip(margin, retention, discount):
+            mc = simulate_clv_paths(avg_spend, context["spend_cv"], m, r, d, context["mc_paths"], context["seed"])
+            percentiles.append({f"mc_clv_p{pct}": value for pct, value in mc["clv"].items()}
+                               | {"mc_clv_mean": mc["clv_mean"]}
+                               | {f"mc_expected_clv_p{pct}": value for pct, value in mc["expected_clv"].items()})
+        results = pd.concat([results, pd.DataFrame(percentiles, index=results.index)], axis=1)
+    return results
+
+
+def build_context(rfm_df, args):
+    """Agrégats de la base transmis une fois à chaque processus du pool."""
+    spend = rfm_df["Monetary"]
+    avg_spend = float(spend.mean())
+    return {
+        "profiles": segment_profiles(rfm_df, None, load_segment_rules()),
+        "avg_spend": avg_spend,
+        "spend_cv": float(spend.std() / avg_spend) if len(spend) > 1 and avg_spend > 0 else 0.0,
+        "n_customers": len(rfm_df),
+        "clv_baseline": float(clv_formula(avg_spend, CLV_BASELINE["margin"], CLV_BASELINE["retention"],
+                                          CLV_BASELINE["discount"])),
+        "initiative_cost": args.cost,
+        "affected_customers": args.affected,
+        "mc_paths": args.mc_paths,
+        "seed": args.seed
+    }
+
+
+def write_table(results, path):
+    """Écrit la table de résultats (Parquet si l'extension est .parquet, CSV sinon)."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if path.endswith(".parquet"):
+        results.to_parquet(path, index=False)
+    else:
+        results.to_csv(path, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("scenarios", help="Fichier de scénarios (CSV ou JSON)")
+    parser.add_argument("-o", "--output", default="scenario_results.csv", help="Table de résultats (.csv ou .parquet)")
+    parser.add_argument("--data", default=DATA_PATH, help="Fichier source des transactions")
+    parser.add_argument("--start", help="Début de période (AAAA-MM-JJ, défaut : première transaction)")
+    parser.add_argument("--end", help="Fin de période et date d'analyse (défaut : dernière transaction)")
+    parser.add_argument("--countries", nargs="*", default=["United Kingdom"], help="Pays retenus (aucun : tous)")
+    parser.add_argument("--returns", choices=RETURN_MODES, default=RETURN_MODES[0], help="Traitement des retours")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processus du pool")
+    parser.add_argument("--mc-paths", type=int, default=0, help="Trajectoires Monte Carlo par scénario (0 : désactivé)")
+    parser.add_argument("--seed", type=int, default=0, help="Graine Monte Carlo")
+    parser.add_argument("--cost", type=float, default=0.0, help="Coût de l'initiative (£) pour le ROI")
+    parser.add_argument("--affected", type=int, default=0, help="Clients affectés par l'initiative")
+    args = parser.parse_args()
+
+    try:
+        scenarios = load_scenarios(args.scenarios)
+    except (OSError, ValueError, KeyError) as e:
+        parser.error(str(e))
+
+    start = time.perf_counter()
+    df = load_data(args.data, dataset_version(args.data))
+    if df is None:
+        sys.exit(f"Chargement impossible : {args.data}")
+    date_range = (
+        pd.Timestamp(args.start).date() if args.start else df["InvoiceDate"].min().date(),
+        pd.Timestamp(args.end).date() if args.end else df["InvoiceDate"].max().date()
+    )
+    df = filter_data(df, date_range, args.countries, args.returns)
+    rfm_df = compute_rfm(df, pd.to_datetime(date_range[1]))
+    if rfm_df.empty:
+        sys.exit("Aucun client après filtrage.")
+    context = build_context(rfm_df, args)
+    print(f"{len(rfm_df):,} clients, {len(scenarios):,} scénarios ({time.perf_counter() - start:.1f} s de préparation)")
+
+    batches = [scenarios.iloc[i:i + SCENARIOS_PER_TASK] for i in range(0, len(scenarios), SCENARIOS_PER_TASK)]
+    start = time.perf_counter()
+    if args.workers > 1 and len(batches) > 1:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(context,)) as pool:
+            results = pd.concat(pool.map(evaluate_scenarios, batches), ignore_index=True)
+    else:
+        results = pd.concat([evaluate_scenarios(batch, context) for batch in batches], ignore_index=True)
+
+    write_table(results, args.output)
+    print(f"{len(results):,} scénarios évalués en {time.perf_counter() - start:.1f} s -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
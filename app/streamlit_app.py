@@ -7,7 +7,11 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-from utils.data_loader import sidebar_filters
+from utils.tracing import render_trace_panel
+from utils.data_loader import sidebar_filters, active_filters
+from utils.kpi_calculator import compute_kpis
+from utils.kpi_cube import get_daily_cube, get_distinct_sketches, rollup_kpis
+from utils.hyperloglog import hll_relative_error
 
 df, _ = sidebar_filters()
 
@@ -46,10 +50,20 @@ if df is not None:
     st.info("Utilisez le menu latéral pour filtrer les données et naviguer entre les vues.")
 
     # stats rapides
+    filters = active_filters()
+    if filters['approx_distinct']:
+        kpis = rollup_kpis(get_daily_cube(filters['data_version']), filters['date_range'], filters['countries'],
+                           filters['return_mode'], sketches=get_distinct_sketches(filters['data_version']))
+    else:
+        kpis = compute_kpis(df, filters['key'])
     c1, c2, c3, c4 = st.columns(4)
-    c1.metric("Transactions", f"{len(df):,}")
-    c2.metric("Clients Uniques", f"{df['Customer ID'].nunique():,}")
-    c3.metric("Pays Couverts", f"{df['Country'].nunique()}")
-    c4.metric("Produits", f"{df['Description'].nunique():,}")
+    c1.metric("Transactions", f"{kpis['n_lines']:,}")
+    c2.metric("Clients Uniques", f"{kpis['n_customers']:,}")
+    c3.metric("Pays Couverts", f"{kpis['n_countries']}")
+    c4.metric("Produits", f"{kpis['n_products']:,}")
+    if filters['approx_distinct']:
+        st.caption(f"Clients et produits estimés par HyperLogLog (erreur type ±{hll_relative_error():.1%}).")
 else:
-    st.warning("Veuillez charger les données via la sidebar.")
\ No newline at end of file
+    st.warning("Veuillez charger les données via la sidebar.")
+
+render_trace_panel()
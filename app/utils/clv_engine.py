@@ -0,0 +1,217 @@
+"""
+Moteur CLV (formule fermée) : évaluation vectorisée sur grilles marge × rétention × actualisation
+"""
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils.tracing import traced
+
+# Hypothèses de référence du simulateur (marge 20%, rétention 60%, d = 10%)
+CLV_BASELINE = {"margin": 0.20, "retention": 0.60, "discount": 0.10}
+
+# Résolution par défaut des balayages affichés (surface 3D et courbe 2D)
+SURFACE_POINTS = 60
+CURVE_POINTS = 200
+
+
+def sweep_axis(spec):
+    """
+    Valeurs d'un axe de balayage
+
+    Args:
+        spec: Scalaire, tuple (début, fin, nombre de points) ou liste / tableau de valeurs
+
+    Returns:
+        Tableau 1-D de float
+    """
+    if np.isscalar(spec):
+        return np.array([spec], dtype=float)
+    if isinstance(spec, tuple) and len(spec) == 3 and isinstance(spec[2], (int, np.integer)):
+        return np.linspace(spec[0], spec[1], int(spec[2]))
+    return np.asarray(spec, dtype=float).ravel()
+
+
+def clv_factor(retention, discount):
+    """Facteur r / (1 + d - r) de la formule fermée (0 si le dénominateur est nul), par broadcasting."""
+    retention = np.asarray(retention, dtype=float)
+    denom = 1 + np.asarray(discount, dtype=float) - retention
+    return np.divide(retention, denom, out=np.zeros(np.broadcast(retention, denom).shape), where=denom != 0)
+
+
+def clv_formula(spend, margin, retention, discount):
+    """
+    CLV = (panier × marge × r) / (1 + d - r), élément par élément (broadcasting NumPy)
+
+    Args:
+        spend, margin, retention, discount: Scalaires ou tableaux compatibles
+
+    Returns:
+        Tableau (ou scalaire NumPy) de CLV en £
+    """
+    return np.asarray(spend, dtype=float) * np.asarray(margin, dtype=float) * clv_factor(retention, discount)
+
+
+@st.cache_resource(show_spinner=False, max_entries=32)
+def _shared_clv_sweep(spend, margin, retention, discount, grid, dtype):
+    """Balayage partagé par toutes les sessions : tableaux en lecture seule (voir clv_sweep)."""
+    # Copie des axes : un tableau fourni par l'appelant ne doit pas être figé
+    axes = {"margin": sweep_axis(margin).copy(), "retention": sweep_axis(retention).copy(),
+            "discount": sweep_axis(discount).copy()}
+    if grid:
+        factor = clv_factor(axes["retention"][:, None], axes["discount"][None, :])
+        clv = np.empty((len(axes["margin"]), *factor.shape), dtype=dtype)
+        np.multiply((spend * axes["margin"])[:, None, None], factor[None, :, :], out=clv, casting="unsafe")
+    else:
+        try:
+            clv = clv_formula(spend, axes["margin"], axes["retention"], axes["discount"]).astype(dtype, copy=False)
+        except ValueError as e:
+            raise ValueError("Axes appariés de longueurs incompatibles") from e
+    result = {**axes, "clv": clv}
+    for values in result.values():
+        values.setflags(write=False)
+    return result
+
+
+@traced()
+def clv_sweep(spend, margin, retention, discount, grid=True, dtype="float64"):
+    """
+    Balayage CLV, mis en cache par jeu de paramètres (tableaux partagés, en lecture seule)
+
+    En mode grille, la CLV est évaluée sur le produit cartésien des trois axes.
+    La formule étant séparable (panier × marge) × f(r, d), le facteur f n'est
+    calculé que sur le plan rétention × actualisation, puis un seul produit
+    externe remplit le tableau de sortie : 500 points par axe (125 M valeurs)
+    ne demandent aucune allocation intermédiaire (dtype="float32" : 500 Mo).
+
+    Args:
+        spend: Panier (£) ; 1.0 pour une CLV par £ de panier
+        margin, retention, discount: Axes (voir sweep_axis)
+        grid: True : produit cartésien des axes ; False : points appariés
+            (axes de même longueur, ou de longueur 1, broadcastés)
+        dtype: Type des valeurs produites
+
+    Returns:
+        Dictionnaire : margin, retention, discount (axes) et clv, de forme
+        (n_marge, n_rétention, n_actualisation) en grille, (n_points,) sinon
+
+    Raises:
+        ValueError: Si des axes appariés n'ont pas des longueurs compatibles
+    """
+    # Dictionnaire propre à l'appelant ; les tableaux, partagés, sont tous figés
+    return dict(_shared_clv_sweep(spend, margin, retention, discount, grid, dtype))
+
+
+# ============ SIMULATION PAR CLIENT ============
+
+# Rétention plafonnée : au-delà, 1 + d - r s'approche de 0 et la CLV diverge
+RETENTION_CAP = 0.95
+
+# Lignes traitées par bloc pour la matrice clients × scénarios (borne la mémoire temporaire)
+MATRIX_CHUNK_ROWS = 262_144
+
+
+@traced()
+@st.cache_data(show_spinner=False)
+def segment_profiles(_rfm_df, filter_key, segment_rules):
+    """
+    Profil de chaque segment pour la simulation par client
+
+    La rétention empirique d'un segment est la part de ses clients ayant passé
+    plus d'une commande sur la période.
+
+    Args:
+        _rfm_df: Sortie de compute_rfm (non hachée)
+        filter_key: État des filtres (voir data_loader.filter_state), clé du cache
+        segment_rules: Règles de segmentation en vigueur, clé du cache
+
+    Returns:
+        DataFrame indexé par segment (ordre alphabétique) : Clients, Monetary_sum, Retention
+    """
+    labels = _rfm_df['Segment_Label']
+    grouped = _rfm_df.groupby(labels, sort=True)
+    profiles = pd.DataFrame({
+        'Clients': grouped.size(),
+        'Monetary_sum': grouped['Monetary'].sum(),
+        'Retention': (_rfm_df['Frequency'] > 1).groupby(labels, sort=True).mean()
+    })
+    profiles.index.name = 'Segment'
+    return profiles
+
+
+def scenario_unit_clv(profiles, scenarios):
+    """
+    CLV par £ de panier de chaque segment sous chaque scénario
+
+    La rétention d'un segment sous un scénario est sa rétention empirique décalée
+    de l'écart du scénario à la rétention de référence (CLV_BASELINE), bornée à
+    [0, RETENTION_CAP] ; marge et actualisation sont celles du scénario.
+
+    Args:
+        profiles: Sortie de segment_profiles
+        scenarios: Liste de dictionnaires {name, margin, retention, discount}
+
+    Returns:
+        Tableau (n_segments, n_scénarios)
+    """
+    margins = np.array([scenario['margin'] for scenario in scenarios], dtype=float)
+    retentions = np.array([scenario['retention'] for scenario in scenarios], dtype=float)
+    discounts = np.array([scenario['discount'] for scenario in scenarios], dtype=float)
+
+    segment_retention = profiles['Retention'].to_numpy(dtype=float)[:, None]
+    retention = np.clip(segment_retention + (retentions - CLV_BASELINE['retention'])[None, :], 0, RETENTION_CAP)
+    shape = retention.shape
+    unit = clv_sweep(
+        1.0,
+        np.broadcast_to(margins, shape).ravel(),
+        retention.ravel(),
+        np.broadcast_to(discounts, shape).ravel(),
+        grid=False
+    )["clv"]
+    return unit.reshape(shape)
+
+
+@traced()
+def customer_scenario_matrix(spend, segment_codes, unit_clv, dtype="float32"):
+    """
+    Matrice clients × scénarios : CLV de chaque client sous chaque scénario
+
+    Chaque ligne vaut panier du client × CLV unitaire de son segment ; la matrice
+    est remplie par blocs de MATRIX_CHUNK_ROWS lignes (1 M clients × 36 scénarios
+    en float32 : 144 Mo, sans temporaire de la même taille).
+
+    Args:
+        spend: Panier de chaque client (£)
+        segment_codes: Indice de segment de chaque client (lignes de unit_clv)
+        unit_clv: Sortie de scenario_unit_clv
+        dtype: Type des valeurs produites
+
+    Returns:
+        Tableau (n_clients, n_scénarios)
+    """
+    spend = np.asarray(spend, dtype=float)
+    segment_codes = np.asarray(segment_codes)
+    matrix = np.empty((len(spend), unit_clv.shape[1]), dtype=dtype)
+    for start in range(0, len(spend), MATRIX_CHUNK_ROWS):
+        stop = start + MATRIX_CHUNK_ROWS
+        np.multiply(spend[start:stop, None], unit_clv[segment_codes[start:stop]], out=matrix[start:stop], casting="unsafe")
+    return matrix
+
+
+def scenario_rollup(profiles, unit_clv, scenario_names):
+    """
+    Valeur totale de chaque segment sous chaque scénario (somme des lignes de la matrice)
+
+    La CLV étant linéaire dans le panier, la somme par segment vaut panier total du
+    segment × CLV unitaire : aucune relecture des clients.
+
+    Args:
+        profiles: Sortie de segment_profiles
+        unit_clv: Sortie de scenario_unit_clv
+        scenario_names: Noms des scénarios (colonnes)
+
+    Returns:
+        DataFrame segments × scénarios (£)
+    """
+    totals = profiles['Monetary_sum'].to_numpy(dtype=float)[:, None] * unit_clv
+    return pd.DataFrame(totals, index=profiles.index, columns=list(scenario_names))
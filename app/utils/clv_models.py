@@ -0,0 +1,366 @@
+"""
+Modèles CLV probabilistes : BG/NBD (nombre d'achats futurs) et Gamma-Gamma (panier moyen)
+
+Les vraisemblances sont vectorisées sur les clients, optimisées par BFGS avec gradients
+analytiques (NumPy seul, pas de dépendance à scipy).
+"""
+import math
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils.tracing import traced
+
+# Unité de temps des modèles : la semaine (conditionnement des paramètres)
+DAYS_PER_WEEK = 7
+WEEKS_PER_MONTH = 365.25 / 12 / DAYS_PER_WEEK
+
+# Horizon de prédiction par défaut (mois)
+CLV_HORIZON_MONTHS = 12
+
+# Pénalité ridge sur les log-paramètres : évite la dérive vers l'infini quand les
+# données sont homogènes (l'optimum est alors au bord), biais négligeable sinon
+CLV_PENALIZER = 1e-3
+
+BGNBD_PARAMS = ("r", "alpha", "a", "b")
+GAMMA_GAMMA_PARAMS = ("p", "q", "v")
+
+# Série hypergéométrique 2F1 : nombre maximal de termes et tolérance relative
+_HYP2F1_MAX_TERMS = 1000
+_HYP2F1_TOL = 1e-12
+
+
+# ============ FONCTIONS SPÉCIALES ============
+
+_gammaln = np.vectorize(math.lgamma, otypes=[float])
+
+
+def _digamma(x):
+    """Digamma vectorisée (récurrence jusqu'à x >= 6 puis développement asymptotique), x > 0."""
+    x = np.array(x, dtype=float)
+    result = np.zeros_like(x)
+    for _ in range(6):
+        small = x < 6
+        if not small.any():
+            break
+        result[small] -= 1 / x[small]
+        x[small] += 1
+    inv2 = 1 / (x * x)
+    return result + np.log(x) - 0.5 / x - inv2 * (1 / 12 - inv2 * (1 / 120 - inv2 * (1 / 252 - inv2 / 240)))
+
+
+def _hyp2f1(a, b, c, z):
+    """Série hypergéométrique 2F1(a, b; c; z) vectorisée, pour 0 <= z < 1."""
+    a, b, c, z = np.broadcast_arrays(*(np.asarray(v, dtype=float) for v in (a, b, c, z)))
+    term = np.ones(a.shape)
+    total = np.ones(a.shape)
+    for k in range(_HYP2F1_MAX_TERMS):
+        term = term * (a + k) * (b + k) / ((c + k) * (k + 1)) * z
+        total += term
+        if np.all(np.abs(term) <= _HYP2F1_TOL * np.abs(total)):
+            break
+    return total
+
+
+# ============ OPTIMISATION ============
+
+def _minimize(objective, x0, max_iter=500, gtol=1e-6):
+    """
+    BFGS avec recherche linéaire d'Armijo (paramètres en logarithme, donc sans contrainte)
+
+    Args:
+        objective: Fonction x -> (valeur, gradient)
+        x0: Point de départ
+        max_iter: Nombre maximal d'itérations
+        gtol: Tolérance sur la norme infinie du gradient
+
+    Returns:
+        Tuple (x optimal, valeur, nombre d'itérations)
+    """
+    x = np.asarray(x0, dtype=float)
+    value, grad = objective(x)
+    inv_hessian = np.eye(len(x))
+    iteration = 0
+    for iteration in range(1, max_iter + 1):
+        if np.max(np.abs(grad)) < gtol:
+            break
+        direction = -inv_hessian @ grad
+        if grad @ direction >= 0:
+            inv_hessian = np.eye(len(x))
+            direction = -grad
+        # Pas borné : un pas de 5 en logarithme multiplie déjà un paramètre par ~150
+        step = min(1.0, 5 / np.max(np.abs(direction)))
+        while True:
+            candidate = x + step * direction
+            new_value, new_grad = objective(candidate)
+            if np.isfinite(new_value) and new_value <= value + 1e-4 * step * (grad @ direction):
+                break
+            step /= 2
+            if step < 1e-12:
+                return x, value, iteration
+        s, y = candidate - x, new_grad - grad
+        sy = s @ y
+        if sy > 1e-12:
+            rho = 1 / sy
+            identity = np.eye(len(x))
+            inv_hessian = (identity - rho * np.outer(s, y)) @ inv_hessian @ (identity - rho * np.outer(y, s)) \
+                + rho * np.outer(s, s)
+        x, value, grad = candidate, new_value, new_grad
+    return x, value, iteration
+
+
+# ============ DONNÉES ============
+
+def clv_inputs(rfm_df):
+    """
+    Entrées des modèles à partir de la table RFM
+
+    Args:
+        rfm_df: Sortie de compute_rfm (Recency, Frequency, Monetary, Tenure en jours)
+
+    Returns:
+        Dictionnaire de tableaux : x (achats répétés = Frequency - 1), t_x (date du
+        dernier achat depuis le premier, en semaines), T (ancienneté en semaines),
+        n (nombre d'achats), m (panier moyen par achat)
+    """
+    frequency = rfm_df['Frequency'].to_numpy(dtype=float)
+    tenure = rfm_df['Tenure'].to_numpy(dtype=float)
+    recency = rfm_df['Recency'].to_numpy(dtype=float)
+    return {
+        'x': frequency - 1,
+        't_x': (tenure - recency) / DAYS_PER_WEEK,
+        'T': tenure / DAYS_PER_WEEK,
+        'n': frequency,
+        'm': rfm_df['Monetary'].to_numpy(dtype=float) / frequency
+    }
+
+
+def compress_tuples(x, t_x, T):
+    """
+    Regroupe les clients de même triplet (x, t_x, T)
+
+    La vraisemblance BG/NBD ne dépend que de ce triplet : elle est évaluée une fois
+    par triplet distinct et pondérée par son effectif.
+
+    Returns:
+        Tuple (x, t_x, T distincts, effectifs, indice du triplet de chaque client)
+    """
+    tuples = np.column_stack([x, t_x, T])
+    unique, inverse, counts = np.unique(tuples, axis=0, return_inverse=True, return_counts=True)
+    return unique[:, 0], unique[:, 1], unique[:, 2], counts, inverse.ravel()
+
+
+# ============ BG/NBD ============
+
+def _bgnbd_terms(params, x, t_x, T):
+    """Termes de la log-vraisemblance BG/NBD par triplet : (A1 + A2, A3, A4)."""
+    r, alpha, a, b = params
+    x_values, x_index = np.unique(x, return_inverse=True)
+    gammaln_x = {
+        'r': _gammaln(r + x_values)[x_index],
+        'b': _gammaln(b + x_values)[x_index],
+        'ab': _gammaln(a + b + x_values)[x_index]
+    }
+    a1 = gammaln_x['r'] - math.lgamma(r) + r * np.log(alpha)
+    a2 = math.lgamma(a + b) + gammaln_x['b'] - math.lgamma(b) - gammaln_x['ab']
+    a3 = -(r + x) * np.log(alpha + T)
+    repeat = x > 0
+    safe_b = np.where(repeat, b + x - 1, 1.0)
+    a4 = np.where(repeat, np.log(a) - np.log(safe_b) - (r + x) * np.log(alpha + t_x), -np.inf)
+    return a1 + a2, a3, a4, x_values, x_index, repeat, safe_b
+
+
+def bgnbd_negative_log_likelihood(log_params, x, t_x, T, weights):
+    """
+    Log-vraisemblance BG/NBD négative (moyenne pondérée, pénalisée) et son gradient analytique
+
+    Args:
+        log_params: log(r, alpha, a, b)
+        x, t_x, T: Triplets (voir compress_tuples)
+        weights: Effectif de chaque triplet
+
+    Returns:
+        Tuple (valeur, gradient par rapport à log_params)
+    """
+    params = np.exp(log_params)
+    r, alpha, a, b = params
+    a12, a3, a4, x_values, x_index, repeat, safe_b = _bgnbd_terms(params, x, t_x, T)
+    log_sum = np.logaddexp(a3, a4)
+    ll = a12 + log_sum
+    w4 = np.exp(a4 - log_sum)
+    w3 = 1 - w4
+
+    digamma_x = {
+        'r': _digamma(r + x_values)[x_index],
+        'b': _digamma(b + x_values)[x_index],
+        'ab': _digamma(a + b + x_values)[x_index]
+    }
+    psi_ab = _digamma(a + b)
+    grad_r = digamma_x['r'] - _digamma(r) + np.log(alpha) - w3 * np.log(alpha + T) - w4 * np.log(alpha + t_x)
+    grad_alpha = r / alpha - w3 * (r + x) / (alpha + T) - w4 * (r + x) / (alpha + t_x)
+    grad_a = psi_ab - digamma_x['ab'] + w4 / a
+    grad_b = psi_ab + digamma_x['b'] - _digamma(b) - digamma_x['ab'] - np.where(repeat, w4 / safe_b, 0.0)
+
+    total = weights.sum()
+    grad = np.array([weights @ g for g in (grad_r, grad_alpha, grad_a, grad_b)])
+    value = -(weights @ ll) / total + CLV_PENALIZER * (log_params @ log_params)
+    return value, -grad * params / total + 2 * CLV_PENALIZER * log_params
+
+
+def bgnbd_probability_alive(params, x, t_x, T):
+    """Probabilité que le client soit encore actif à la date d'analyse."""
+    r, alpha, a, b = params
+    repeat = x > 0
+    safe_b = np.where(repeat, b + x - 1, 1.0)
+    odds = np.where(repeat, a / safe_b * ((alpha + T) / (alpha + t_x)) ** (r + x), 0.0)
+    return 1 / (1 + odds)
+
+
+def bgnbd_expected_purchases(params, t, x, t_x, T):
+    """
+    Nombre d'achats attendus sur (T, T + t] sachant l'historique (x, t_x, T)
+
+    Args:
+        params: (r, alpha, a, b)
+        t: Horizon (semaines), scalaire ou tableau compatible
+        x, t_x, T: Historique de chaque client (ou triplet)
+
+    Returns:
+        Tableau d'espérances
+    """
+    r, alpha, a, b = params
+    z = t / (alpha + T + t)
+    hyp = _hyp2f1(r + x, b + x, a + b + x - 1, z)
+    numerator = (a + b + x - 1) / (a - 1) * (1 - ((alpha + T) / (alpha + T + t)) ** (r + x) * hyp)
+    repeat = x > 0
+    safe_b = np.where(repeat, b + x - 1, 1.0)
+    denominator = 1 + np.where(repeat, a / safe_b * ((alpha + T) / (alpha + t_x)) ** (r + x), 0.0)
+    return numerator / denominator
+
+
+# ============ GAMMA-GAMMA ============
+
+def gamma_gamma_negative_log_likelihood(log_params, n, m):
+    """
+    Log-vraisemblance Gamma-Gamma négative (moyenne, pénalisée) et son gradient analytique
+
+    Args:
+        log_params: log(p, q, v)
+        n: Nombre d'achats de chaque client
+        m: Panier moyen observé de chaque client (> 0)
+
+    Returns:
+        Tuple (valeur, gradient par rapport à log_params)
+    """
+    params = np.exp(log_params)
+    p, q, v = params
+    n_values, n_index = np.unique(n, return_inverse=True)
+    pn = p * n
+    gammaln_terms = (_gammaln(p * n_values + q) - _gammaln(p * n_values))[n_index]
+    log_nm_v = np.log(n * m + v)
+    ll = gammaln_terms - math.lgamma(q) + q * np.log(v) + (pn - 1) * np.log(m) + pn * np.log(n) - (pn + q) * log_nm_v
+
+    psi_pnq = _digamma(p * n_values + q)[n_index]
+    psi_pn = _digamma(p * n_values)[n_index]
+    grad_p = n * (psi_pnq - psi_pn + np.log(m) + np.log(n) - log_nm_v)
+    grad_q = psi_pnq - _digamma(q) + np.log(v) - log_nm_v
+    grad_v = q / v - (pn + q) / (n * m + v)
+
+    count = len(n)
+    grad = np.array([grad_p.sum(), grad_q.sum(), grad_v.sum()])
+    value = -ll.sum() / count + CLV_PENALIZER * (log_params @ log_params)
+    return value, -grad * params / count + 2 * CLV_PENALIZER * log_params
+
+
+def gamma_gamma_expected_spend(params, n, m):
+    """Panier moyen attendu sachant n achats de panier moyen m (moyenne observée si q <= 1)."""
+    p, q, v = params
+    if q <= 1:
+        return np.asarray(m, dtype=float)
+    return p * (v + n * m) / (p * n + q - 1)
+
+
+# ============ AJUSTEMENT ET PRÉDICTION ============
+
+@traced()
+@st.cache_data(show_spinner=False)
+def fit_clv_models(_rfm_df, filter_key):
+    """
+    Ajuste BG/NBD et Gamma-Gamma (paramètres mis en cache par version de données et filtres)
+
+    Args:
+        _rfm_df: Sortie de compute_rfm (non hachée)
+        filter_key: État des filtres (voir data_loader.filter_state), clé du cache
+
+    Returns:
+        Dictionnaire : bgnbd et gamma_gamma (paramètres nommés), n_customers,
+        n_tuples (triplets distincts), iterations, log_likelihood
+    """
+    inputs = clv_inputs(_rfm_df)
+    x, t_x, T, weights, _ = compress_tuples(inputs['x'], inputs['t_x'], inputs['T'])
+
+    bgnbd_log, bgnbd_value, bgnbd_iterations = _minimize(
+        lambda theta: bgnbd_negative_log_likelihood(theta, x, t_x, T, weights),
+        np.zeros(len(BGNBD_PARAMS))
+    )
+
+    positive = inputs['m'] > 0
+    gg_log, gg_value, gg_iterations = _minimize(
+        lambda theta: gamma_gamma_negative_log_likelihood(theta, inputs['n'][positive], inputs['m'][positive]),
+        np.zeros(len(GAMMA_GAMMA_PARAMS))
+    )
+
+    return {
+        'bgnbd': dict(zip(BGNBD_PARAMS, np.exp(bgnbd_log).tolist())),
+        'gamma_gamma': dict(zip(GAMMA_GAMMA_PARAMS, np.exp(gg_log).tolist())),
+        'n_customers': len(_rfm_df),
+        'n_tuples': len(x),
+        'iterations': {'bgnbd': bgnbd_iterations, 'gamma_gamma': gg_iterations},
+        'log_likelihood': {
+            'bgnbd': float(-bgnbd_value * len(_rfm_df)),
+            'gamma_gamma': float(-gg_value * int(positive.sum()))
+        }
+    }
+
+
+@traced()
+def predict_clv(models, rfm_df, margin, discount_rate, horizon_months=CLV_HORIZON_MONTHS):
+    """
+    CLV prédite de chaque client en un appel vectorisé
+
+    Les achats attendus sont évalués à chaque fin de mois de l'horizon (par triplet
+    distinct, puis redistribués aux clients) ; les achats de chaque mois sont
+    actualisés au taux annuel discount_rate, puis multipliés par le panier
+    Gamma-Gamma et la marge.
+
+    Args:
+        models: Sortie de fit_clv_models
+        rfm_df: Sortie de compute_rfm
+        margin: Taux de marge
+        discount_rate: Taux d'actualisation annuel
+        horizon_months: Horizon (mois)
+
+    Returns:
+        DataFrame aligné sur rfm_df : CustomerID, Segment_Label, P_Alive,
+        Expected_Purchases, Expected_Spend, CLV
+    """
+    bgnbd = tuple(models['bgnbd'][name] for name in BGNBD_PARAMS)
+    gamma_gamma = tuple(models['gamma_gamma'][name] for name in GAMMA_GAMMA_PARAMS)
+    inputs = clv_inputs(rfm_df)
+    x, t_x, T, _, inverse = compress_tuples(inputs['x'], inputs['t_x'], inputs['T'])
+
+    months = np.arange(1, horizon_months + 1)
+    cumulative = bgnbd_expected_purchases(bgnbd, months[None, :] * WEEKS_PER_MONTH, x[:, None], t_x[:, None], T[:, None])
+    monthly = np.diff(cumulative, axis=1, prepend=0)
+    discounted = monthly @ (1 + discount_rate) ** (-months / 12)
+
+    expected_spend = gamma_gamma_expected_spend(gamma_gamma, inputs['n'], inputs['m'])
+    return pd.DataFrame({
+        'CustomerID': rfm_df['CustomerID'].to_numpy(),
+        'Segment_Label': rfm_df['Segment_Label'].to_numpy(),
+        'P_Alive': bgnbd_probability_alive(bgnbd, x, t_x, T)[inverse],
+        'Expected_Purchases': cumulative[:, -1][inverse],
+        'Expected_Spend': expected_spend,
+        'CLV': margin * expected_spend * discounted[inverse]
+    })
@@ -1,12 +1,161 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 import pandas as pd
+import streamlit as st
+
+from utils.data_loader import month_label
+from utils.tracing import traced
+
+# Nombre maximal d'éléments (réplicats × clients) tirés par lot de bootstrap
+BOOTSTRAP_BATCH_ELEMENTS = 2_000_000
+# Réplicats par tâche : découpage fixe pour que la graine ne dépende pas de n_jobs
+BOOTSTRAP_CHUNK_REPLICATES = 500
+# En dessous de ce volume de travail, un pool de processus coûte plus qu'il ne rapporte
+BOOTSTRAP_PARALLEL_THRESHOLD = 50_000_000
+
+
+def cohort_month_index(df):
+    """
+    MonthIndex du premier achat de chaque ligne dans la fenêtre filtrée
 
+    La cohorte suit les filtres actifs (premier achat dans la fenêtre, pas sur toute
+    la base) : réduction entière, sans conversion en Period.
+    """
+    return df.groupby('Customer ID')['MonthIndex'].transform('min')
+
+
+@traced()
 def compute_cohorts(df):
-    df_c = df[['Customer ID', 'InvoiceDate']].drop_duplicates()
-    df_c['OrderMonth'] = df_c['InvoiceDate'].dt.to_period('M')
-    df_c['CohortMonth'] = df_c.groupby('Customer ID')['InvoiceDate'].transform('min').dt.to_period('M')
-    df_cohort = df_c.groupby(['CohortMonth', 'OrderMonth']).agg(n_customers=('Customer ID', 'nunique')).reset_index()
-    df_cohort['PeriodNumber'] = (df_cohort.OrderMonth - df_cohort.CohortMonth).apply(lambda x: x.n)
+    df_c = df[['Customer ID', 'MonthIndex']].drop_duplicates()
+    df_c['CohortMonth'] = cohort_month_index(df_c)
+    df_c['PeriodNumber'] = df_c['MonthIndex'] - df_c['CohortMonth']
+    df_cohort = df_c.groupby(['CohortMonth', 'PeriodNumber']).size().rename('n_customers').reset_index()
     cohort_pivot = df_cohort.pivot_table(index='CohortMonth', columns='PeriodNumber', values='n_customers')
+    cohort_pivot.index = pd.Index(month_label(cohort_pivot.index), name='CohortMonth')
     cohort_size = cohort_pivot.iloc[:, 0]
     retention_matrix = cohort_pivot.divide(cohort_size, axis=0)
-    return retention_matrix, cohort_size
\ No newline at end of file
+    return retention_matrix, cohort_size
+
+
+@traced()
+def customer_activity(df, max_period=12):
+    """
+    Construit la matrice d'activité client × période (M+0 à M+max_period)
+
+    Args:
+        df: Transactions filtrées
+        max_period: Dernière période suivie (défaut: M+12)
+
+    Returns:
+        Tuple (active, cohort_month, last_month) :
+        - active : matrice booléenne (n_clients, max_period + 1), triée par cohorte
+        - cohort_month : index entier du mois d'acquisition de chaque client (même ordre)
+        - last_month : index entier du dernier mois observé
+    """
+    month = df['MonthIndex'].to_numpy()
+    codes, uniques = pd.factorize(df['Customer ID'])
+
+    first_month = np.full(len(uniques), month.max(), dtype=month.dtype)
+    np.minimum.at(first_month, codes, month)
+
+    age = month - first_month[codes]
+    keep = age <= max_period
+    active = np.zeros((len(uniques), max_period + 1), dtype=bool)
+    active[codes[keep], age[keep]] = True
+
+    order = np.argsort(first_month, kind='stable')
+    return active[order], first_month[order], int(month.max())
+
+
+def _retention_weights(active, cohort_month, last_month):
+    """
+    Poids tels que (poids × activité).sum(axis=0) = rétention moyenne des cohortes observables
+
+    Une cohorte n'entre dans la moyenne de la période M+p que si M+p est déjà écoulé.
+    """
+    _, starts, sizes = np.unique(cohort_month, return_index=True, return_counts=True)
+    sizes_per_customer = np.repeat(sizes, sizes)
+    starts_per_customer = np.repeat(starts, sizes)
+
+    periods = np.arange(active.shape[1])
+    observable = cohort_month[:, None] + periods[None, :] <= last_month
+    n_cohorts = observable[starts].sum(axis=0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weights = np.where(observable, 1.0 / (sizes_per_customer[:, None] * n_cohorts[None, :]), 0.0)
+    return active * weights, starts_per_customer, sizes_per_customer, n_cohorts
+
+
+def _bootstrap_chunk(weighted, starts, sizes, n_replicates, seed):
+    """Tire n_replicates rééchantillonnages (clients tirés dans leur cohorte) par lots vectorisés."""
+    rng = np.random.default_rng(seed)
+    n_customers = weighted.shape[0]
+    batch = max(1, BOOTSTRAP_BATCH_ELEMENTS // max(n_customers, 1))
+
+    results = []
+    for done in range(0, n_replicates, batch):
+        b = min(batch, n_replicates - done)
+        # Indices entiers des clients tirés, chaque position restant dans sa cohorte
+        idx = starts + rng.integers(0, sizes, size=(b, n_customers))
+        flat = (np.arange(b)[:, None] * n_customers + idx).ravel()
+        counts = np.bincount(flat, minlength=b * n_customers).reshape(b, n_customers)
+        results.append(counts @ weighted)
+    return np.vstack(results)
+
+
+@traced()
+@st.cache_data(show_spinner=False)
+def bootstrap_retention_curve(active, cohort_month, last_month, n_boot=2000, ci=0.95, seed=42, n_jobs=None):
+    """
+    Courbe de rétention moyenne avec intervalle de confiance bootstrap
+
+    Les clients sont rééchantillonnés avec remise à l'intérieur de leur cohorte.
+    Chaque lot de réplicats se résume à un produit matriciel (comptes × activité pondérée).
+
+    Args:
+        active, cohort_month, last_month: Sortie de customer_activity()
+        n_boot: Nombre de réplicats bootstrap
+        ci: Niveau de confiance (défaut: 95%)
+        seed: Graine (résultats identiques quel que soit n_jobs)
+        n_jobs: Nombre de processus (None = automatique selon le volume)
+
+    Returns:
+        DataFrame indexé par PeriodNumber : Rétention, Borne_Basse, Borne_Haute, Cohortes
+    """
+    columns = ['Rétention', 'Borne_Basse', 'Borne_Haute', 'Cohortes']
+    if len(active) == 0:
+        return pd.DataFrame(columns=columns)
+
+    weighted, starts, sizes, n_cohorts = _retention_weights(active, cohort_month, last_month)
+    point = weighted.sum(axis=0)
+
+    if n_jobs is None:
+        work = n_boot * weighted.shape[0]
+        n_jobs = min(4, os.cpu_count() or 1) if work >= BOOTSTRAP_PARALLEL_THRESHOLD else 1
+
+    chunk_sizes = [min(BOOTSTRAP_CHUNK_REPLICATES, n_boot - i) for i in range(0, n_boot, BOOTSTRAP_CHUNK_REPLICATES)]
+    n_chunks = len(chunk_sizes)
+    seeds = np.random.SeedSequence(seed).spawn(n_chunks)
+
+    if n_jobs > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            chunks = list(pool.map(
+                _bootstrap_chunk,
+                [weighted] * n_chunks, [starts] * n_chunks, [sizes] * n_chunks, chunk_sizes, seeds
+            ))
+    else:
+        chunks = [_bootstrap_chunk(weighted, starts, sizes, n, s) for n, s in zip(chunk_sizes, seeds)]
+    replicates = np.vstack(chunks)
+
+    alpha = (1 - ci) / 2
+    lower, upper = np.quantile(replicates, [alpha, 1 - alpha], axis=0)
+
+    curve = pd.DataFrame({
+        'Rétention': point,
+        'Borne_Basse': lower,
+        'Borne_Haute': upper,
+        'Cohortes': n_cohorts
+    }, index=pd.Index(np.arange(len(point)), name='PeriodNumber'))
+    return curve[curve['Cohortes'] > 0]
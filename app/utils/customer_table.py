@@ -0,0 +1,169 @@
+"""
+Table clients paginée côté serveur : index de tri et index de préfixe construits une fois par résultat RFM
+"""
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils.tracing import traced
+from utils.visualization import show_table
+
+# Colonnes affichées (nom source -> libellé) et colonnes triables
+CUSTOMER_COLUMNS = {
+    'CustomerID': 'Customer ID',
+    'Segment_Label': 'Segment',
+    'Monetary': 'CLV (£)',
+    'Frequency': 'Fréquence',
+    'Recency': 'Récence (j)',
+    'R_Score': 'R Score',
+    'F_Score': 'F Score',
+    'M_Score': 'M Score'
+}
+SORT_COLUMNS = ('Monetary', 'Frequency', 'Recency', 'CustomerID', 'Segment_Label')
+
+PAGE_SIZES = (25, 50, 100, 250)
+
+
+@traced()
+@st.cache_resource(show_spinner=False, max_entries=8)
+def build_customer_index(_rfm_df, filter_key, segment_rules):
+    """
+    Index de la table client, partagé en lecture seule entre les sessions
+
+    Chaque colonne triable reçoit une permutation (tri stable, égalités départagées
+    par l'ID client) et son rang inverse ; les ID triés permettent de trouver par
+    dichotomie tous les clients dont l'ID commence par un préfixe.
+
+    Args:
+        _rfm_df: Sortie de compute_rfm (non hachée)
+        filter_key: État des filtres (voir data_loader.filter_state), clé du cache
+        segment_rules: Règles de segmentation en vigueur (les libellés en dépendent), clé du cache
+
+    Returns:
+        Dictionnaire : frame, orders, ranks, ids_sorted, ids_order, segments, segment_codes
+    """
+    frame = _rfm_df[list(CUSTOMER_COLUMNS)].reset_index(drop=True)
+    ids = frame['CustomerID'].astype(str).to_numpy()
+
+    ids_order = np.argsort(ids, kind='stable')
+    orders, ranks = {}, {}
+    for column in SORT_COLUMNS:
+        if column == 'CustomerID':
+            order = ids_order
+        else:
+            values = frame[column]
+            keys = values.cat.codes if isinstance(values.dtype, pd.CategoricalDtype) else values
+            order = np.lexsort((ids, keys.to_numpy()))
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+        orders[column], ranks[column] = order, rank
+
+    segment_codes, segments = pd.factorize(frame['Segment_Label'], sort=True)
+    return {
+        'frame': frame,
+        'orders': orders,
+        'ranks': ranks,
+        'ids_sorted': ids[ids_order],
+        'ids_order': ids_order,
+        'segments': list(segments),
+        'segment_codes': segment_codes
+    }
+
+
+def _prefix_rows(index, prefix):
+    """Lignes dont l'ID client commence par prefix (deux dichotomies sur les ID triés)."""
+    ids_sorted = index['ids_sorted']
+    start = np.searchsorted(ids_sorted, prefix, side='left')
+    stop = np.searchsorted(ids_sorted, prefix + '\uffff', side='left')
+    return index['ids_order'][start:stop]
+
+
+def query_customers(index, sort_by='Monetary', descending=True, page=1, page_size=PAGE_SIZES[0],
+                    segments=None, prefix=''):
+    """
+    Page visible de la table client
+
+    Sans recherche, la permutation de tri précalculée est filtrée par masque
+    (segments) ; avec un préfixe, seules les lignes trouvées sont triées par leur rang.
+    Seule la tranche visible est matérialisée en DataFrame.
+
+    Args:
+        index: Sortie de build_customer_index
+        sort_by: Colonne de tri (voir SORT_COLUMNS)
+        descending: Tri décroissant
+        page: Numéro de page (à partir de 1)
+        page_size: Lignes par page
+        segments: Segments retenus (None : tous)
+        prefix: Début de l'ID client recherché
+
+    Returns:
+        Tuple (DataFrame de la page, nombre total de clients correspondants)
+
+    Raises:
+        ValueError: Si la colonne de tri n'est pas indexée
+    """
+    if sort_by not in index['orders']:
+        raise ValueError(f"Colonne de tri non indexée : {sort_by}")
+
+    segment_mask = None
+    if segments is not None:
+        segments = set(segments)
+        wanted = [code for code, name in enumerate(index['segments']) if name in segments]
+        segment_mask = np.isin(index['segment_codes'], wanted)
+
+    prefix = prefix.strip()
+    if prefix:
+        rows = _prefix_rows(index, prefix)
+        if segment_mask is not None:
+            rows = rows[segment_mask[rows]]
+        rank = index['ranks'][sort_by][rows]
+        matched = rows[np.argsort(-rank if descending else rank)]
+    else:
+        matched = index['orders'][sort_by]
+        if descending:
+            matched = matched[::-1]
+        if segment_mask is not None:
+            matched = matched[segment_mask[matched]]
+
+    start = (max(page, 1) - 1) * page_size
+    return index['frame'].iloc[matched[start:start + page_size]], len(matched)
+
+
+def customer_explorer(index, key, segments=None):
+    """
+    Explorateur client : recherche par préfixe d'ID, tri et pagination côté serveur
+
+    À appeler depuis un fragment : seule la page affichée est envoyée au navigateur.
+
+    Args:
+        index: Sortie de build_customer_index
+        key: Préfixe des clés de widgets (unique par page)
+        segments: Segments retenus (None : tous)
+    """
+    col_search, col_sort, col_order, col_size = st.columns([2, 2, 1, 1])
+    prefix = col_search.text_input("Rechercher un Customer ID", key=f"{key}_prefix", placeholder="ex : 123")
+    sort_by = col_sort.selectbox(
+        "Trier par", SORT_COLUMNS, format_func=CUSTOMER_COLUMNS.get, key=f"{key}_sort"
+    )
+    descending = col_order.radio("Ordre", ["↓", "↑"], horizontal=True, key=f"{key}_order") == "↓"
+    page_size = col_size.selectbox("Lignes", PAGE_SIZES, key=f"{key}_size")
+
+    # Nombre de pages connu avant le widget de page : la page demandée est ramenée dans les bornes
+    page_key = f"{key}_page"
+    page = st.session_state.get(page_key, 1)
+    page_df, total = query_customers(index, sort_by, descending, page, page_size, segments, prefix)
+    n_pages = max(1, -(-total // page_size))
+    if page > n_pages:
+        page = n_pages
+        page_df, total = query_customers(index, sort_by, descending, page, page_size, segments, prefix)
+    st.session_state[page_key] = page
+
+    show_table(
+        page_df.rename(columns=CUSTOMER_COLUMNS),
+        formats={'CLV (£)': 'decimal', 'Fréquence': 'int', 'Récence (j)': 'int'}
+    )
+
+    col_page, col_caption = st.columns([1, 3])
+    col_page.number_input("Page", min_value=1, max_value=n_pages, step=1, key=page_key)
+    first = (page - 1) * page_size + 1 if total else 0
+    col_caption.caption(f"Clients {first:,} à {min(page * page_size, total):,} sur {total:,} ({n_pages:,} pages)")
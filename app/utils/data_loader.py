@@ -1,32 +1,151 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import os
+import sys
+import glob
+import importlib.util
+
+from utils.hyperloglog import hll_relative_error
+from utils.tracing import traced, start_trace, TRACE_TOGGLE_KEY
 
 # Chemin relatif vers les données (à adapter selon ta config)
 DATA_PATH = os.path.join(os.path.dirname(__file__), '../../data/raw/online_retail_II.xlsx')
 
-# Variables globales pour passer les filtres entre les pages
-date_range = None
-selected_countries = None
-return_mode = None
+# Copie colonnaire persistée du jeu nettoyé (Parquet, si pyarrow est installé) : évite de
+# relire le fichier Excel à chaque démarrage à froid de l'app ou exécution planifiée
+DATASET_CACHE_DIR = os.environ.get(
+    "RETAIL_DATASET_CACHE", os.path.join(os.path.dirname(__file__), '../../data/cache')
+)
+PARQUET_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+# Version du nettoyage (colonnes, types, clés temporelles) : à incrémenter à chaque
+# modification de load_data ou add_time_keys, pour ne pas relire une copie périmée
+DATASET_CACHE_SCHEMA = 2
+
+# Clé de session des filtres appliqués par sidebar_filters. Les filtres sont propres à
+# chaque session : des variables de module seraient partagées par toutes les sessions du
+# processus, et une session pourrait mettre en cache son jeu sous la clé d'une autre.
+FILTERS_KEY = "active_filters"
+
+
+
+def dataset_version(file_path):
+    """Identifiant de version du fichier source (date de modification + taille)."""
+    stat = os.stat(file_path)
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+def add_time_keys(df):
+    """
+    Matérialise les clés temporelles entières dérivées de InvoiceDate
+
+    Colonnes ajoutées (int32, conservées telles quelles par les filtres) :
+    - DayIndex : jours depuis le 1970-01-01
+    - MonthIndex : année × 12 + (mois - 1)
+
+    Les semaines se déduisent de DayIndex par week_index, sur le cube quotidien.
+    """
+    df['DayIndex'] = df['InvoiceDate'].to_numpy().astype('datetime64[D]').astype(np.int64).astype(np.int32)
+    df['MonthIndex'] = (df['InvoiceDate'].dt.year * 12 + df['InvoiceDate'].dt.month - 1).astype(np.int32)
+    return df
+
+
+def month_label(month_index):
+    """Convertit un (ou des) MonthIndex en libellé 'AAAA-MM'."""
+    if np.ndim(month_index) == 0:
+        return f"{month_index // 12}-{month_index % 12 + 1:02d}"
+    return [f"{m // 12}-{m % 12 + 1:02d}" for m in month_index]
+
+
+def day_index(date):
+    """DayIndex d'une date Python (même référence que la colonne DayIndex)."""
+    return (pd.Timestamp(date).normalize() - pd.Timestamp('1970-01-01')).days
+
+
+def week_index(day):
+    """
+    Semaine (commençant le lundi) d'un ou plusieurs DayIndex
+
+    Le DayIndex 0 (01/01/1970) est un jeudi : le décalage de 3 jours regroupe du
+    lundi au dimanche. Le lundi de la semaine w est le DayIndex 7 × w - 3.
+    """
+    return (day + 3) // 7
 
 
+def dataset_cache_path(file_path, version):
+    """Chemin de la copie Parquet du jeu nettoyé pour une version du fichier source et du nettoyage."""
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    return os.path.join(DATASET_CACHE_DIR, f"{stem}-s{DATASET_CACHE_SCHEMA}-{version}.parquet")
+
+
+def write_dataset_cache(df, file_path, version):
+    """
+    Persiste le jeu nettoyé en Parquet (écriture atomique), puis supprime les
+    copies des versions précédentes du même fichier source
+
+    Au mieux : une colonne que pyarrow ne sait pas typer laisse simplement le
+    jeu sans copie persistée, et les anciennes copies restent en place. Une
+    copie périmée peut être supprimée par un autre processus au même moment :
+    ce cas est ignoré.
+    """
+    path = dataset_cache_path(file_path, version)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(DATASET_CACHE_DIR, exist_ok=True)
+        df.to_parquet(tmp_path)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    for stale in glob.glob(os.path.join(DATASET_CACHE_DIR, f"{glob.escape(stem)}-*.parquet")):
+        if stale != path:
+            try:
+                os.remove(stale)
+            except FileNotFoundError:
+                pass
+
+
+@traced()
 @st.cache_data
-def load_data(file_path):
+def load_data(file_path, version=None):
+    """
+    Charge et nettoie le fichier source (mis en cache par version du fichier)
+
+    Avec une version et pyarrow, le jeu nettoyé est relu depuis sa copie Parquet
+    persistée (voir DATASET_CACHE_DIR) ; à défaut, le fichier Excel est lu,
+    nettoyé puis persisté pour les exécutions suivantes.
+
+    Args:
+        file_path: Chemin du fichier Excel
+        version: Version du fichier (voir dataset_version), sert de clé de cache
+    """
+    persist = version is not None and PARQUET_AVAILABLE
+    if persist:
+        try:
+            return pd.read_parquet(dataset_cache_path(file_path, version))
+        except FileNotFoundError:
+            # Pas encore persistée, ou supprimée par une exécution concurrente
+            pass
     try:
         df = pd.read_excel(file_path, sheet_name=0)
         df = df.dropna(subset=['Customer ID'])
         df['InvoiceDate'] = pd.to_datetime(df['InvoiceDate'])
         df['TotalPrice'] = df['Quantity'] * df['Price']
         df['Customer ID'] = df['Customer ID'].astype(int).astype(str)
+        df = add_time_keys(df)
+        if persist:
+            write_dataset_cache(df, file_path, version)
         return df
     except Exception as e:
         st.error(f"Erreur chargement: {e}. Vérifiez le chemin : {file_path}")
         return None
 
 
+@traced()
 def filter_data(df, date_range, countries, return_mode):
-    mask = (df['InvoiceDate'].dt.date >= date_range[0]) & (df['InvoiceDate'].dt.date <= date_range[1])
+    mask = (df['DayIndex'] >= day_index(date_range[0])) & (df['DayIndex'] <= day_index(date_range[1]))
     if countries: mask = mask & (df['Country'].isin(countries))
     df_filtered = df.loc[mask].copy()
     if return_mode == "Exclure les retours":
@@ -36,9 +155,37 @@ def filter_data(df, date_range, countries, return_mode):
     return df_filtered
 
 
+def build_filter_key(version, date_range, countries, return_mode):
+    """Clé hachable décrivant le jeu de données et des filtres (clé de cache)."""
+    dates = tuple(str(d) for d in date_range) if date_range else ()
+    return version, dates, tuple(sorted(countries)) if countries else (), return_mode
+
+
+def active_filters():
+    """
+    Filtres appliqués par sidebar_filters lors de la dernière exécution complète de la session
+
+    Returns:
+        Dictionnaire : data_version, date_range, countries, return_mode,
+        approx_distinct et key (voir build_filter_key), ou None avant le premier chargement
+    """
+    return st.session_state.get(FILTERS_KEY)
+
+
+def filter_state():
+    """
+    Clé de cache des filtres actifs de la session (voir active_filters)
+
+    À lire dans l'exécution complète qui a appelé sidebar_filters, puis à passer
+    explicitement aux fonctions mises en cache et aux fragments.
+    """
+    return active_filters()['key']
+
+
 def sidebar_filters():
     """Génère la sidebar et retourne le dataframe filtré."""
-    global date_range, selected_countries, return_mode
+    # Mode debug : trace l'exécution de la page appelante (valeur du toggle à l'exécution précédente)
+    start_trace(st.session_state.get(TRACE_TOGGLE_KEY, False), os.path.basename(sys._getframe(1).f_code.co_filename))
     
     st.sidebar.title("🛍️ Retail Analytics")
     st.sidebar.markdown("---")
@@ -51,7 +198,8 @@ def sidebar_filters():
         return None, None
 
     with st.spinner('Chargement...'):
-        df_raw = load_data(DATA_PATH)
+        data_version = dataset_version(DATA_PATH)
+        df_raw = load_data(DATA_PATH, data_version)
 
     if df_raw is not None:
         min_date = df_raw['InvoiceDate'].min().date()
@@ -62,8 +210,28 @@ def sidebar_filters():
         selected_countries = st.sidebar.multiselect("Pays", all_countries, default=['United Kingdom'])
         return_mode = st.sidebar.radio("Mode Retours",
                                        ["Exclure les retours", "Inclure tout", "Uniquement les retours"])
+        approx_distinct = st.sidebar.toggle(
+            "Comptages approximatifs (HLL)",
+            value=False,
+            help=f"Clients et produits distincts estimés par HyperLogLog : coût constant quel que soit "
+                 f"le volume, erreur type ±{hll_relative_error():.1%}"
+        )
+        st.sidebar.toggle(
+            "Mode debug (traces)",
+            key=TRACE_TOGGLE_KEY,
+            help="Affiche la durée, les lignes traitées et la mémoire de chaque calcul et section de page, "
+                 "et les enregistre en JSON lines"
+        )
 
         if len(date_range) == 2:
+            st.session_state[FILTERS_KEY] = {
+                'data_version': data_version,
+                'date_range': tuple(date_range),
+                'countries': list(selected_countries),
+                'return_mode': return_mode,
+                'approx_distinct': approx_distinct,
+                'key': build_filter_key(data_version, date_range, selected_countries, return_mode)
+            }
             df_filtered = filter_data(df_raw, date_range, selected_countries, return_mode)
             # On retourne aussi la date de fin pour le calcul RFM
             return df_filtered, pd.to_datetime(date_range[1])
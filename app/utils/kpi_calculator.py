@@ -0,0 +1,81 @@
+"""
+Calcul des KPIs d'en-tête en un seul passage sur les transactions filtrées
+"""
+import streamlit as st
+import numpy as np
+import pandas as pd
+
+from utils.data_loader import month_label
+from utils.tracing import traced
+
+
+@traced()
+@st.cache_data(show_spinner=False)
+def compute_kpis(_df, filter_key, top_n=8):
+    """
+    Calcule tous les KPIs d'en-tête et les petites tables d'agrégats
+
+    Chaque colonne clé est factorisée une seule fois ; tous les agrégats
+    (totaux, par pays, par mois) sont ensuite des bincount sur ces codes.
+
+    Args:
+        _df: Transactions filtrées (non hachées par le cache)
+        filter_key: État des filtres (voir data_loader.filter_state), clé du cache
+        top_n: Nombre de pays conservés dans top_countries
+
+    Returns:
+        Dictionnaire : n_lines, n_customers, n_invoices, n_countries, n_products,
+        ca_total, panier_moyen, top_countries (Country, TotalPrice) et
+        monthly (MonthIndex, YearMonth, TotalPrice, Customer ID)
+    """
+    df = _df
+    if df.empty:
+        return {
+            'n_lines': 0, 'n_customers': 0, 'n_invoices': 0, 'n_countries': 0, 'n_products': 0,
+            'ca_total': 0.0, 'panier_moyen': 0.0,
+            'top_countries': pd.DataFrame(columns=['Country', 'TotalPrice']),
+            'monthly': pd.DataFrame(columns=['MonthIndex', 'YearMonth', 'TotalPrice', 'Customer ID'])
+        }
+
+    revenue = df['TotalPrice'].to_numpy(dtype=float)
+    month = df['MonthIndex'].to_numpy()
+    customer_codes, customers = pd.factorize(df['Customer ID'])
+    country_codes, countries = pd.factorize(df['Country'])
+    n_invoices = len(pd.unique(df['Invoice']))
+    n_products = len(pd.unique(df['Description'].dropna()))
+
+    ca_total = float(revenue.sum())
+
+    # CA par pays
+    country_revenue = np.bincount(country_codes, weights=revenue, minlength=len(countries))
+    top_countries = pd.DataFrame({'Country': countries, 'TotalPrice': country_revenue})
+    top_countries = top_countries.sort_values('TotalPrice', ascending=False).head(top_n)
+
+    # CA et clients actifs par mois (paires mois × client dédoublonnées en entiers)
+    first_month = int(month.min())
+    month_codes = month - first_month
+    n_months = int(month_codes.max()) + 1
+    monthly_revenue = np.bincount(month_codes, weights=revenue, minlength=n_months)
+    pairs = np.unique(month_codes.astype(np.int64) * len(customers) + customer_codes)
+    monthly_customers = np.bincount(pairs // len(customers), minlength=n_months)
+
+    present = np.bincount(month_codes, minlength=n_months) > 0
+    month_index = np.arange(first_month, first_month + n_months)[present]
+    monthly = pd.DataFrame({
+        'MonthIndex': month_index,
+        'YearMonth': month_label(month_index),
+        'TotalPrice': monthly_revenue[present],
+        'Customer ID': monthly_customers[present]
+    })
+
+    return {
+        'n_lines': len(df),
+        'n_customers': len(customers),
+        'n_invoices': n_invoices,
+        'n_countries': len(countries),
+        'n_products': n_products,
+        'ca_total': ca_total,
+        'panier_moyen': ca_total / n_invoices if n_invoices > 0 else 0,
+        'top_countries': top_countries,
+        'monthly': monthly
+    }
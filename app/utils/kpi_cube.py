@@ -0,0 +1,314 @@
+"""
+Cube pré-agrégé (jour × pays × signe de la quantité) pour répondre aux KPIs sans relire les transactions
+"""
+import streamlit as st
+import numpy as np
+import pandas as pd
+
+from utils.data_loader import DATA_PATH, load_data, month_label, day_index, week_index
+from utils.hyperloglog import HLL_PRECISION, hll_registers, hll_estimate, hll_merge
+from utils.tracing import traced
+
+# Nombre de bits à 1 pour chaque octet (comptage des clients dans les bitmaps)
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def _popcount_rows(bitmaps):
+    """Nombre de bits à 1 par ligne d'une matrice de bitmaps uint8."""
+    return _POPCOUNT[bitmaps].sum(axis=1, dtype=np.int64)
+
+
+def _cell_codes(df):
+    """
+    Code de cellule (jour, pays, signe) de chaque transaction
+
+    Returns:
+        Tuple (cell_codes, n_cells, cell_fields, countries) où cell_fields contient
+        les colonnes day, month, country, sign décrivant chaque cellule
+    """
+    day = df['DayIndex'].to_numpy()
+    country_codes, countries = pd.factorize(df['Country'], sort=True)
+    sign = np.sign(df['Quantity'].to_numpy()).astype(np.int8)
+
+    # Clé entière unique par cellule : (jour, pays, signe) encodés en base mixte
+    day_min = int(day.min())
+    n_countries = len(countries)
+    cell_keys = ((day - day_min).astype(np.int64) * n_countries + country_codes) * 3 + (sign + 1)
+    cell_codes, cells = pd.factorize(cell_keys, sort=True)
+
+    rest, cell_sign = np.divmod(cells, 3)
+    cell_day, cell_country = np.divmod(rest, n_countries)
+    cell_day = (cell_day + day_min).astype(np.int32)
+    cell_month = pd.to_datetime(cell_day, unit='D')
+    cell_fields = {
+        'day': cell_day,
+        'month': (cell_month.year * 12 + cell_month.month - 1).to_numpy(dtype=np.int32),
+        'country': cell_country.astype(np.int16),
+        'sign': (cell_sign - 1).astype(np.int8)
+    }
+    return cell_codes, len(cells), cell_fields, countries
+
+
+@traced()
+def build_daily_cube(df):
+    """
+    Construit le cube quotidien à partir des transactions brutes
+
+    Une cellule = (DayIndex, pays, signe de Quantity). Chaque cellule porte le CA,
+    le nombre de lignes, le nombre de factures et un bitmap des clients présents
+    (exact et fusionnable par OU binaire).
+
+    Coût mémoire des bitmaps : n_cellules × n_clients / 8 octets, qui croît avec
+    la base clients (jeu d'exemple : 1 933 cellules × 1 403 clients ≈ 0.3 Mo ;
+    15 000 cellules × 6 000 clients ≈ 11 Mo ; 15 000 cellules × 1 M clients ≈ 1.9 Go).
+    Au-delà de quelques centaines de milliers de clients, préférer le mode
+    approximatif (build_distinct_sketches : taille fixe par cellule).
+
+    Args:
+        df: Transactions brutes (sortie de load_data)
+
+    Returns:
+        Dictionnaire de tableaux NumPy alignés par cellule (day, month, country,
+        sign, revenue, lines, invoices, customers) + countries (libellés)
+    """
+    cell_codes, n_cells, cell_fields, countries = _cell_codes(df)
+
+    revenue = np.bincount(cell_codes, weights=df['TotalPrice'].to_numpy(dtype=float), minlength=n_cells)
+    lines = np.bincount(cell_codes, minlength=n_cells)
+
+    # Une facture appartient à une seule cellule (même jour, même pays, même sens)
+    invoice_codes, _ = pd.factorize(df['Invoice'])
+    invoice_pairs = np.unique(cell_codes.astype(np.int64) * (invoice_codes.max() + 1) + invoice_codes)
+    invoices = np.bincount(invoice_pairs // (invoice_codes.max() + 1), minlength=n_cells)
+
+    # Bitmap des clients par cellule
+    customer_codes, customer_ids = pd.factorize(df['Customer ID'])
+    n_bytes = (len(customer_ids) + 7) // 8
+    customers = np.zeros((n_cells, n_bytes), dtype=np.uint8)
+    pairs = np.unique(cell_codes.astype(np.int64) * len(customer_ids) + customer_codes)
+    pair_cells, pair_customers = np.divmod(pairs, len(customer_ids))
+    np.bitwise_or.at(customers, (pair_cells, pair_customers >> 3), (1 << (pair_customers & 7)).astype(np.uint8))
+
+    return {
+        **cell_fields,
+        'revenue': revenue,
+        'lines': lines,
+        'invoices': invoices,
+        'customers': customers,
+        'countries': np.asarray(countries)
+    }
+
+
+@traced()
+def build_distinct_sketches(df, precision=HLL_PRECISION):
+    """
+    Sketches HyperLogLog par cellule du cube pour les comptages distincts approximatifs
+
+    Même découpage en cellules que build_daily_cube (les tableaux sont alignés).
+    Les factures n'ont pas de sketch : une facture n'appartient qu'à une cellule,
+    le cube en porte déjà le décompte exact (invoices), additif entre cellules.
+    Les descriptions manquantes ne sont pas hachées (nunique les ignore aussi).
+
+    Args:
+        df: Transactions brutes
+        precision: Précision HLL (erreur type 1.04 / sqrt(2^precision))
+
+    Returns:
+        Dictionnaire de matrices de registres : customers, products
+    """
+    cell_codes, n_cells, _, _ = _cell_codes(df)
+    described = df['Description'].notna().to_numpy()
+    return {
+        'customers': hll_registers(cell_codes, n_cells, df['Customer ID'].to_numpy(), precision),
+        'products': hll_registers(
+            cell_codes[described], n_cells, df['Description'].to_numpy()[described], precision
+        )
+    }
+
+
+def _freeze(arrays):
+    """Fige les tableaux d'un dictionnaire partagé entre sessions (lecture seule)."""
+    for values in arrays.values():
+        values.setflags(write=False)
+    return arrays
+
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def _shared_daily_cube(version, file_path):
+    """Cube partagé par toutes les sessions : tableaux en lecture seule (voir get_daily_cube)."""
+    return _freeze(build_daily_cube(load_data(file_path, version)))
+
+
+def get_daily_cube(version, file_path=DATA_PATH):
+    """
+    Cube d'une version du jeu de données (construit une fois par version)
+
+    Le jeu brut n'est relu (load_data, même clé de version) qu'à la construction :
+    le cube ne dépend que des arguments, jamais d'un état partagé entre sessions.
+    Les tableaux sont partagés sans copie (cache_resource, lecture seule) : une
+    ré-exécution ne recopie pas la matrice des bitmaps clients.
+
+    Args:
+        version: Version du jeu de données (filtres de la session), clé du cache
+        file_path: Fichier source
+
+    Returns:
+        Dictionnaire propre à l'appelant (voir build_daily_cube), tableaux figés
+    """
+    return dict(_shared_daily_cube(version, file_path))
+
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def _shared_distinct_sketches(version, file_path):
+    """Sketches partagés par toutes les sessions : registres en lecture seule."""
+    return _freeze(build_distinct_sketches(load_data(file_path, version)))
+
+
+def get_distinct_sketches(version, file_path=DATA_PATH):
+    """Sketches HLL d'une version du jeu de données (partagés sans copie, voir get_daily_cube)."""
+    return dict(_shared_distinct_sketches(version, file_path))
+
+
+def cube_mask(cube, date_range, countries, return_mode):
+    """Sélection des cellules correspondant aux filtres de la sidebar (mêmes règles que filter_data)."""
+    mask = (cube['day'] >= day_index(date_range[0])) & (cube['day'] <= day_index(date_range[1]))
+    if countries:
+        selected = np.flatnonzero(np.isin(cube['countries'], countries))
+        mask &= np.isin(cube['country'], selected)
+    if return_mode == "Exclure les retours":
+        mask &= cube['sign'] > 0
+    elif return_mode == "Uniquement les retours":
+        mask &= cube['sign'] < 0
+    return mask
+
+
+def _period_totals(keys, revenue, bitmaps, customer_sketches=None):
+    """
+    CA et clients actifs par période à partir des cellules sélectionnées
+
+    Args:
+        keys: Clé de période de chaque cellule (jour, semaine ou mois)
+        revenue, bitmaps: Colonnes du cube restreintes aux cellules sélectionnées
+        customer_sketches: Sketches HLL clients alignés (comptage approximatif) ou None
+
+    Returns:
+        Tuple (périodes triées, CA par période, clients actifs par période)
+    """
+    order = np.argsort(keys, kind='stable')
+    periods, starts = np.unique(keys[order], return_index=True)
+    if not len(periods):
+        return periods, np.array([]), np.array([], dtype=np.int64)
+    period_revenue = np.add.reduceat(revenue[order], starts)
+    if customer_sketches is None:
+        period_customers = _popcount_rows(np.bitwise_or.reduceat(bitmaps[order], starts, axis=0))
+    else:
+        period_sketches = np.maximum.reduceat(customer_sketches[order], starts, axis=0)
+        period_customers = np.round(hll_estimate(period_sketches)).astype(np.int64)
+    return periods, period_revenue, period_customers
+
+
+@traced()
+def rollup_kpis(cube, date_range, countries, return_mode, top_n=8, sketches=None):
+    """
+    Répond aux KPIs d'en-tête en agrégeant les cellules du cube
+
+    Args:
+        cube: Sortie de build_daily_cube
+        date_range, countries, return_mode: Filtres de la sidebar
+        top_n: Nombre de pays conservés dans top_countries
+        sketches: Sortie de build_distinct_sketches ; si fournie, les clients et
+            produits distincts sont estimés par HyperLogLog (factures toujours exactes)
+
+    Returns:
+        Même structure que compute_kpis : n_lines, n_customers, n_invoices,
+        n_countries, n_products (None en mode exact), ca_total, panier_moyen,
+        top_countries, monthly
+    """
+    mask = cube_mask(cube, date_range, countries, return_mode)
+    revenue = cube['revenue'][mask]
+    country = cube['country'][mask]
+    month = cube['month'][mask]
+    bitmaps = cube['customers'][mask]
+
+    ca_total = float(revenue.sum())
+    n_products = None
+    n_invoices = int(cube['invoices'][mask].sum())
+    if sketches is None:
+        n_customers = int(_POPCOUNT[np.bitwise_or.reduce(bitmaps, axis=0)].sum()) if len(bitmaps) else 0
+    elif mask.any():
+        n_customers, n_products = (
+            int(round(float(hll_estimate(hll_merge(sketches[key][mask])))))
+            for key in ('customers', 'products')
+        )
+    else:
+        n_customers = n_products = 0
+
+    # CA par pays
+    country_revenue = np.bincount(country, weights=revenue, minlength=len(cube['countries']))
+    present_countries = np.bincount(country, minlength=len(cube['countries'])) > 0
+    top_countries = pd.DataFrame({
+        'Country': cube['countries'][present_countries],
+        'TotalPrice': country_revenue[present_countries]
+    }).sort_values('TotalPrice', ascending=False).head(top_n)
+
+    # CA et clients actifs par mois : OU des bitmaps des cellules du mois
+    customer_sketches = sketches['customers'][mask] if sketches is not None else None
+    month_values, monthly_revenue, monthly_customers = _period_totals(month, revenue, bitmaps, customer_sketches)
+    monthly = pd.DataFrame({
+        'MonthIndex': month_values,
+        'YearMonth': month_label(month_values),
+        'TotalPrice': monthly_revenue,
+        'Customer ID': monthly_customers
+    })
+
+    return {
+        'n_lines': int(cube['lines'][mask].sum()),
+        'n_customers': n_customers,
+        'n_invoices': n_invoices,
+        'n_countries': int(present_countries.sum()),
+        'n_products': n_products,
+        'ca_total': ca_total,
+        'panier_moyen': ca_total / n_invoices if n_invoices > 0 else 0,
+        'top_countries': top_countries,
+        'monthly': monthly
+    }
+
+
+@traced()
+def rollup_timeseries(cube, date_range, countries, return_mode, grain="day", sketches=None):
+    """
+    Série CA / clients actifs au grain demandé, agrégée depuis le cube quotidien
+
+    Args:
+        cube: Sortie de build_daily_cube
+        date_range, countries, return_mode: Filtres de la sidebar
+        grain: 'day', 'week' (semaines commençant le lundi) ou 'month'
+        sketches: Sortie de build_distinct_sketches pour des clients actifs approximatifs
+
+    Returns:
+        DataFrame (Date, TotalPrice, Customer ID), Date = début de chaque période
+    """
+    mask = cube_mask(cube, date_range, countries, return_mode)
+    day = cube['day'][mask]
+    if grain == "day":
+        keys = day
+    elif grain == "week":
+        keys = week_index(day)
+    elif grain == "month":
+        keys = cube['month'][mask]
+    else:
+        raise ValueError(f"Grain inconnu : {grain}")
+
+    customer_sketches = sketches['customers'][mask] if sketches is not None else None
+    periods, period_revenue, period_customers = _period_totals(
+        keys, cube['revenue'][mask], cube['customers'][mask], customer_sketches
+    )
+
+    if grain == "day":
+        dates = pd.to_datetime(periods, unit='D')
+    elif grain == "week":
+        # Lundi de chaque semaine (voir week_index)
+        dates = pd.to_datetime(periods * 7 - 3, unit='D')
+    else:
+        dates = pd.to_datetime(month_label(periods), format='%Y-%m')
+    return pd.DataFrame({'Date': dates, 'TotalPrice': period_revenue, 'Customer ID': period_customers})
@@ -0,0 +1,179 @@
+"""
+Simulation Monte Carlo de la CLV : trajectoires de survie et de panier par lots NumPy, réparties sur un pool de processus
+"""
+import math
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import streamlit as st
+
+from utils.tracing import traced
+
+# Trajectoires simulées par lot (un lot = une tâche du pool, une graine dérivée)
+MC_CHUNK_PATHS = 131_072
+
+# Nombre de trajectoires par défaut et budget de latence d'une simulation (s)
+MC_DEFAULT_PATHS = 1_000_000
+MC_PATH_OPTIONS = (100_000, 250_000, 1_000_000, 2_000_000, 5_000_000)
+MC_TIME_BUDGET_S = 3.0
+
+# Concentration de la loi Beta de la rétention : incertitude sur le paramètre
+# (écart-type ≈ sqrt(r (1 - r) / (κ + 1)), soit ≈ 0.035 pour r = 0.6)
+MC_RETENTION_CONCENTRATION = 200
+
+MC_PERCENTILES = (5, 50, 95)
+MC_HISTOGRAM_BINS = 60
+MC_WORKERS = min(4, os.cpu_count() or 1)
+
+
+def simulate_chunk(seed_sequence, n_paths, spend_mean, spend_cv, margin, retention, discount,
+                   concentration=MC_RETENTION_CONCENTRATION):
+    """
+    Un lot de trajectoires client (exécuté dans un processus du pool)
+
+    Pour chaque trajectoire : rétention r ~ Beta(moyenne retention), panier par
+    période ~ Gamma(moyenne spend_mean, coefficient de variation spend_cv), durée
+    de vie L ~ Géométrique (nombre de périodes survécues, probabilité r à chaque
+    période). La CLV actualisée vaut marge × panier × Σ_{t=1..L} (1 + d)^-t, soit
+    en forme fermée marge × panier × δ (1 - δ^L) / (1 - δ) avec δ = 1 / (1 + d)
+    (L pour d = 0) : aucune boucle sur les périodes. Son espérance est la formule
+    fermée du simulateur.
+
+    Args:
+        seed_sequence: np.random.SeedSequence du lot (reproductibilité)
+        n_paths: Nombre de trajectoires
+        spend_mean, spend_cv: Moyenne et coefficient de variation du panier par période
+        margin, retention, discount: Paramètres du scénario
+        concentration: Concentration de la loi Beta de la rétention
+
+    Returns:
+        Tuple (CLV de chaque trajectoire, CLV espérée sachant la rétention tirée), en float32
+    """
+    rng = np.random.default_rng(seed_sequence)
+    retention = float(np.clip(retention, 1e-6, 1 - 1e-6))
+    r = rng.beta(retention * concentration, (1 - retention) * concentration, n_paths)
+    # Une Beta très concentrée près de 1 renvoie exactement 1.0 : geometric(0) lèverait une erreur
+    r = np.minimum(r, np.nextafter(1.0, 0.0))
+
+    if spend_cv > 0:
+        shape = 1 / spend_cv ** 2
+        spend = rng.gamma(shape, spend_mean / shape, n_paths)
+    else:
+        spend = np.full(n_paths, float(spend_mean))
+
+    # Périodes survécues : échecs avant le premier départ (probabilité 1 - r)
+    lifetime = rng.geometric(1 - r) - 1
+    if discount == 0:
+        # δ = 1 : la somme géométrique vaut L (la forme fermée donnerait 0 / 0)
+        annuity = lifetime.astype(float)
+    else:
+        delta = 1 / (1 + discount)
+        annuity = delta * (1 - delta ** lifetime) / (1 - delta)
+
+    clv = margin * spend * annuity
+    expected_clv = spend_mean * margin * r / (1 + discount - r)
+    return clv.astype(np.float32), expected_clv.astype(np.float32)
+
+
+@st.cache_resource(show_spinner=False)
+def _simulation_pool():
+    """Pool de processus partagé par toutes les sessions (None sur une machine à un seul cœur)."""
+    if MC_WORKERS < 2:
+        return None
+    return ProcessPoolExecutor(max_workers=MC_WORKERS)
+
+
+def _percentiles(values):
+    return dict(zip(MC_PERCENTILES, np.percentile(values, MC_PERCENTILES).tolist()))
+
+
+def simulate_clv_paths(spend_mean, spend_cv, margin, retention, discount, n_paths=MC_DEFAULT_PATHS, seed=0,
+                       time_budget=math.inf, pool=None, workers=MC_WORKERS):
+    """
+    Distribution Monte Carlo de la CLV
+
+    Les trajectoires sont découpées en lots de MC_CHUNK_PATHS dont les graines
+    dérivent de seed (SeedSequence.spawn) : le résultat ne dépend ni du nombre
+    de processus ni de l'ordre d'achèvement. Les lots sont consommés dans l'ordre et
+    soumis au fil de l'eau (un par processus au plus en cours : un lot déjà démarré
+    ne peut plus être annulé). Si le budget de latence est dépassé, aucun lot n'est
+    plus soumis et la distribution porte sur les lots terminés (n_paths du résultat).
+
+    Args:
+        spend_mean, spend_cv: Panier moyen et coefficient de variation
+        margin, retention, discount: Paramètres du scénario
+        n_paths: Nombre de trajectoires demandées
+        seed: Graine de la simulation
+        time_budget: Budget de latence (s)
+        pool: Pool de processus (None : lots exécutés dans le processus courant)
+        workers: Lots en cours simultanément sur le pool
+
+    Returns:
+        Dictionnaire : n_paths, clv_mean, clv (percentiles individuels),
+        expected_clv (percentiles de la CLV espérée, incertitude sur la rétention),
+        histogram (effectifs, bornes)
+    """
+    n_chunks = max(1, -(-n_paths // MC_CHUNK_PATHS))
+    sizes = [min(MC_CHUNK_PATHS, n_paths - i * MC_CHUNK_PATHS) for i in range(n_chunks)]
+    seeds = np.random.SeedSequence(seed).spawn(n_chunks)
+    params = (spend_mean, spend_cv, margin, retention, discount)
+
+    deadline = time.perf_counter() + time_budget
+    results = []
+    if pool is None:
+        for seed_sequence, size in zip(seeds, sizes):
+            results.append(simulate_chunk(seed_sequence, size, *params))
+            if time.perf_counter() > deadline:
+                break
+    else:
+        chunks = iter(zip(seeds, sizes))
+        in_flight = deque()
+
+        def submit_next():
+            chunk = next(chunks, None)
+            if chunk is not None:
+                in_flight.append(pool.submit(simulate_chunk, *chunk, *params))
+
+        for _ in range(max(1, workers)):
+            submit_next()
+        while in_flight:
+            future = in_flight.popleft()
+            # Le premier lot est toujours attendu : la distribution n'est jamais vide
+            remaining = deadline - time.perf_counter()
+            timeout = None if not results or math.isinf(remaining) else max(remaining, 0)
+            try:
+                results.append(future.result(timeout=timeout))
+            except TimeoutError:
+                break
+            if time.perf_counter() > deadline:
+                break
+            submit_next()
+        for future in in_flight:
+            future.cancel()
+
+    clv = np.concatenate([chunk[0] for chunk in results])
+    expected_clv = np.concatenate([chunk[1] for chunk in results])
+    # Histogramme borné au P99.5 : la queue de la loi géométrique écraserait l'échelle
+    counts, edges = np.histogram(clv, bins=MC_HISTOGRAM_BINS, range=(0, float(np.percentile(clv, 99.5))))
+    return {
+        'n_paths': len(clv),
+        'clv_mean': float(clv.mean()),
+        'clv': _percentiles(clv),
+        'expected_clv': _percentiles(expected_clv),
+        'histogram': (counts, edges)
+    }
+
+
+@traced()
+@st.cache_data(show_spinner=False, max_entries=32)
+def simulate_clv(spend_mean, spend_cv, margin, retention, discount, n_paths=MC_DEFAULT_PATHS, seed=0,
+                 time_budget=MC_TIME_BUDGET_S):
+    """
+    Distribution Monte Carlo de la CLV sur le pool partagé, dans le budget de latence
+    (mise en cache par jeu de paramètres ; voir simulate_clv_paths)
+    """
+    return simulate_clv_paths(spend_mean, spend_cv, margin, retention, discount, n_paths, seed,
+                              time_budget, _simulation_pool(), MC_WORKERS)
@@ -1,23 +1,51 @@
 import pandas as pd
 import numpy as np
+import streamlit as st
 
+from utils.tracing import traced
+from utils.segment_rules import compile_saved_segment_rules, compile_segment_rules
 
-def compute_rfm(df, analysis_date):
+
+def segment_labels(r_score, f_score, m_score, rules=None):
+    """
+    Segment RFM de chaque triplet de scores (1 à 4), en tableau
+
+    Args:
+        r_score, f_score, m_score: Scores alignés (Series, tableaux ou catégories)
+        rules: Règles de segmentation (défaut : règles enregistrées, compilées une fois
+            par version du fichier, voir compile_saved_segment_rules)
+
+    Returns:
+        Tableau de libellés de segment
+    """
+    assign = compile_segment_rules(rules) if rules is not None else compile_saved_segment_rules()
+    return assign(r_score, f_score, m_score)
+
+
+@traced()
+def compute_rfm(df, analysis_date, segment_rules=None):
     # 1. Sécurité : Si le dataframe filtré est vide, on retourne une structure vide immédiatement
     if df.empty:
         return pd.DataFrame(columns=[
-            'CustomerID', 'Recency', 'Frequency', 'Monetary',
+            'CustomerID', 'Recency', 'Frequency', 'Monetary', 'Tenure',
             'R_Score', 'F_Score', 'M_Score', 'Segment_Label'
         ])
 
-    # 2. Agrégation par client
-    rfm = df.groupby('Customer ID').agg({
-        'InvoiceDate': lambda x: (analysis_date - x.max()).days,
-        'Invoice': 'nunique',
-        'TotalPrice': 'sum'
-    }).reset_index()
+    # 2. Agrégation par client (Tenure : jours depuis le premier achat, utilisé par les modèles CLV)
+    rfm = df.groupby('Customer ID').agg(
+        Last=('InvoiceDate', 'max'),
+        First=('InvoiceDate', 'min'),
+        Frequency=('Invoice', 'nunique'),
+        Monetary=('TotalPrice', 'sum')
+    ).reset_index()
 
-    rfm.columns = ['CustomerID', 'Recency', 'Frequency', 'Monetary']
+    rfm = pd.DataFrame({
+        'CustomerID': rfm['Customer ID'],
+        'Recency': (analysis_date - rfm['Last']).dt.days,
+        'Frequency': rfm['Frequency'],
+        'Monetary': rfm['Monetary'],
+        'Tenure': (analysis_date - rfm['First']).dt.days
+    })
 
     # On ne garde que ceux qui ont un montant positif (pour éviter les erreurs de log ou bizarreries)
     rfm = rfm[rfm['Monetary'] > 0]
@@ -25,7 +53,7 @@ def compute_rfm(df, analysis_date):
     # Sécurité supplémentaire : Si après nettoyage des montants négatifs c'est vide
     if rfm.empty:
         return pd.DataFrame(columns=[
-            'CustomerID', 'Recency', 'Frequency', 'Monetary',
+            'CustomerID', 'Recency', 'Frequency', 'Monetary', 'Tenure',
             'R_Score', 'F_Score', 'M_Score', 'Segment_Label'
         ])
 
@@ -41,24 +69,29 @@ def compute_rfm(df, analysis_date):
         rfm['F_Score'] = 1
         rfm['M_Score'] = 1
 
-    # 4. Fonction de catégorisation
-    def categorize(row):
-        r = int(row['R_Score'])
-        f = int(row['F_Score'])
-        m = int(row['M_Score'])
+    # 4. Catégorisation : règles compilées, évaluées par priorité sur les 64 cellules de scores
+    rfm['Segment_Label'] = segment_labels(rfm['R_Score'], rfm['F_Score'], rfm['M_Score'], segment_rules)
 
-        fm_score = (f + m) / 2
+    return rfm
 
-        if r >= 4 and fm_score >= 3.5: return "Champions 🏆"
-        if r >= 3 and fm_score >= 2: return "Loyaux Potentiels 🌱"
-        if r >= 3 and fm_score < 2: return "Nouveaux Prometteurs 👋"
-        if r <= 2 and fm_score >= 3: return "À Risque ⚠️"
-        if r <= 2 and fm_score < 3: return "Hibernants 💤"
-        return "Autres"
 
-    # 5. Application de la catégorisation
-    # L'utilisation de result_type='reduce' peut parfois aider,
-    # mais la vérification "if rfm.empty" au début est la vraie solution.
-    rfm['Segment_Label'] = rfm.apply(categorize, axis=1)
+@traced()
+@st.cache_data(show_spinner=False, max_entries=8)
+def cached_rfm(_df, filter_key, analysis_date, segment_rules):
+    """
+    Table RFM des transactions filtrées, mise en cache par état des filtres
 
-    return rfm
+    Les pages la relisent à chaque exécution complète (widgets, téléchargements) :
+    l'agrégation par client et les quartiles ne sont recalculés qu'au changement
+    de filtres ou de règles de segmentation.
+
+    Args:
+        _df: Transactions filtrées (non hachées par le cache)
+        filter_key: État des filtres (voir data_loader.filter_state), clé du cache
+        analysis_date: Date d'analyse (Recency, Tenure)
+        segment_rules: Règles de segmentation en vigueur, clé du cache
+
+    Returns:
+        DataFrame RFM (voir compute_rfm)
+    """
+    return compute_rfm(_df, analysis_date, segment_rules)
@@ -0,0 +1,110 @@
+"""
+Cube RFM agrégé : une ligne par cellule de scores (R, F, M), 4 × 4 × 4 = 64 cellules
+"""
+import numpy as np
+import pandas as pd
+
+from utils.tracing import traced
+
+# Marge estimée appliquée au montant (hypothèse : 25% de marge moyenne)
+MARGIN_RATE = 0.25
+
+# Mesures agrégées par cellule (Margin = Monetary × MARGIN_RATE)
+RFM_MEASURES = ('Monetary', 'Margin', 'Recency', 'Frequency')
+
+N_SCORES = 4
+N_CELLS = N_SCORES ** 3
+
+
+def cell_index(r_score, f_score, m_score):
+    """Numéro de cellule (0 à 63) de chaque triplet de scores (1 à 4)."""
+    r = np.asarray(r_score, dtype=np.int64) - 1
+    f = np.asarray(f_score, dtype=np.int64) - 1
+    m = np.asarray(m_score, dtype=np.int64) - 1
+    return (r * N_SCORES + f) * N_SCORES + m
+
+
+@traced()
+def build_rfm_cube(rfm_df, margin_rate=MARGIN_RATE):
+    """
+    Agrège la table RFM client en 64 cellules (R, F, M)
+
+    Chaque cellule porte le nombre de clients, et pour chaque mesure (Monetary,
+    Margin, Recency, Frequency) la somme et la somme des carrés : moyennes et
+    écarts-types de tout regroupement de cellules s'en déduisent sans relire les clients.
+    Un seul passage bincount par mesure : pas de mise en cache.
+
+    Args:
+        rfm_df: Sortie de compute_rfm
+        margin_rate: Taux de marge appliqué au montant
+
+    Returns:
+        DataFrame de 64 lignes : R_Score, F_Score, M_Score, RFM_Code, Clients,
+        <mesure>_sum et <mesure>_sumsq pour chaque mesure
+    """
+    scores = np.arange(N_CELLS)
+    cube = pd.DataFrame({
+        'R_Score': scores // (N_SCORES * N_SCORES) + 1,
+        'F_Score': scores // N_SCORES % N_SCORES + 1,
+        'M_Score': scores % N_SCORES + 1
+    })
+    cube['RFM_Code'] = cube['R_Score'].astype(str) + cube['F_Score'].astype(str) + cube['M_Score'].astype(str)
+
+    if rfm_df.empty:
+        cells = np.array([], dtype=np.int64)
+        values = {measure: np.array([]) for measure in RFM_MEASURES}
+    else:
+        cells = cell_index(rfm_df['R_Score'], rfm_df['F_Score'], rfm_df['M_Score'])
+        monetary = rfm_df['Monetary'].to_numpy(dtype=float)
+        values = {
+            'Monetary': monetary,
+            'Margin': monetary * margin_rate,
+            'Recency': rfm_df['Recency'].to_numpy(dtype=float),
+            'Frequency': rfm_df['Frequency'].to_numpy(dtype=float)
+        }
+
+    cube['Clients'] = np.bincount(cells, minlength=N_CELLS)
+    for measure in RFM_MEASURES:
+        column = values[measure]
+        cube[f'{measure}_sum'] = np.bincount(cells, weights=column, minlength=N_CELLS)
+        cube[f'{measure}_sumsq'] = np.bincount(cells, weights=column * column, minlength=N_CELLS)
+    return cube
+
+
+def rollup_rfm_cube(cube, groups):
+    """
+    Regroupe les cellules du cube (ex : par segment) en 64 lignes au plus
+
+    Args:
+        cube: Sortie de build_rfm_cube
+        groups: Libellé de groupe de chaque cellule (tableau aligné sur les 64 lignes)
+
+    Returns:
+        DataFrame indexé par groupe (groupes sans client exclus) : Clients,
+        <mesure>_sum, <mesure>_mean, <mesure>_std pour chaque mesure et
+        R_Avg, F_Avg, M_Avg (scores moyens pondérés par le nombre de clients)
+    """
+    weighted = cube.assign(
+        R_Weighted=cube['R_Score'] * cube['Clients'],
+        F_Weighted=cube['F_Score'] * cube['Clients'],
+        M_Weighted=cube['M_Score'] * cube['Clients']
+    )
+    sum_columns = ['Clients', 'R_Weighted', 'F_Weighted', 'M_Weighted'] + [
+        f'{measure}_{stat}' for measure in RFM_MEASURES for stat in ('sum', 'sumsq')
+    ]
+    totals = weighted.groupby(np.asarray(groups), sort=False)[sum_columns].sum()
+    totals = totals[totals['Clients'] > 0]
+    totals.index.name = 'Segment'
+
+    count = totals['Clients']
+    result = pd.DataFrame({'Clients': count}, index=totals.index)
+    for measure in RFM_MEASURES:
+        mean = totals[f'{measure}_sum'] / count
+        variance = totals[f'{measure}_sumsq'] / count - mean ** 2
+        result[f'{measure}_sum'] = totals[f'{measure}_sum']
+        result[f'{measure}_mean'] = mean
+        # Écart-type de population ; clip : erreurs d'arrondi quand toutes les valeurs sont égales
+        result[f'{measure}_std'] = np.sqrt(variance.clip(lower=0))
+    for score in ('R', 'F', 'M'):
+        result[f'{score}_Avg'] = totals[f'{score}_Weighted'] / count
+    return result
@@ -0,0 +1,246 @@
+"""
+Règles de segmentation RFM déclaratives : validation, persistance JSON et compilation en masques vectorisés
+"""
+import functools
+import json
+import os
+import threading
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from utils.rfm_cube import N_SCORES, N_CELLS, cell_index
+
+# Fichier des règles éditées depuis l'interface (absent : règles par défaut)
+SEGMENT_RULES_PATH = os.environ.get(
+    "RETAIL_SEGMENT_RULES",
+    os.path.join(os.path.dirname(__file__), "..", "..", "config", "segment_rules.json")
+)
+
+# Segment attribué aux clients qu'aucune règle ne couvre
+DEFAULT_SEGMENT = "Autres"
+
+# Bornes incluses de chaque règle : scores R, F, M (1 à 4) et FM = (F + M) / 2 (pas de 0.5)
+RULE_BOUNDS = ("r_min", "r_max", "f_min", "f_max", "m_min", "m_max", "fm_min", "fm_max")
+
+# Règles historiques de categorize, évaluées dans l'ordre (la première qui correspond l'emporte)
+DEFAULT_SEGMENT_RULES = [
+    {"name": "Champions 🏆", "code": "444", "r_min": 4, "fm_min": 3.5},
+    {"name": "Loyaux Potentiels 🌱", "code": "343", "r_min": 3, "fm_min": 2},
+    {"name": "Nouveaux Prometteurs 👋", "code": "441", "r_min": 3, "fm_max": 1.5},
+    {"name": "À Risque ⚠️", "code": "244", "r_max": 2, "fm_min": 3},
+    {"name": "Hibernants 💤", "code": "111", "r_max": 2, "fm_max": 2.5}
+]
+
+
+def _bound(rule, key):
+    value = rule.get(key)
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    return float(value)
+
+
+def _text(row, key):
+    """Texte d'une cellule éditée (vide pour None, NaN ou pd.NA)."""
+    value = row.get(key)
+    if value is None or (np.isscalar(value) and pd.isna(value)):
+        return ""
+    return str(value).strip()
+
+
+def validate_segment_rules(rules):
+    """
+    Vérifie un jeu de règles
+
+    Args:
+        rules: Liste de dictionnaires {name, code, r_min, ..., fm_max} (bornes optionnelles)
+
+    Returns:
+        Liste des erreurs (vide si les règles sont valides)
+    """
+    errors = []
+    if not rules:
+        return ["Au moins une règle est nécessaire."]
+
+    names = set()
+    for position, rule in enumerate(rules, 1):
+        name = str(rule.get("name") or "").strip()
+        label = f"Règle {position} ({name or 'sans nom'})"
+        if not name:
+            errors.append(f"{label} : nom manquant.")
+        elif name in names:
+            errors.append(f"{label} : nom en double.")
+        elif name == DEFAULT_SEGMENT:
+            errors.append(f"{label} : « {DEFAULT_SEGMENT} » est réservé aux clients non couverts.")
+        names.add(name)
+
+        code = str(rule.get("code") or "")
+        if code and (len(code) != 3 or any(c not in "1234" for c in code)):
+            errors.append(f"{label} : code RFM « {code} » invalide (3 chiffres de 1 à 4).")
+
+        for key in RULE_BOUNDS:
+            value = rule.get(key)
+            if value is not None and not isinstance(value, (int, float)):
+                errors.append(f"{label} : {key} doit être un nombre.")
+                continue
+            value = _bound(rule, key)
+            if value is not None and not 1 <= value <= N_SCORES:
+                errors.append(f"{label} : {key} = {value:g} hors de [1, {N_SCORES}].")
+        for axis in ("r", "f", "m", "fm"):
+            low, high = _bound(rule, f"{axis}_min"), _bound(rule, f"{axis}_max")
+            if low is not None and high is not None and low > high:
+                errors.append(f"{label} : {axis}_min > {axis}_max.")
+    return errors
+
+
+def compile_segment_rules(rules):
+    """
+    Compile les règles en une fonction vectorisée (scores R, F, M) -> libellés
+
+    Les règles ne dépendent que du triplet de scores : elles sont évaluées une fois
+    sur les 64 cellules (masques booléens combinés par np.select, dans l'ordre de
+    priorité), puis chaque client reçoit le libellé de sa cellule par indexation.
+
+    Args:
+        rules: Règles valides (voir validate_segment_rules)
+
+    Returns:
+        Fonction (r_score, f_score, m_score) -> tableau de libellés
+
+    Raises:
+        ValueError: Si les règles sont invalides
+    """
+    errors = validate_segment_rules(rules)
+    if errors:
+        raise ValueError("Règles de segmentation invalides : " + " ".join(errors))
+
+    cells = np.arange(N_CELLS)
+    scores = {
+        "r": cells // (N_SCORES * N_SCORES) + 1,
+        "f": cells // N_SCORES % N_SCORES + 1,
+        "m": cells % N_SCORES + 1
+    }
+    scores["fm"] = (scores["f"] + scores["m"]) / 2
+
+    conditions = []
+    for rule in rules:
+        mask = np.ones(N_CELLS, dtype=bool)
+        for axis, values in scores.items():
+            low, high = _bound(rule, f"{axis}_min"), _bound(rule, f"{axis}_max")
+            if low is not None:
+                mask &= values >= low
+            if high is not None:
+                mask &= values <= high
+        conditions.append(mask)
+    names = [str(rule["name"]).strip() for rule in rules]
+    cell_labels = np.select(conditions, names, default=DEFAULT_SEGMENT).astype(object)
+
+    def assign(r_score, f_score, m_score):
+        return cell_labels[cell_index(r_score, f_score, m_score)]
+
+    return assign
+
+
+def load_segment_rules(path=None):
+    """
+    Règles enregistrées (ou règles par défaut si aucun fichier n'existe)
+
+    Un fichier illisible ou invalide (tronqué, édité à la main) ne bloque ni les
+    pages ni l'export planifié : avertissement (RuntimeWarning) et règles par défaut.
+    """
+    path = path or SEGMENT_RULES_PATH
+    if not os.path.exists(path):
+        return [dict(rule) for rule in DEFAULT_SEGMENT_RULES]
+    try:
+        with open(path, encoding="utf-8") as f:
+            rules = json.load(f)["segments"]
+        if not isinstance(rules, list) or not all(isinstance(rule, dict) for rule in rules):
+            raise ValueError("liste de règles attendue.")
+        errors = validate_segment_rules(rules)
+        if errors:
+            raise ValueError(" ".join(errors))
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        warnings.warn(f"Règles de segmentation ignorées ({path}) : {e} Règles par défaut appliquées.",
+                      RuntimeWarning, stacklevel=2)
+        return [dict(rule) for rule in DEFAULT_SEGMENT_RULES]
+    return rules
+
+
+@functools.lru_cache(maxsize=4)
+def _compiled_rules_file(path, signature):
+    return compile_segment_rules(load_segment_rules(path))
+
+
+def compile_saved_segment_rules(path=None):
+    """
+    Règles enregistrées compilées (voir compile_segment_rules), recompilées
+    seulement quand le fichier change (date de modification et taille)
+    """
+    path = path or SEGMENT_RULES_PATH
+    try:
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+    except FileNotFoundError:
+        signature = None
+    return _compiled_rules_file(path, signature)
+
+
+def save_segment_rules(rules, path=None):
+    """
+    Valide puis enregistre les règles (écriture atomique)
+
+    Raises:
+        ValueError: Si les règles sont invalides
+    """
+    errors = validate_segment_rules(rules)
+    if errors:
+        raise ValueError("Règles de segmentation invalides : " + " ".join(errors))
+    path = path or SEGMENT_RULES_PATH
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # Fichier temporaire propre à l'écrivain : les sessions sont des threads d'un même processus
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "segments": rules}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def reset_segment_rules(path=None):
+    """Supprime les règles enregistrées (retour aux règles par défaut)."""
+    path = path or SEGMENT_RULES_PATH
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def rules_to_frame(rules):
+    """Règles -> DataFrame éditable (une ligne par segment, dans l'ordre de priorité)."""
+    return pd.DataFrame(
+        [{"name": rule.get("name"), "code": rule.get("code") or "", **{key: _bound(rule, key) for key in RULE_BOUNDS}}
+         for rule in rules],
+        columns=["name", "code", *RULE_BOUNDS]
+    )
+
+
+def frame_to_rules(frame):
+    """DataFrame édité -> règles (lignes entièrement vides ignorées, bornes vides = sans limite)."""
+    rules = []
+    for row in frame.to_dict("records"):
+        if not _text(row, "name") and all(_bound(row, key) is None for key in RULE_BOUNDS):
+            continue
+        rule = {"name": _text(row, "name"), "code": _text(row, "code")}
+        for key in RULE_BOUNDS:
+            value = _bound(row, key)
+            if value is not None:
+                rule[key] = int(value) if value.is_integer() else value
+        rules.append(rule)
+    return rules
+
+
+def segment_codes(rules):
+    """Code RFM représentatif de chaque segment."""
+    return {str(rule["name"]).strip(): rule.get("code") or "---" for rule in rules}
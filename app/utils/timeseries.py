@@ -0,0 +1,144 @@
+"""
+Préparation des séries temporelles longues avant Plotly : sous-échantillonnage et choix du type de trace
+"""
+import numpy as np
+import plotly.graph_objects as go
+
+# Nombre de points conservés par série (~2 points par pixel d'un graphique pleine largeur)
+SERIES_POINT_BUDGET = 2000
+
+# Au-delà de ce nombre de points envoyés, les traces passent en WebGL (Scattergl)
+WEBGL_POINT_THRESHOLD = 1000
+
+
+def _as_float(x):
+    """Abscisses numériques (les dates sont converties en nanosecondes)."""
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype('datetime64[ns]').astype(np.int64).astype(float)
+    return x.astype(float)
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Indices retenus par Largest-Triangle-Three-Buckets
+
+    Le premier et le dernier point sont conservés ; dans chaque seau intermédiaire,
+    on garde le point formant le plus grand triangle avec le point retenu du seau
+    précédent et la moyenne du seau suivant (préserve pics et creux visibles).
+
+    Args:
+        x: Abscisses croissantes (numériques ou datetime64)
+        y: Ordonnées
+        n_out: Nombre de points à conserver (>= 3)
+
+    Returns:
+        Tableau d'indices croissants de longueur min(n_out, len(y))
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = _as_float(x)
+    y = np.asarray(y, dtype=float)
+
+    # Bornes des n_out - 2 seaux intermédiaires (le premier et le dernier point sont fixes)
+    edges = np.floor(np.linspace(1, n - 1, n_out - 1)).astype(np.int64)
+    bucket_sizes = np.diff(edges)
+    sums_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1)
+    sums_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1)
+    mean_x = np.append(sums_x / bucket_sizes, x[-1])
+    mean_y = np.append(sums_y / bucket_sizes, y[-1])
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for b in range(n_out - 2):
+        start, stop = edges[b], edges[b + 1]
+        # Aire (au facteur 1/2 près) du triangle (point précédent, candidat, moyenne du seau suivant)
+        area = np.abs(
+            (x[previous] - mean_x[b + 1]) * (y[start:stop] - y[previous])
+            - (x[previous] - x[start:stop]) * (mean_y[b + 1] - y[previous])
+        )
+        previous = start + int(np.argmax(area))
+        selected[b + 1] = previous
+    return selected
+
+
+def minmax_indices(y, n_out):
+    """
+    Indices de l'enveloppe min/max : minimum et maximum de chaque seau, dans l'ordre
+
+    Entièrement vectorisé (sans boucle par seau) et garantit que les extrêmes
+    de chaque seau restent visibles.
+
+    Args:
+        y: Ordonnées
+        n_out: Nombre de points à conserver (2 par seau)
+
+    Returns:
+        Tableau d'indices croissants (au plus n_out)
+    """
+    n = len(y)
+    n_buckets = n_out // 2
+    if n_out >= n or n_buckets < 1:
+        return np.arange(n)
+
+    y = np.asarray(y, dtype=float)
+    bucket = np.arange(n) * n_buckets // n
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+
+    # Premier indice de chaque seau atteignant le min (resp. le max) du seau
+    indices = []
+    for reduce in (np.minimum, np.maximum):
+        extreme = reduce.reduceat(y, starts)
+        hits = np.flatnonzero(y == extreme[bucket])
+        _, first = np.unique(bucket[hits], return_index=True)
+        indices.append(hits[first])
+    return np.unique(np.concatenate(indices))
+
+
+def downsample_series(x, y, max_points=SERIES_POINT_BUDGET, method="lttb"):
+    """
+    Réduit une série à au plus max_points points
+
+    Args:
+        x: Abscisses croissantes
+        y: Ordonnées
+        max_points: Budget de points
+        method: 'lttb' ou 'minmax'
+
+    Returns:
+        Tuple (x, y) sous-échantillonnés (inchangés sous le budget)
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if len(y) <= max_points:
+        return x, y
+    if method == "minmax":
+        indices = minmax_indices(y, max_points)
+    elif method == "lttb":
+        indices = lttb_indices(x, y, max_points)
+    else:
+        raise ValueError(f"Méthode de sous-échantillonnage inconnue : {method}")
+    return x[indices], y[indices]
+
+
+def time_series_trace(x, y, max_points=SERIES_POINT_BUDGET, method="lttb", **trace_kwargs):
+    """
+    Trace Plotly prête à l'affichage pour une série temporelle de taille quelconque
+
+    La série est sous-échantillonnée au budget de points, puis rendue en
+    Scattergl (WebGL) si elle dépasse WEBGL_POINT_THRESHOLD points, sinon en Scatter.
+
+    Args:
+        x, y: Série complète
+        max_points, method: Voir downsample_series
+        **trace_kwargs: Arguments passés à la trace (name, mode, line, ...)
+
+    Returns:
+        go.Scatter ou go.Scattergl
+    """
+    x, y = downsample_series(x, y, max_points, method)
+    trace_type = go.Scattergl if len(y) > WEBGL_POINT_THRESHOLD else go.Scatter
+    return trace_type(x=x, y=y, **trace_kwargs)
@@ -0,0 +1,216 @@
+"""
+Traces d'exécution : durée, lignes en entrée/sortie et variation mémoire des calculs et sections de page
+"""
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# Clé du toggle « Mode debug » de la sidebar et de la trace en cours dans st.session_state
+TRACE_TOGGLE_KEY = "trace_enabled"
+TRACE_SESSION_KEY = "_trace_run"
+
+# Fichier JSON lines des traces (une ligne par span)
+TRACE_LOG_PATH = os.environ.get(
+    "RETAIL_TRACE_FILE",
+    os.path.join(os.path.dirname(__file__), "..", "..", "logs", "traces.jsonl")
+)
+
+# Vrai dès qu'une session a activé le mode debug : tant qu'il est faux, un appel tracé
+# ne coûte qu'un test de booléen (aucun accès à st.session_state)
+_session_tracing = False
+
+# Trace de processus (scripts en ligne de commande, variable d'environnement RETAIL_TRACE=1)
+_process_run = None
+
+_log_lock = threading.Lock()
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _new_run(page):
+    return {"run_id": uuid.uuid4().hex[:8], "page": page, "records": [], "depth": 0, "seq": 0, "section": None}
+
+
+def _rss_bytes():
+    """Mémoire résidente du processus (Linux, /proc) ; None si indisponible."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _rows(obj):
+    """Nombre de lignes d'un résultat tabulaire (1er élément pour un tuple), sinon None."""
+    if isinstance(obj, tuple) and obj:
+        obj = obj[0]
+    if isinstance(obj, (pd.DataFrame, pd.Series, np.ndarray)):
+        return len(obj)
+    return None
+
+
+def _current_run():
+    if _process_run is not None:
+        return _process_run
+    if not _session_tracing:
+        return None
+    return st.session_state.get(TRACE_SESSION_KEY)
+
+
+def _write_record(record):
+    try:
+        with _log_lock:
+            os.makedirs(os.path.dirname(os.path.abspath(TRACE_LOG_PATH)), exist_ok=True)
+            with open(TRACE_LOG_PATH, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except OSError:
+        pass
+
+
+def _open_span(run, name, kind, rows_in):
+    run["depth"] += 1
+    run["seq"] += 1
+    return {
+        "seq": run["seq"],
+        "ts": datetime.now().isoformat(timespec="milliseconds"),
+        "run_id": run["run_id"],
+        "page": run["page"],
+        "name": name,
+        "kind": kind,
+        "depth": run["depth"] - 1,
+        "rows_in": rows_in,
+        "rows_out": None,
+        "_start": time.perf_counter(),
+        "_rss": _rss_bytes()
+    }
+
+
+def _close_span(run, record):
+    run["depth"] -= 1
+    start, rss = record.pop("_start"), record.pop("_rss")
+    record["wall_ms"] = round((time.perf_counter() - start) * 1000, 3)
+    rss_end = _rss_bytes()
+    record["mem_delta_mb"] = round((rss_end - rss) / 2 ** 20, 3) if rss is not None and rss_end is not None else None
+    run["records"].append(record)
+    _write_record(record)
+
+
+def start_trace(enabled, page):
+    """
+    Démarre (ou désactive) la trace de l'exécution en cours de la session
+
+    Args:
+        enabled: Valeur du toggle « Mode debug »
+        page: Nom de la page exécutée
+    """
+    global _session_tracing
+    if enabled:
+        _session_tracing = True
+        st.session_state[TRACE_SESSION_KEY] = _new_run(page)
+    elif _session_tracing:
+        st.session_state.pop(TRACE_SESSION_KEY, None)
+
+
+def enable_process_tracing(name):
+    """Active la trace pour tout le processus (scripts hors Streamlit)."""
+    global _process_run
+    _process_run = _new_run(name)
+
+
+def traced(name=None):
+    """
+    Décorateur : trace chaque appel (durée, lignes du 1er argument tabulaire et du résultat, mémoire)
+
+    À placer au-dessus de @st.cache_data pour mesurer aussi les appels servis par le cache.
+    """
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            run = _current_run()
+            if run is None:
+                return func(*args, **kwargs)
+            rows_in = next((rows for rows in map(_rows, args) if rows is not None), None)
+            record = _open_span(run, span_name, "function", rows_in)
+            try:
+                result = func(*args, **kwargs)
+                record["rows_out"] = _rows(result)
+                return result
+            finally:
+                _close_span(run, record)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def span(name, rows_in=None):
+    """
+    Contexte tracé ; l'enregistrement renvoyé accepte record['rows_out'] = ...
+
+    Renvoie None (et ne mesure rien) si la trace est désactivée.
+    """
+    run = _current_run()
+    if run is None:
+        yield None
+        return
+    record = _open_span(run, name, "span", rows_in)
+    try:
+        yield record
+    finally:
+        _close_span(run, record)
+
+
+def trace_section(name):
+    """Ferme la section de page en cours et en ouvre une nouvelle (sans ré-indenter le code de la page)."""
+    run = _current_run()
+    if run is None:
+        return
+    if run["section"] is not None:
+        _close_span(run, run["section"])
+    run["section"] = _open_span(run, name, "section", None) if name else None
+
+
+def render_trace_panel():
+    """Affiche, en fin de page, les spans de l'exécution dans la sidebar (mode debug uniquement)."""
+    trace_section(None)
+    run = _current_run()
+    if run is None or _process_run is not None:
+        return
+
+    records = pd.DataFrame(run["records"])
+    with st.sidebar.expander(" Traces d'exécution", expanded=True):
+        if records.empty:
+            st.caption("Aucun span enregistré.")
+            return
+        # Les spans sont enregistrés à leur fermeture : on les remet dans l'ordre d'ouverture
+        records = records.sort_values("seq")
+        records["name"] = ["  " * depth + name for depth, name in zip(records["depth"], records["name"])]
+        top_level = records.loc[records["depth"] == 0, "wall_ms"].sum()
+        st.caption(f"Exécution {run['run_id']} : {top_level:.0f} ms tracées, {len(records)} spans")
+        st.dataframe(
+            records[["name", "wall_ms", "rows_in", "rows_out", "mem_delta_mb"]],
+            column_config={
+                "name": "Span",
+                "wall_ms": st.column_config.NumberColumn("ms", format="%.1f"),
+                "rows_in": st.column_config.NumberColumn("Lignes in", format="%d"),
+                "rows_out": st.column_config.NumberColumn("Lignes out", format="%d"),
+                "mem_delta_mb": st.column_config.NumberColumn("Δ RSS (Mo)", format="%.1f")
+            },
+            hide_index=True,
+            use_container_width=True
+        )
+        st.caption(f"JSON lines : {os.path.relpath(TRACE_LOG_PATH)}")
+
+
+if os.environ.get("RETAIL_TRACE") == "1":
+    enable_process_tracing(os.path.basename(sys.argv[0]) or "python")
@@ -1,7 +1,20 @@
+import math
+import hashlib
+import functools
+import importlib.util
+import threading
+import zipfile
+from io import BytesIO
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
+import numpy as np
+import pandas as pd
 import plotly.graph_objects as go
 from datetime import datetime
 
+from utils.tracing import traced, span
+
 # Palette de couleurs
 COLOR_PRIMARY = "#4F46E5"
 COLOR_SUCCESS = "#10B981"
@@ -12,11 +25,39 @@ SIDEBAR_BG = "#0F172A"
 TEXT_COLOR = "#1E293B"
 LIGHT_GRAY = "#E2E8F0"
 
+# Formats d'affichage des tableaux (printf, appliqués par le navigateur : les colonnes restent numériques)
+TABLE_FORMATS = {
+    'int': "%,d",
+    'decimal': "%.1f",
+    'decimal_2': "%.2f",
+    'gbp': "£%,.0f",
+    'gbp_decimal': "£%,.1f",
+    'days': "%d j",
+    'percent': "%.1f %%"
+}
 
-def load_css():
-    st.markdown(f"""
+# Police du thème (déclarée aussi dans .streamlit/config.toml)
+THEME_FONT_URL = "https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap"
+
+# Version du style des graphiques : à incrémenter à chaque modification de style_plot/load_css
+STYLE_VERSION = 1
+
+# Budgets de rendu des heatmaps (nombre de cellules envoyées au navigateur)
+HEATMAP_CELL_BUDGET = 2500
+HEATMAP_LABEL_BUDGET = 600
+
+# Export PNG : rendus Kaleido simultanés et nombre de PNG gardés en mémoire
+PNG_EXPORT_WORKERS = 2
+PNG_CACHE_ENTRIES = 64
+
+
+@functools.lru_cache(maxsize=2)
+def _theme_css(import_font):
+    """Bloc <style> du thème, construit une fois par processus (import_font : inclure l'@import de la police)."""
+    font_import = f"@import url('{THEME_FONT_URL}');" if import_font else ""
+    return f"""
         <style>
-            @import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap');
+            {font_import}
 
             /* --- GLOBAL --- */
             .stApp {{ 
@@ -147,7 +188,21 @@ def load_css():
                 border: 1px solid #93C5FD;
             }}
         </style>
-    """, unsafe_allow_html=True)
+    """
+
+
+def load_css():
+    """
+    Injecte le thème CSS de l'application
+
+    La police Inter est chargée une fois par session par le thème Streamlit
+    (.streamlit/config.toml, [theme] font) ; l'@import Google Fonts n'est ajouté
+    au CSS que si cette configuration n'est pas active (lancement depuis app/).
+    Streamlit efface les éléments non ré-émis à chaque exécution : le bloc <style>
+    est donc renvoyé, mais construit une seule fois et strictement identique.
+    """
+    import_font = "Inter" not in str(st.get_option("theme.font") or "")
+    st.markdown(_theme_css(import_font), unsafe_allow_html=True)
 
 
 def style_plot(fig, title="", height=None, show_grid=True):
@@ -237,14 +292,287 @@ def display_active_filters(date_range, countries, return_mode):
         st.metric("🔄 Filtres", "Actifs", help="Cliquez pour modifier dans la barre latérale")
 
 
+def show_table(df, formats=None, labels=None, **kwargs):
+    """
+    Affiche un DataFrame sans le convertir en chaînes
+
+    Unités et formats sont déclarés en column_config et appliqués par le navigateur :
+    pas de formatage Python cellule par cellule, et le tri reste numérique.
+
+    Args:
+        df: Données à afficher (types numériques conservés)
+        formats: {colonne: clé de TABLE_FORMATS} (formats nommés : une même unité
+            s'affiche de la même façon dans toutes les tables)
+        labels: {colonne: libellé affiché}
+        **kwargs: Arguments passés à st.dataframe (défaut : pleine largeur, sans index)
+    """
+    formats = formats or {}
+    labels = labels or {}
+    column_config = {}
+    for column in df.columns:
+        label = labels.get(column, column)
+        if column in formats:
+            column_config[column] = st.column_config.NumberColumn(
+                label, format=TABLE_FORMATS[formats[column]]
+            )
+        elif column in labels:
+            column_config[column] = st.column_config.Column(label)
+
+    kwargs.setdefault('use_container_width', True)
+    kwargs.setdefault('hide_index', True)
+    return st.dataframe(df, column_config=column_config, **kwargs)
+
+
+def figure_hash(fig):
+    """Empreinte (hex) du contenu complet d'une figure Plotly (données + layout)."""
+    return hashlib.blake2b(fig.to_json().encode('utf-8'), digest_size=16).hexdigest()
+
+
+def png_export_available():
+    """Vrai si Kaleido (moteur de rastérisation de Plotly) est installé."""
+    return importlib.util.find_spec("kaleido") is not None
+
+
+@st.cache_resource(show_spinner=False)
+def _png_export_pool():
+    """Pool de rendu PNG partagé par toutes les sessions (borne le nombre de rendus Kaleido simultanés)."""
+    return {
+        'executor': ThreadPoolExecutor(max_workers=PNG_EXPORT_WORKERS, thread_name_prefix="png-export"),
+        'jobs': OrderedDict(),
+        'lock': threading.Lock()
+    }
+
+
+def render_png_async(fig, fig_hash=None):
+    """
+    Lance (ou réutilise) le rendu PNG d'une figure dans le pool d'arrière-plan
+
+    Les rendus sont mémorisés par empreinte de figure : une figure identique
+    n'est rastérisée qu'une fois, quelle que soit la session qui la demande.
+
+    Args:
+        fig: Figure Plotly
+        fig_hash: Empreinte déjà calculée (évite un second to_json)
+
+    Returns:
+        Future dont le résultat est le PNG (bytes)
+    """
+    fig_hash = fig_hash or figure_hash(fig)
+    pool = _png_export_pool()
+    with pool['lock']:
+        jobs = pool['jobs']
+        future = jobs.get(fig_hash)
+        if future is None or (future.done() and future.exception() is not None):
+            # Copie : la figure d'origine peut être partagée (cached_figure) ou modifiée par la page
+            future = pool['executor'].submit(go.Figure(fig).to_image, format="png")
+            jobs[fig_hash] = future
+        jobs.move_to_end(fig_hash)
+        while len(jobs) > PNG_CACHE_ENTRIES:
+            jobs.popitem(last=False)
+    return future
+
+
+def _timestamped(filename, extension):
+    return f"{filename}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+
+
 def add_export_button(fig, filename, button_label="📥 Télécharger PNG"):
     """
     Ajoute un bouton de téléchargement pour exporter un graphique en PNG
+
+    Le PNG n'est produit qu'au clic (génération différée de st.download_button),
+    dans le pool d'arrière-plan, et mis en cache par empreinte de figure.
     """
-    png_bytes = fig.to_image(format="png")
+    if not png_export_available():
+        st.caption("Export PNG indisponible (package kaleido non installé).")
+        return
     st.download_button(
         label=button_label,
-        data=png_bytes,
-        file_name=f"{filename}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png",
+        data=lambda: render_png_async(fig).result(),
+        file_name=_timestamped(filename, "png"),
         mime="image/png"
-    )
\ No newline at end of file
+    )
+
+
+def add_export_zip_button(figures, filename, button_label="📦 Télécharger tous les graphiques (ZIP)"):
+    """
+    Ajoute un bouton exportant plusieurs graphiques en PNG dans une seule archive ZIP
+
+    Les rendus sont lancés en parallèle dans le pool au clic, puis assemblés.
+
+    Args:
+        figures: Dictionnaire {nom de fichier sans extension: figure}
+        filename: Préfixe du fichier ZIP
+        button_label: Libellé du bouton
+    """
+    if not png_export_available():
+        st.caption("Export PNG indisponible (package kaleido non installé).")
+        return
+
+    def build_zip():
+        futures = {name: render_png_async(fig) for name, fig in figures.items()}
+        buffer = BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+            for name, future in futures.items():
+                archive.writestr(f"{name}.png", future.result())
+        return buffer.getvalue()
+
+    st.download_button(
+        label=button_label,
+        data=build_zip,
+        file_name=_timestamped(filename, "zip"),
+        mime="application/zip"
+    )
+
+
+def figure_payload_bytes(fig):
+    """
+    Taille (octets) du JSON Plotly envoyé au navigateur pour cette figure
+
+    Sérialise toute la figure : réservé au mode debug, pas au chemin de rendu courant.
+    """
+    return len(fig.to_json().encode('utf-8'))
+
+
+def _bucket_matrix(matrix, row_weights, row_factor, col_factor):
+    """
+    Agrège une matrice par blocs contigus de lignes et de colonnes
+
+    Les lignes sont moyennées en pondérant par row_weights (ex: taille de cohorte),
+    les colonnes par moyenne simple ; les cellules vides sont ignorées.
+    """
+    row_groups = np.arange(len(matrix.index)) // row_factor
+    col_groups = np.arange(len(matrix.columns)) // col_factor
+
+    weights = pd.Series(row_weights, index=matrix.index).fillna(0)
+    weighted_sum = matrix.mul(weights, axis=0).groupby(row_groups).sum(min_count=1)
+    weight_total = matrix.notna().mul(weights, axis=0).groupby(row_groups).sum()
+    by_rows = weighted_sum / weight_total.replace(0, np.nan)
+    bucketed = by_rows.T.groupby(col_groups).mean().T
+
+    row_labels = [str(g[0]) if len(g) == 1 else f"{g[0]} → {g[-1]}"
+                  for g in (matrix.index[row_groups == i] for i in range(row_groups.max() + 1))]
+    col_labels = [f"M+{g[0]}" if len(g) == 1 else f"M+{g[0]}–{g[-1]}"
+                  for g in (matrix.columns[col_groups == i] for i in range(col_groups.max() + 1))]
+    bucketed.index = row_labels
+    bucketed.columns = col_labels
+    return bucketed
+
+
+@traced()
+def retention_heatmap(retention_matrix, cohort_size=None, cell_budget=HEATMAP_CELL_BUDGET,
+                      label_budget=HEATMAP_LABEL_BUDGET):
+    """
+    Construit la heatmap de rétention avec un coût de rendu borné
+
+    - Les libellés sont formatés côté navigateur (texttemplate), aucune chaîne par cellule
+    - Au-delà de cell_budget cellules, lignes et colonnes sont regroupées par blocs
+    - Au-delà de label_budget cellules affichées, les libellés sont masqués (survol seulement)
+
+    Args:
+        retention_matrix: Matrice cohorte × période (sortie de compute_cohorts)
+        cohort_size: Taille de chaque cohorte, pondère les regroupements (optionnel)
+        cell_budget: Nombre maximal de cellules envoyées
+        label_budget: Nombre maximal de cellules annotées
+
+    Returns:
+        Tuple (figure, infos) où infos contient cells, displayed_cells,
+        row_factor et col_factor
+    """
+    n_rows, n_cols = retention_matrix.shape
+    cells = n_rows * n_cols
+    row_factor = col_factor = 1
+
+    if cells > cell_budget:
+        # Même facteur sur les deux axes, puis complément sur les lignes si nécessaire
+        col_factor = min(math.ceil(math.sqrt(cells / cell_budget)), n_cols)
+        while math.ceil(n_rows / row_factor) * math.ceil(n_cols / col_factor) > cell_budget:
+            row_factor += 1
+
+    if row_factor > 1 or col_factor > 1:
+        weights = cohort_size if cohort_size is not None else pd.Series(1.0, index=retention_matrix.index)
+        display = _bucket_matrix(retention_matrix, weights, row_factor, col_factor)
+        x_values = list(display.columns)
+        hover_x = "%{x}"
+    else:
+        display = retention_matrix.copy()
+        display.index = display.index.astype(str)
+        x_values = list(display.columns)
+        hover_x = "M+%{x}"
+
+    displayed_cells = display.shape[0] * display.shape[1]
+    show_labels = displayed_cells <= label_budget
+
+    fig = go.Figure(data=go.Heatmap(
+        z=np.round(display.to_numpy(dtype=float), 4),
+        x=x_values,
+        y=list(display.index),
+        colorscale='Purples',
+        texttemplate="%{z:.0%}" if show_labels else None,
+        xgap=2 if show_labels else 0,
+        ygap=2 if show_labels else 0,
+        colorbar=dict(title="Rétention %"),
+        hovertemplate=f"Cohorte: %{{y}}<br>{hover_x}<br>Rétention: %{{z:.0%}}<extra></extra>"
+    ))
+
+    info = {
+        'cells': cells,
+        'displayed_cells': displayed_cells,
+        'row_factor': row_factor,
+        'col_factor': col_factor
+    }
+    return fig, info
+
+
+def data_fingerprint(obj):
+    """
+    Empreinte stable (hex) d'un agrégat : DataFrame, Series, tableau NumPy,
+    scalaire ou tuple/liste de ces objets
+    """
+    digest = hashlib.blake2b(digest_size=16)
+
+    def update(value):
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            if isinstance(value, pd.DataFrame):
+                schema = (list(value.columns), [str(t) for t in value.dtypes])
+            else:
+                schema = (value.name, str(value.dtype))
+            digest.update(repr((type(value).__name__, value.shape, schema)).encode())
+            digest.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+        elif isinstance(value, np.ndarray):
+            digest.update(repr((value.shape, str(value.dtype))).encode())
+            digest.update(np.ascontiguousarray(value).tobytes() if value.dtype != object else repr(value.tolist()).encode())
+        elif isinstance(value, (tuple, list)):
+            digest.update(f"seq{len(value)}".encode())
+            for item in value:
+                update(item)
+        else:
+            digest.update(repr(value).encode())
+
+    update(obj)
+    return digest.hexdigest()
+
+
+@st.cache_resource(show_spinner=False, max_entries=256)
+def _cached_figure_build(builder_key, fingerprint, style_version, _builder, _args):
+    return _builder(*_args)
+
+
+def cached_figure(builder, *args):
+    """
+    Construit (ou récupère) une figure stylisée via builder(*args)
+
+    La figure est mise en cache par (builder, empreinte de args, STYLE_VERSION) :
+    tant que les agrégats d'entrée ne changent pas, ni Plotly Express ni style_plot
+    ne sont ré-exécutés. La figure renvoyée est partagée, ne pas la modifier.
+
+    Args:
+        builder: Fonction qui construit et stylise la figure
+        *args: Agrégats (petits DataFrames, tableaux, scalaires) passés au builder
+
+    Returns:
+        Figure Plotly stylisée
+    """
+    builder_key = f"{builder.__code__.co_filename}:{builder.__qualname__}"
+    with span(f"figure:{builder.__name__}"):
+        return _cached_figure_build(builder_key, data_fingerprint(args), STYLE_VERSION, builder, args)
@@ -0,0 +1,55 @@
+"""
+Configuration pytest : les modules de l'application s'importent comme depuis app/ (import utils...)
+et les tests partagent un jeu de transactions synthétique (le jeu réel n'est pas versionné)
+"""
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pytest
+import streamlit.logger
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+sys.path.insert(0, APP_DIR)
+
+# Fichiers persistés par l'application (règles, copie Parquet, traces) : répertoire jetable,
+# fixé avant l'import des modules utils qui lisent ces chemins au chargement
+_STATE_DIR = tempfile.mkdtemp(prefix="retail-tests-")
+atexit.register(shutil.rmtree, _STATE_DIR, ignore_errors=True)
+os.environ["RETAIL_SEGMENT_RULES"] = os.path.join(_STATE_DIR, "segment_rules.json")
+os.environ["RETAIL_DATASET_CACHE"] = os.path.join(_STATE_DIR, "cache")
+os.environ["RETAIL_TRACE_FILE"] = os.path.join(_STATE_DIR, "traces.jsonl")
+
+# Les caches Streamlit fonctionnent hors serveur mais avertissent à chaque décoration et appel
+streamlit.logger.set_log_level("ERROR")
+
+
+@pytest.fixture(scope="session")
+def transactions():
+    """Transactions au format de load_data : une facture = un client, un jour, un pays, un sens."""
+    from utils.data_loader import add_time_keys
+
+    rng = np.random.default_rng(0)
+    n_invoices = 600
+    invoice_dates = pd.Timestamp("2010-12-01") + pd.to_timedelta(rng.integers(0, 150 * 24 * 60, n_invoices), unit="min")
+    invoice_returns = rng.random(n_invoices) < 0.1
+    lines_per_invoice = rng.integers(1, 6, n_invoices)
+    invoice = np.repeat(np.arange(n_invoices), lines_per_invoice)
+    n_lines = len(invoice)
+    quantity = rng.integers(1, 12, n_lines) * np.where(invoice_returns[invoice], -1, 1)
+    df = pd.DataFrame({
+        "Invoice": [f"{'C' if invoice_returns[i] else ''}{500000 + i}" for i in invoice],
+        "Description": [f"Produit {p}" for p in rng.integers(0, 40, n_lines)],
+        "Quantity": quantity,
+        "InvoiceDate": invoice_dates[invoice],
+        "Price": rng.uniform(0.5, 20, n_lines).round(2),
+        "Customer ID": np.repeat(rng.integers(12000, 12090, n_invoices), lines_per_invoice).astype(str),
+        "Country": np.repeat(rng.choice(["United Kingdom", "France", "Germany", "EIRE"], n_invoices),
+                             lines_per_invoice)
+    })
+    df["TotalPrice"] = df["Quantity"] * df["Price"]
+    return add_time_keys(df)
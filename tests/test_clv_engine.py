@@ -0,0 +1,114 @@
+"""
+Moteur CLV vectorisé : balayages et matrice clients × scénarios comparés à la formule fermée
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import utils.clv_engine as clv_engine
+from utils.clv_engine import (
+    CLV_BASELINE, RETENTION_CAP, clv_sweep, customer_scenario_matrix, scenario_rollup, scenario_unit_clv,
+    segment_profiles, sweep_axis
+)
+
+
+def _clv(spend, margin, retention, discount):
+    """Formule fermée du simulateur, en Python scalaire."""
+    return spend * margin * retention / (1 + discount - retention)
+
+
+def test_grid_sweep_matches_formula():
+    sweep = clv_sweep(250.0, (0.1, 0.4, 4), [0.2, 0.5, 0.9], (0.05, 0.2, 3))
+    assert sweep["clv"].shape == (4, 3, 3)
+    for i, margin in enumerate(sweep["margin"]):
+        for j, retention in enumerate(sweep["retention"]):
+            for k, discount in enumerate(sweep["discount"]):
+                assert sweep["clv"][i, j, k] == pytest.approx(_clv(250.0, margin, retention, discount))
+
+
+def test_paired_sweep_broadcasts_scalars():
+    sweep = clv_sweep(100.0, 0.25, [0.3, 0.6, 0.8], [0.1, 0.1, 0.3], grid=False)
+    expected = [_clv(100.0, 0.25, r, d) for r, d in [(0.3, 0.1), (0.6, 0.1), (0.8, 0.3)]]
+    np.testing.assert_allclose(sweep["clv"], expected)
+
+    with pytest.raises(ValueError):
+        clv_sweep(100.0, [0.1, 0.2], [0.3, 0.6, 0.8], 0.1, grid=False)
+
+
+def test_float32_grid_stays_close_to_float64():
+    args = (300.0, (0.05, 0.5, 30), (0.1, 0.9, 40), (0.01, 0.3, 20))
+    low = clv_sweep(*args, dtype="float32")["clv"]
+    assert low.dtype == np.float32
+    np.testing.assert_allclose(low, clv_sweep(*args)["clv"], rtol=1e-6)
+
+
+def test_shared_sweep_is_frozen_without_freezing_caller_arrays():
+    retention = np.linspace(0.1, 0.9, 9)
+    first = clv_sweep(1.0, [0.2], retention, [0.1])
+    assert retention.flags.writeable
+    for values in first.values():
+        assert not values.flags.writeable
+    with pytest.raises(ValueError):
+        first["clv"][0, 0, 0] = 0.0
+
+    first["clv"] = None
+    second = clv_sweep(1.0, [0.2], retention, [0.1])
+    assert second["clv"] is not None
+    np.testing.assert_array_equal(second["retention"], sweep_axis(retention))
+
+
+# ============ SIMULATION PAR CLIENT ============
+
+@pytest.fixture(scope="module")
+def rfm_df():
+    rng = np.random.default_rng(8)
+    n = 2_000
+    return pd.DataFrame({
+        'Segment_Label': rng.choice(["Champions 🏆", "Hibernants 💤", "À Risque ⚠️"], n),
+        'Monetary': rng.gamma(2.0, 150.0, n),
+        'Frequency': rng.integers(1, 6, n)
+    })
+
+
+SCENARIOS = [
+    {"name": "Base", **CLV_BASELINE},
+    {"name": "Rétention +30", "margin": 0.2, "retention": 0.9, "discount": 0.1},
+    {"name": "Marge basse", "margin": 0.1, "retention": 0.5, "discount": 0.25},
+]
+
+
+def test_segment_profiles_match_groupby(rfm_df):
+    profiles = segment_profiles(rfm_df, ("test-profiles",), None)
+    grouped = rfm_df.groupby("Segment_Label")
+    assert profiles.index.tolist() == sorted(rfm_df["Segment_Label"].unique())
+    np.testing.assert_array_equal(profiles["Clients"], grouped.size())
+    np.testing.assert_allclose(profiles["Monetary_sum"], grouped["Monetary"].sum())
+    np.testing.assert_allclose(profiles["Retention"], grouped["Frequency"].apply(lambda f: (f > 1).mean()))
+
+
+def test_customer_matrix_matches_per_customer_formula(rfm_df, monkeypatch):
+    # Blocs de 300 lignes : plusieurs blocs et un bloc final partiel
+    monkeypatch.setattr(clv_engine, "MATRIX_CHUNK_ROWS", 300)
+    profiles = segment_profiles(rfm_df, ("test-profiles",), None)
+    codes = profiles.index.get_indexer(rfm_df["Segment_Label"])
+    unit = scenario_unit_clv(profiles, SCENARIOS)
+    matrix = customer_scenario_matrix(rfm_df["Monetary"].to_numpy(), codes, unit, dtype="float64")
+
+    assert matrix.shape == (len(rfm_df), len(SCENARIOS))
+    segment_retention = profiles["Retention"].to_numpy()[codes]
+    for column, scenario in enumerate(SCENARIOS):
+        retention = np.clip(segment_retention + scenario["retention"] - CLV_BASELINE["retention"], 0, RETENTION_CAP)
+        expected = _clv(rfm_df["Monetary"].to_numpy(), scenario["margin"], retention, scenario["discount"])
+        np.testing.assert_allclose(matrix[:, column], expected, rtol=1e-12)
+
+
+def test_rollup_equals_matrix_sums(rfm_df):
+    profiles = segment_profiles(rfm_df, ("test-profiles",), None)
+    codes = profiles.index.get_indexer(rfm_df["Segment_Label"])
+    unit = scenario_unit_clv(profiles, SCENARIOS)
+    matrix = customer_scenario_matrix(rfm_df["Monetary"].to_numpy(), codes, unit, dtype="float64")
+    rollup = scenario_rollup(profiles, unit, [scenario["name"] for scenario in SCENARIOS])
+
+    sums = pd.DataFrame(matrix).groupby(codes).sum().to_numpy()
+    np.testing.assert_allclose(rollup.to_numpy(), sums, rtol=1e-10)
+    assert rollup.columns.tolist() == [scenario["name"] for scenario in SCENARIOS]
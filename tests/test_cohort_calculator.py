@@ -0,0 +1,60 @@
+"""
+Courbe de rétention moyenne et bandes de confiance bootstrap
+"""
+import numpy as np
+import pandas as pd
+
+from utils.cohort_calculator import bootstrap_retention_curve, customer_activity
+
+
+def _reference_retention(df, max_period=12):
+    """Rétention moyenne des cohortes observables, cohorte par cohorte (calcul pandas direct)."""
+    first = df.groupby("Customer ID")["MonthIndex"].transform("min")
+    activity = df.assign(Cohort=first, Period=df["MonthIndex"] - first)
+    activity = activity[activity["Period"] <= max_period]
+    sizes = activity[activity["Period"] == 0].groupby("Cohort")["Customer ID"].nunique()
+    active = activity.groupby(["Cohort", "Period"])["Customer ID"].nunique().unstack(fill_value=0)
+    rates = active.div(sizes, axis=0)
+    last_month = df["MonthIndex"].max()
+    observable = pd.DataFrame(
+        {p: rates.index + p <= last_month for p in rates.columns}, index=rates.index
+    )
+    return rates.where(observable).mean(axis=0)
+
+
+def test_point_estimate_matches_reference(transactions):
+    curve = bootstrap_retention_curve(*customer_activity(transactions), n_boot=200)
+    expected = _reference_retention(transactions)
+    np.testing.assert_allclose(curve["Rétention"].to_numpy(), expected.loc[curve.index].to_numpy())
+
+
+def test_bands_bracket_point_and_m0_is_certain(transactions):
+    curve = bootstrap_retention_curve(*customer_activity(transactions), n_boot=500)
+    assert (curve["Borne_Basse"] <= curve["Rétention"] + 1e-12).all()
+    assert (curve["Rétention"] <= curve["Borne_Haute"] + 1e-12).all()
+    # Tout client est actif le mois de son acquisition : aucune incertitude en M+0
+    np.testing.assert_allclose(curve.loc[0, ["Rétention", "Borne_Basse", "Borne_Haute"]].to_numpy(dtype=float), 1.0)
+    assert (curve["Borne_Haute"] - curve["Borne_Basse"]).iloc[1:].gt(0).any()
+
+
+def test_bands_shrink_with_more_customers():
+    rng = np.random.default_rng(3)
+
+    def activity(n_customers):
+        months = np.repeat(rng.integers(0, 3, n_customers), 7) + np.tile(np.arange(7), n_customers)
+        keep = (np.tile(np.arange(7), n_customers) == 0) | (rng.random(7 * n_customers) < 0.3)
+        customers = np.repeat(np.arange(n_customers), 7)
+        df = pd.DataFrame({"Customer ID": customers[keep], "MonthIndex": months[keep] + 24000})
+        return customer_activity(df, max_period=6)
+
+    small = bootstrap_retention_curve(*activity(100), n_boot=400)
+    large = bootstrap_retention_curve(*activity(2500), n_boot=400)
+    width = lambda curve: (curve["Borne_Haute"] - curve["Borne_Basse"]).loc[1:3].mean()
+    assert width(large) < width(small) / 3
+
+
+def test_replicates_independent_of_process_count(transactions):
+    active, cohort_month, last_month = customer_activity(transactions)
+    serial = bootstrap_retention_curve(active, cohort_month, last_month, n_boot=1200, n_jobs=1)
+    parallel = bootstrap_retention_curve(active, cohort_month, last_month, n_boot=1200, n_jobs=2)
+    pd.testing.assert_frame_equal(serial, parallel)
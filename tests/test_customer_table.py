@@ -0,0 +1,80 @@
+"""
+Table clients paginée : pages identiques à un tri / filtre pandas complet
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.customer_table import SORT_COLUMNS, build_customer_index, query_customers
+
+SEGMENTS = ["Champions 🏆", "Hibernants 💤", "À Risque ⚠️"]
+
+
+@pytest.fixture(scope="module")
+def rfm_df():
+    rng = np.random.default_rng(6)
+    n = 700
+    return pd.DataFrame({
+        # ID de longueurs variables : la recherche par préfixe porte sur le texte
+        'CustomerID': rng.choice(np.arange(1, 60_000), n, replace=False).astype(str),
+        'Segment_Label': rng.choice(SEGMENTS, n),
+        'Monetary': rng.choice([10.0, 25.5, 80.0, 300.0], n),
+        'Frequency': rng.integers(1, 8, n),
+        'Recency': rng.integers(0, 365, n),
+        'R_Score': rng.integers(1, 5, n),
+        'F_Score': rng.integers(1, 5, n),
+        'M_Score': rng.integers(1, 5, n),
+        'Unused': 0
+    })
+
+
+@pytest.fixture(scope="module")
+def index(rfm_df):
+    return build_customer_index(rfm_df, ("test-customers",), None)
+
+
+def _reference(rfm_df, sort_by, descending, segments=None, prefix=""):
+    """Tri complet : colonne puis ID (texte), ordre inversé en décroissant ; filtres segment et préfixe."""
+    df = rfm_df.assign(_id=rfm_df['CustomerID'].astype(str))
+    if segments is not None:
+        df = df[df['Segment_Label'].isin(segments)]
+    if prefix:
+        df = df[df['_id'].str.startswith(prefix)]
+    keys = ['_id'] if sort_by == 'CustomerID' else [sort_by, '_id']
+    df = df.sort_values(keys, kind='stable')
+    return df.iloc[::-1] if descending else df
+
+
+@pytest.mark.parametrize("sort_by", SORT_COLUMNS)
+@pytest.mark.parametrize("descending", [True, False])
+def test_pages_match_full_sort(rfm_df, index, sort_by, descending):
+    expected = _reference(rfm_df, sort_by, descending)
+    pages = []
+    for page in range(1, 9):
+        page_df, total = query_customers(index, sort_by, descending, page=page, page_size=100)
+        assert total == len(rfm_df)
+        pages.append(page_df)
+    assert pages[-1].empty
+    assert pd.concat(pages)['CustomerID'].tolist() == expected['CustomerID'].tolist()
+
+
+@pytest.mark.parametrize("prefix, segments", [
+    ("1", None), ("42", None), ("5", ["Champions 🏆", "À Risque ⚠️"]), ("", ["Hibernants 💤"]), ("x", None)
+])
+def test_prefix_and_segment_filters(rfm_df, index, prefix, segments):
+    expected = _reference(rfm_df, 'Monetary', True, segments, prefix)
+    page_df, total = query_customers(index, 'Monetary', True, page=2, page_size=10,
+                                     segments=segments, prefix=f" {prefix} ")
+    assert total == len(expected)
+    assert page_df['CustomerID'].tolist() == expected['CustomerID'].iloc[10:20].tolist()
+
+
+def test_page_has_display_columns_only(index):
+    page_df, _ = query_customers(index, page=1, page_size=25)
+    assert len(page_df) == 25
+    assert 'Unused' not in page_df.columns
+
+
+def test_unknown_sort_column(index):
+    with pytest.raises(ValueError):
+        query_customers(index, sort_by='R_Score')
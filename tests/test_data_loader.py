@@ -0,0 +1,37 @@
+"""
+Clés temporelles entières et filtres du chargeur
+"""
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from utils.data_loader import add_time_keys, day_index, filter_data, week_index
+
+
+def test_time_keys_match_calendar():
+    dates = pd.to_datetime(["1970-01-01 00:00", "2010-12-01 08:26", "2011-02-28 23:59", "2011-03-01 00:00"])
+    df = add_time_keys(pd.DataFrame({"InvoiceDate": dates, "Customer ID": ["a", "b", "a", "c"]}))
+
+    assert list(df.columns) == ["InvoiceDate", "Customer ID", "DayIndex", "MonthIndex"]
+    assert df["DayIndex"].tolist() == [day_index(d) for d in dates]
+    assert df["MonthIndex"].tolist() == [d.year * 12 + d.month - 1 for d in dates]
+    assert (df.dtypes[["DayIndex", "MonthIndex"]] == np.int32).all()
+
+
+def test_week_index_groups_monday_to_sunday():
+    days = np.arange(day_index(date(2011, 1, 1)), day_index(date(2011, 3, 1)))
+    weeks = week_index(days)
+    mondays = pd.to_datetime(weeks * 7 - 3, unit="D")
+    expected = pd.to_datetime(days, unit="D").to_period("W-SUN").start_time
+
+    assert (mondays.dayofweek == 0).all()
+    np.testing.assert_array_equal(mondays, expected)
+
+
+def test_filter_data_bounds_are_inclusive(transactions):
+    start, end = date(2011, 1, 1), date(2011, 1, 31)
+    filtered = filter_data(transactions, (start, end), ["France"], "Inclure tout")
+    dates = transactions["InvoiceDate"].dt.date
+    expected = transactions[(dates >= start) & (dates <= end) & (transactions["Country"] == "France")]
+    pd.testing.assert_frame_equal(filtered, expected)
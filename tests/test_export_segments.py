@@ -0,0 +1,99 @@
+"""
+Export CRM planifié : manifeste (tailles, empreintes, effectifs) et publication atomique du répertoire
+"""
+import gzip
+import hashlib
+import json
+import os
+import sys
+import zipfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import utils.data_loader as data_loader
+from scripts.export_segments import MANIFEST_NAME, main, publish, write_exports
+from utils.exports import XLSX_AVAILABLE
+
+SEGMENTS = ["Champions 🏆", "Hibernants 💤", "À Risque ⚠️"]
+
+
+@pytest.fixture(scope="module")
+def export_df():
+    rng = np.random.default_rng(11)
+    n = 300
+    return pd.DataFrame({
+        'CustomerID': np.arange(13000, 13000 + n).astype(str),
+        'Segment_Label': rng.choice(SEGMENTS, n),
+        'Monetary': rng.gamma(2.0, 150.0, n).round(2),
+        'Frequency': rng.integers(1, 8, n),
+        'Recency': rng.integers(0, 365, n),
+        'R_Score': rng.integers(1, 5, n),
+        'F_Score': rng.integers(1, 5, n),
+        'M_Score': rng.integers(1, 5, n)
+    })
+
+
+def _check_files(directory, files):
+    for entry in files:
+        content = (directory / entry["name"]).read_bytes()
+        assert entry["bytes"] == len(content)
+        assert entry["sha256"] == hashlib.sha256(content).hexdigest()
+
+
+def test_write_exports_describes_each_file(export_df, tmp_path):
+    formats = ["csv", "bundle"] + (["xlsx"] if XLSX_AVAILABLE else [])
+    files = write_exports(export_df, str(tmp_path), formats, "gzip", "CSV")
+
+    assert [entry["name"] for entry in files] == ["CRM_Export.csv.gz", "CRM_Segments.zip"] + (
+        ["CRM_Export.xlsx"] if XLSX_AVAILABLE else [])
+    assert [entry["format"] for entry in files][:2] == ["csv", "CSV"]
+    assert all(entry["rows"] == len(export_df) for entry in files)
+    _check_files(tmp_path, files)
+
+    lines = gzip.decompress((tmp_path / "CRM_Export.csv.gz").read_bytes()).decode().splitlines()
+    assert len(lines) == len(export_df) + 1
+    with zipfile.ZipFile(tmp_path / "CRM_Segments.zip") as archive:
+        assert len(archive.namelist()) == len(SEGMENTS)
+
+
+def test_publish_never_overwrites(tmp_path):
+    staging = tmp_path / ".run.tmp"
+    staging.mkdir()
+    (staging / MANIFEST_NAME).write_text("{}", encoding="utf-8")
+    target = tmp_path / "crm_export_1"
+    target.mkdir()
+
+    with pytest.raises(FileExistsError):
+        publish(str(staging), str(target))
+    assert (staging / MANIFEST_NAME).exists()
+    assert not os.listdir(target)
+
+    target.rmdir()
+    publish(str(staging), str(target))
+    assert not staging.exists()
+    assert (target / MANIFEST_NAME).exists()
+
+
+def test_main_publishes_complete_export(transactions, tmp_path, monkeypatch):
+    monkeypatch.setattr(data_loader, "DATASET_CACHE_DIR", str(tmp_path / "cache"))
+    source = tmp_path / "transactions.xlsx"
+    raw = transactions[["Invoice", "Description", "Quantity", "InvoiceDate", "Price", "Customer ID", "Country"]]
+    raw.assign(**{"Customer ID": raw["Customer ID"].astype(int)}).to_excel(source, index=False)
+    output = tmp_path / "exports"
+    monkeypatch.setattr(sys, "argv", [
+        "export_segments.py", "-o", str(output), "--data", str(source), "--countries",
+        "--formats", "csv", "bundle", "--compression", "gzip", "--bundle-format", "CSV"
+    ])
+    main()
+
+    runs = os.listdir(output)
+    assert len(runs) == 1 and runs[0].startswith("crm_export_")
+    run_dir = output / runs[0]
+    manifest = json.loads((run_dir / MANIFEST_NAME).read_text(encoding="utf-8"))
+    assert sorted(os.listdir(run_dir)) == sorted([MANIFEST_NAME] + [entry["name"] for entry in manifest["files"]])
+    _check_files(run_dir, manifest["files"])
+    assert sum(manifest["segments"].values()) == manifest["customers"]
+    assert manifest["filters"]["countries"] == []
+    assert manifest["source"]["version"] is not None
@@ -0,0 +1,158 @@
+"""
+Exports CRM : fichiers produits par blocs identiques à une conversion pandas en une fois
+"""
+import gzip
+import os
+import subprocess
+import sys
+import zipfile
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.exports import (
+    BUNDLE_FORMATS, CSV_COMPRESSIONS, EXPORT_COLUMNS, XLSX_AVAILABLE, XLSX_COLUMN_WIDTH, csv_download, iter_csv,
+    match_segments, segment_file_name, write_bundle, write_csv, write_xlsx
+)
+
+SEGMENTS = ["Champions 🏆", "Hibernants 💤", "À Risque ⚠️", "Loyaux Potentiels 🌱"]
+
+
+@pytest.fixture(scope="module")
+def rfm_df():
+    rng = np.random.default_rng(9)
+    n = 1_050
+    return pd.DataFrame({
+        'Recency': rng.integers(0, 365, n),
+        'CustomerID': np.arange(12000, 12000 + n).astype(str),
+        'Segment_Label': rng.choice(SEGMENTS, n),
+        'Monetary': rng.gamma(2.0, 150.0, n).round(2),
+        'Frequency': rng.integers(1, 8, n),
+        'R_Score': rng.integers(1, 5, n),
+        'F_Score': rng.integers(1, 5, n),
+        'M_Score': rng.integers(1, 5, n),
+        'Unused': "x"
+    })
+
+
+def _reference_csv(rfm_df):
+    return rfm_df[list(EXPORT_COLUMNS)].rename(columns=EXPORT_COLUMNS).to_csv(index=False, lineterminator="\n").encode()
+
+
+# ============ CSV ============
+
+def test_chunked_csv_matches_single_conversion(rfm_df):
+    chunks = list(iter_csv(rfm_df, chunk_rows=100))
+    assert len(chunks) == 11
+    assert b"".join(chunks) == _reference_csv(rfm_df)
+    assert b"".join(chunks).count(b"Customer ID") == 1
+
+
+def test_gzip_round_trip(rfm_df):
+    buffer = BytesIO()
+    written = write_csv(rfm_df, buffer, compression="gzip", chunk_rows=200)
+    assert written == len(buffer.getvalue())
+    assert gzip.decompress(buffer.getvalue()) == _reference_csv(rfm_df)
+
+
+def test_empty_selection_writes_header_only(rfm_df):
+    content = b"".join(iter_csv(rfm_df.iloc[:0]))
+    assert content.decode().splitlines() == [",".join(EXPORT_COLUMNS.values())]
+
+
+def test_download_is_deferred_and_complete(rfm_df):
+    produce = csv_download(rfm_df, "gzip")
+    assert callable(produce)
+    assert gzip.decompress(produce()) == _reference_csv(rfm_df)
+
+
+def test_unavailable_compression(rfm_df):
+    with pytest.raises(ValueError):
+        next(iter_csv(rfm_df, compression="bz2"))
+    if "zstd" not in CSV_COMPRESSIONS:
+        with pytest.raises(ValueError):
+            next(iter_csv(rfm_df, compression="zstd"))
+
+
+# ============ EXCEL ============
+
+@pytest.mark.skipif(not XLSX_AVAILABLE, reason="openpyxl non installé")
+def test_xlsx_rows_match_selection(rfm_df):
+    from openpyxl import load_workbook
+
+    buffer = BytesIO()
+    write_xlsx(rfm_df, buffer, chunk_rows=256)
+    worksheet = load_workbook(BytesIO(buffer.getvalue()), read_only=True)["Clients"]
+    rows = list(worksheet.iter_rows(values_only=True))
+
+    assert rows[0] == tuple(EXPORT_COLUMNS.values())
+    expected = rfm_df[list(EXPORT_COLUMNS)]
+    assert len(rows) == len(expected) + 1
+    assert rows[1:] == list(expected.itertuples(index=False, name=None))
+
+
+@pytest.mark.skipif(not XLSX_AVAILABLE, reason="openpyxl non installé")
+def test_xlsx_column_widths(rfm_df):
+    from openpyxl import load_workbook
+
+    buffer = BytesIO()
+    write_xlsx(rfm_df.iloc[:3], buffer)
+    worksheet = load_workbook(BytesIO(buffer.getvalue()))["Clients"]
+    assert worksheet.max_row == 4
+    assert [worksheet.column_dimensions[letter].width for letter in "ABCDEFGH"] == [XLSX_COLUMN_WIDTH] * 8
+
+
+def test_openpyxl_imported_on_first_export_only():
+    # Processus neuf : les tests précédents ont pu importer openpyxl dans celui-ci
+    code = "import sys, utils.exports; print('openpyxl' in sys.modules)"
+    app_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+    output = subprocess.run([sys.executable, "-c", code], cwd=app_dir, capture_output=True, text=True, check=True)
+    assert output.stdout.strip() == "False"
+
+
+# ============ LOT PAR SEGMENT ============
+
+def test_segment_file_names_are_ascii():
+    assert segment_file_name("À Risque ⚠️", "csv") == "A_Risque.csv"
+    assert segment_file_name("Loyaux Potentiels 🌱", "parquet") == "Loyaux_Potentiels.parquet"
+    assert segment_file_name("🏆", "xlsx") == "segment.xlsx"
+
+
+def test_match_segments_ignores_emoji():
+    assert match_segments(SEGMENTS, [" Champions", "À Risque"]) == ["Champions 🏆", "À Risque ⚠️"]
+
+
+def test_csv_bundle_has_one_file_per_segment(rfm_df):
+    buffer = BytesIO()
+    counts = write_bundle(rfm_df, buffer, "CSV", workers=3)
+    expected = rfm_df["Segment_Label"].value_counts()
+    assert counts == {segment_file_name(segment, "csv"): count for segment, count in expected.items()}
+
+    with zipfile.ZipFile(BytesIO(buffer.getvalue())) as archive:
+        assert sorted(archive.namelist()) == sorted(counts)
+        for segment in SEGMENTS:
+            content = archive.read(segment_file_name(segment, "csv"))
+            assert content == _reference_csv(rfm_df[rfm_df["Segment_Label"] == segment])
+
+
+@pytest.mark.skipif("Parquet" not in BUNDLE_FORMATS, reason="pyarrow non installé")
+def test_parquet_bundle_round_trip(rfm_df):
+    buffer = BytesIO()
+    write_bundle(rfm_df, buffer, "Parquet")
+    with zipfile.ZipFile(BytesIO(buffer.getvalue())) as archive:
+        part = pd.read_parquet(BytesIO(archive.read("Hibernants.parquet")))
+    expected = rfm_df[rfm_df["Segment_Label"] == "Hibernants 💤"][list(EXPORT_COLUMNS)].rename(columns=EXPORT_COLUMNS)
+    pd.testing.assert_frame_equal(part, expected.reset_index(drop=True))
+
+
+def test_labels_differing_by_emoji_only_keep_both_files(rfm_df):
+    part = rfm_df.iloc[:10].assign(Segment_Label=["Champions 🏆"] * 5 + ["Champions 🥇"] * 5)
+    counts = write_bundle(part, BytesIO(), "CSV")
+    assert counts == {"Champions.csv": 5, "Champions_2.csv": 5}
+
+
+def test_unavailable_bundle_format(rfm_df):
+    with pytest.raises(ValueError):
+        write_bundle(rfm_df, BytesIO(), "PDF")
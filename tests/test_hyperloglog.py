@@ -0,0 +1,36 @@
+"""
+Comptages distincts HyperLogLog : erreur bornée, fusion exacte, alignement sur nunique
+"""
+import numpy as np
+import pytest
+
+from utils.hyperloglog import hll_estimate, hll_merge, hll_registers, hll_relative_error
+from utils.kpi_cube import build_distinct_sketches
+
+
+@pytest.mark.parametrize("n_distinct", [5_000, 50_000, 400_000])
+def test_estimate_within_error_bound(n_distinct):
+    rng = np.random.default_rng(n_distinct)
+    values = rng.permutation(np.repeat(np.arange(n_distinct), 3))
+    estimate = float(hll_estimate(hll_registers(np.zeros(len(values), dtype=int), 1, values)[0]))
+    # 4 erreurs types : un dépassement n'arrive qu'avec une probabilité < 1e-4
+    assert abs(estimate / n_distinct - 1) < 4 * hll_relative_error()
+
+
+def test_merge_equals_sketch_of_union():
+    rng = np.random.default_rng(5)
+    values = rng.integers(0, 30_000, 100_000)
+    groups = rng.integers(0, 7, len(values))
+    per_group = hll_registers(groups, 7, values)
+    np.testing.assert_array_equal(hll_merge(per_group), hll_registers(np.zeros(len(values), dtype=int), 1, values)[0])
+
+
+def test_missing_descriptions_are_not_counted(transactions):
+    df = transactions.copy()
+    df.loc[df.index[::9], "Description"] = None
+    sketches = build_distinct_sketches(df)
+    without_missing = build_distinct_sketches(df.dropna(subset=["Description"]))
+
+    np.testing.assert_array_equal(hll_merge(sketches["products"]), hll_merge(without_missing["products"]))
+    # 40 produits pour 1 024 registres : un registre occupé par produit, aucun pour les manquants
+    assert (hll_merge(sketches["products"]) > 0).sum() == df["Description"].nunique()
@@ -0,0 +1,35 @@
+"""
+KPIs d'en-tête en un passage, comparés aux agrégations pandas directes
+"""
+import pandas as pd
+import pytest
+
+from utils.kpi_calculator import compute_kpis
+
+
+def test_compute_kpis_matches_pandas(transactions):
+    kpis = compute_kpis(transactions, ("test-kpis",))
+
+    assert kpis["n_lines"] == len(transactions)
+    assert kpis["n_customers"] == transactions["Customer ID"].nunique()
+    assert kpis["n_invoices"] == transactions["Invoice"].nunique()
+    assert kpis["n_countries"] == transactions["Country"].nunique()
+    assert kpis["n_products"] == transactions["Description"].nunique()
+    assert kpis["ca_total"] == pytest.approx(transactions["TotalPrice"].sum())
+    assert kpis["panier_moyen"] == pytest.approx(transactions["TotalPrice"].sum() / transactions["Invoice"].nunique())
+
+    top = transactions.groupby("Country")["TotalPrice"].sum().sort_values(ascending=False).head(8)
+    pd.testing.assert_series_equal(
+        kpis["top_countries"].set_index("Country")["TotalPrice"], top, check_names=False
+    )
+
+    monthly = transactions.groupby("MonthIndex").agg({"TotalPrice": "sum", "Customer ID": "nunique"})
+    actual = kpis["monthly"].set_index("MonthIndex")[["TotalPrice", "Customer ID"]]
+    pd.testing.assert_frame_equal(actual, monthly, check_dtype=False, check_index_type=False)
+
+
+def test_compute_kpis_empty_selection(transactions):
+    kpis = compute_kpis(transactions.iloc[:0], ("test-kpis-empty",))
+    assert kpis["n_lines"] == kpis["n_invoices"] == 0
+    assert kpis["panier_moyen"] == 0.0
+    assert kpis["monthly"].empty
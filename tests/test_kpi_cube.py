@@ -0,0 +1,74 @@
+"""
+Cube quotidien : agrégats identiques au calcul sur les transactions filtrées, partage sans copie
+"""
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import utils.data_loader as data_loader
+from utils.data_loader import filter_data
+from utils.kpi_calculator import compute_kpis
+from utils.kpi_cube import build_daily_cube, get_daily_cube, rollup_kpis, rollup_timeseries
+
+FILTERS = [
+    ((date(2010, 12, 1), date(2011, 4, 30)), [], "Exclure les retours"),
+    ((date(2010, 12, 15), date(2011, 2, 10)), ["United Kingdom", "France"], "Inclure tout"),
+    ((date(2011, 1, 1), date(2011, 3, 31)), ["Germany"], "Uniquement les retours"),
+]
+
+
+@pytest.fixture(scope="module")
+def cube(transactions):
+    return build_daily_cube(transactions)
+
+
+@pytest.mark.parametrize("date_range, countries, return_mode", FILTERS)
+def test_rollup_matches_filtered_kpis(transactions, cube, date_range, countries, return_mode):
+    filtered = filter_data(transactions, date_range, countries, return_mode)
+    expected = compute_kpis(filtered, ("test-cube", date_range, tuple(countries), return_mode))
+    actual = rollup_kpis(cube, date_range, countries, return_mode)
+
+    for key in ("n_lines", "n_customers", "n_invoices", "n_countries"):
+        assert actual[key] == expected[key], key
+    assert actual["ca_total"] == pytest.approx(expected["ca_total"])
+    assert actual["panier_moyen"] == pytest.approx(expected["panier_moyen"])
+    for key in ("top_countries", "monthly"):
+        pd.testing.assert_frame_equal(
+            actual[key].reset_index(drop=True), expected[key].reset_index(drop=True), check_dtype=False
+        )
+
+
+@pytest.mark.parametrize("grain, freq", [("day", "D"), ("week", "W-SUN"), ("month", "M")])
+def test_timeseries_matches_resample(transactions, cube, grain, freq):
+    date_range, countries, return_mode = FILTERS[1]
+    filtered = filter_data(transactions, date_range, countries, return_mode)
+    periods = filtered["InvoiceDate"].dt.to_period(freq).dt.start_time
+    expected = filtered.groupby(periods).agg({"TotalPrice": "sum", "Customer ID": "nunique"})
+
+    series = rollup_timeseries(cube, date_range, countries, return_mode, grain=grain)
+    np.testing.assert_array_equal(series["Date"].to_numpy("datetime64[ns]"), expected.index.to_numpy("datetime64[ns]"))
+    np.testing.assert_allclose(series["TotalPrice"], expected["TotalPrice"])
+    np.testing.assert_array_equal(series["Customer ID"], expected["Customer ID"])
+
+
+def test_shared_cube_is_read_only_and_not_copied(transactions, tmp_path, monkeypatch):
+    monkeypatch.setattr(data_loader, "DATASET_CACHE_DIR", str(tmp_path / "cache"))
+    source = tmp_path / "transactions.xlsx"
+    raw = transactions[["Invoice", "Description", "Quantity", "InvoiceDate", "Price", "Customer ID", "Country"]]
+    raw.assign(**{"Customer ID": raw["Customer ID"].astype(int)}).to_excel(source, index=False)
+
+    first = get_daily_cube("test-v1", str(source))
+    second = get_daily_cube("test-v1", str(source))
+    assert first is not second
+    for key, values in first.items():
+        assert values is second[key], key
+        assert not values.flags.writeable, key
+    with pytest.raises(ValueError):
+        first["revenue"][0] = 0.0
+
+    # Les clés du dictionnaire restent propres à l'appelant
+    first["revenue"] = np.zeros(1)
+    assert len(get_daily_cube("test-v1", str(source))["revenue"]) == len(second["revenue"])
+    np.testing.assert_array_equal(second["revenue"], build_daily_cube(transactions)["revenue"])
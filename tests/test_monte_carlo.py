@@ -0,0 +1,54 @@
+"""
+CLV Monte Carlo : espérance de la formule fermée, graines indépendantes du pool, cas limites
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+
+from utils.monte_carlo import MC_CHUNK_PATHS, simulate_chunk, simulate_clv_paths
+
+PARAMS = dict(spend_mean=300.0, spend_cv=0.8, margin=0.2, retention=0.6, discount=0.1)
+
+
+@pytest.fixture(scope="module")
+def pool():
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        yield executor
+
+
+def _closed_form(spend_mean, margin, retention, discount, **_):
+    return spend_mean * margin * retention / (1 + discount - retention)
+
+
+@pytest.mark.parametrize("retention, discount", [(0.6, 0.1), (0.3, 0.25), (0.6, 0.0)])
+def test_mean_matches_closed_form(retention, discount):
+    params = {**PARAMS, "retention": retention, "discount": discount}
+    result = simulate_clv_paths(**params, n_paths=400_000, seed=1)
+    assert result["clv_mean"] == pytest.approx(_closed_form(**params), rel=0.03)
+
+
+@pytest.mark.parametrize("retention", [0.999, 0.9999])
+def test_retention_near_one_does_not_crash(retention):
+    clv, expected = simulate_chunk(np.random.SeedSequence(0), 1_000_000, 300, 1.0, 0.3, retention, 0.1)
+    assert np.isfinite(clv).all() and np.isfinite(expected).all()
+    assert clv.mean() == pytest.approx(_closed_form(300, 0.3, retention, 0.1), rel=0.03)
+
+
+def test_seeding_independent_of_pool(pool):
+    n_paths = 3 * MC_CHUNK_PATHS + 1000
+    serial = simulate_clv_paths(**PARAMS, n_paths=n_paths, seed=7)
+    pooled = simulate_clv_paths(**PARAMS, n_paths=n_paths, seed=7, pool=pool, workers=2)
+
+    assert pooled["n_paths"] == serial["n_paths"] == n_paths
+    assert pooled["clv_mean"] == serial["clv_mean"]
+    assert pooled["clv"] == serial["clv"]
+    np.testing.assert_array_equal(pooled["histogram"][0], serial["histogram"][0])
+    assert simulate_clv_paths(**PARAMS, n_paths=n_paths, seed=8)["clv_mean"] != serial["clv_mean"]
+
+
+def test_time_budget_keeps_whole_chunks(pool):
+    n_paths = 40 * MC_CHUNK_PATHS
+    result = simulate_clv_paths(**PARAMS, n_paths=n_paths, seed=3, time_budget=0.05, pool=pool, workers=2)
+    assert MC_CHUNK_PATHS <= result["n_paths"] < n_paths
+    assert result["n_paths"] % MC_CHUNK_PATHS == 0
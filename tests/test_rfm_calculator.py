@@ -0,0 +1,35 @@
+"""
+Table RFM : version mise en cache par état des filtres identique au calcul direct
+"""
+import pandas as pd
+
+from utils.rfm_calculator import cached_rfm, compute_rfm
+from utils.segment_rules import DEFAULT_SEGMENT_RULES
+
+
+def test_cached_rfm_matches_compute_rfm(transactions):
+    analysis_date = transactions["InvoiceDate"].max()
+    key = ("test-rfm", "tout")
+    cached = cached_rfm(transactions, key, analysis_date, DEFAULT_SEGMENT_RULES)
+    pd.testing.assert_frame_equal(cached, compute_rfm(transactions, analysis_date, DEFAULT_SEGMENT_RULES))
+    assert cached["CustomerID"].is_unique
+    assert (cached["Monetary"] > 0).all()
+
+    # Copie par appel : une page qui modifie sa table n'altère pas le cache
+    cached["Segment_Label"] = "modifié"
+    assert (cached_rfm(transactions, key, analysis_date, DEFAULT_SEGMENT_RULES)["Segment_Label"] != "modifié").all()
+
+
+def test_cached_rfm_keyed_by_segment_rules(transactions):
+    analysis_date = transactions["InvoiceDate"].max()
+    key = ("test-rfm", "règles")
+    default = cached_rfm(transactions, key, analysis_date, DEFAULT_SEGMENT_RULES)
+    single = cached_rfm(transactions, key, analysis_date, [{"name": "Tous", "r_min": 1}])
+    assert set(single["Segment_Label"]) == {"Tous"}
+    assert set(default["Segment_Label"]) != {"Tous"}
+
+
+def test_empty_selection(transactions):
+    rfm = cached_rfm(transactions.iloc[:0], ("test-rfm", "vide"), pd.Timestamp("2011-01-01"), DEFAULT_SEGMENT_RULES)
+    assert rfm.empty
+    assert "Segment_Label" in rfm.columns
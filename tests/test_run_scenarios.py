@@ -0,0 +1,92 @@
+"""
+Scénarios en lot : validation du fichier de scénarios, valeurs simulées cohérentes avec le roll-up par segment
+"""
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from scripts.run_scenarios import evaluate_scenarios, load_scenarios
+from utils.clv_engine import CLV_BASELINE, clv_formula, segment_profiles
+
+
+def _write(tmp_path, name, content):
+    path = tmp_path / name
+    path.write_text(content if isinstance(content, str) else json.dumps(content), encoding="utf-8")
+    return str(path)
+
+
+def test_csv_without_discount_uses_baseline(tmp_path):
+    path = _write(tmp_path, "scenarios.csv", "name,retention,margin,extra\nA,0.5,0.2,x\nB,0.8,0.1,y\n")
+    scenarios = load_scenarios(path)
+    assert scenarios.columns.tolist() == ["name", "margin", "retention", "discount"]
+    assert scenarios["discount"].tolist() == [CLV_BASELINE["discount"]] * 2
+    assert scenarios["retention"].tolist() == [0.5, 0.8]
+
+
+def test_json_grid_is_cartesian_product(tmp_path):
+    path = _write(tmp_path, "grid.json", {"grid": {"margin": [0.1, 0.2], "retention": [0.3, 0.6, 0.9]}})
+    scenarios = load_scenarios(path)
+    assert len(scenarios) == 6
+    assert scenarios["name"].is_unique
+    assert set(scenarios["discount"]) == {CLV_BASELINE["discount"]}
+    assert set(zip(scenarios["margin"], scenarios["retention"])) == {
+        (m, r) for m in (0.1, 0.2) for r in (0.3, 0.6, 0.9)
+    }
+
+
+def test_json_scenarios_object(tmp_path):
+    path = _write(tmp_path, "list.json", {"scenarios": [{"name": "A", "margin": 0.3, "retention": 0.4, "discount": 0.2}]})
+    assert load_scenarios(path).iloc[0].to_dict() == {"name": "A", "margin": 0.3, "retention": 0.4, "discount": 0.2}
+
+
+@pytest.mark.parametrize("content, message", [
+    ("name,margin\nA,0.2\n", "Colonnes manquantes"),
+    ("name,margin,retention\nA,abc,0.5\n", "Colonne margin non numérique"),
+    ("name,margin,retention\nA,0.2,\n", "Valeurs manquantes"),
+    ("name,margin,retention\nA,0.2,0.5\nA,0.3,0.5\n", "Noms de scénarios en double"),
+    ("name,margin,retention\nA,0.2,1.0\nB,-0.1,0.5\nC,0.2,0.5\n", "hors domaine.*A, B$"),
+    ("name,margin,retention,discount\nA,0.2,0.5,0\n", "hors domaine.*: A$"),
+])
+def test_invalid_scenarios_rejected(tmp_path, content, message):
+    path = _write(tmp_path, "scenarios.csv", content)
+    with pytest.raises(ValueError, match=message):
+        load_scenarios(path)
+
+
+def test_invalid_grid_value_rejected(tmp_path):
+    path = _write(tmp_path, "grid.json", {"grid": {"margin": ["beaucoup"]}})
+    with pytest.raises(ValueError):
+        load_scenarios(path)
+
+
+# ============ ÉVALUATION ============
+
+def test_simulated_total_is_sum_of_segment_values():
+    rng = np.random.default_rng(4)
+    n = 500
+    rfm_df = pd.DataFrame({
+        'Segment_Label': rng.choice(["Champions 🏆", "Hibernants 💤"], n),
+        'Monetary': rng.gamma(2.0, 150.0, n),
+        'Frequency': rng.integers(1, 5, n)
+    })
+    avg_spend = float(rfm_df['Monetary'].mean())
+    context = {
+        "profiles": segment_profiles(rfm_df, ("test-run-scenarios",), None),
+        "avg_spend": avg_spend,
+        "spend_cv": 0.0,
+        "n_customers": n,
+        "clv_baseline": float(clv_formula(avg_spend, **CLV_BASELINE)),
+        "initiative_cost": 0.0,
+        "affected_customers": 0,
+        "mc_paths": 0,
+        "seed": 0
+    }
+    scenarios = pd.DataFrame({"name": ["A", "B"], "margin": [0.2, 0.3], "retention": [0.5, 0.7], "discount": [0.1, 0.1]})
+    results = evaluate_scenarios(scenarios, context)
+
+    segment_columns = ["value_Champions 🏆", "value_Hibernants 💤"]
+    np.testing.assert_allclose(results["value_simulated_total"], results[segment_columns].sum(axis=1))
+    np.testing.assert_allclose(results["value_closed_form"], results["clv_avg"] * n)
+    assert "value_per_customer" not in results
@@ -0,0 +1,91 @@
+"""
+Règles de segmentation : équivalence avec l'ancien categorize, persistance, repli sur les règles par défaut
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.rfm_calculator import segment_labels
+from utils.segment_rules import (
+    DEFAULT_SEGMENT_RULES, compile_saved_segment_rules, frame_to_rules, load_segment_rules, rules_to_frame,
+    save_segment_rules, validate_segment_rules
+)
+
+SCORES = np.array([(r, f, m) for r in range(1, 5) for f in range(1, 5) for m in range(1, 5)])
+
+
+def _categorize(r, f, m):
+    """Règles historiques de compute_rfm (avant les règles déclaratives)."""
+    fm_score = (f + m) / 2
+    if r >= 4 and fm_score >= 3.5: return "Champions 🏆"
+    if r >= 3 and fm_score >= 2: return "Loyaux Potentiels 🌱"
+    if r >= 3 and fm_score < 2: return "Nouveaux Prometteurs 👋"
+    if r <= 2 and fm_score >= 3: return "À Risque ⚠️"
+    if r <= 2 and fm_score < 3: return "Hibernants 💤"
+    return "Autres"
+
+
+def test_default_rules_match_categorize():
+    labels = segment_labels(SCORES[:, 0], SCORES[:, 1], SCORES[:, 2], DEFAULT_SEGMENT_RULES)
+    assert list(labels) == [_categorize(*triplet) for triplet in SCORES]
+
+
+def test_first_matching_rule_wins_and_uncovered_cells_fall_back():
+    rules = [{"name": "Top", "r_min": 4, "f_min": 4}, {"name": "Large", "r_min": 3}]
+    labels = segment_labels(SCORES[:, 0], SCORES[:, 1], SCORES[:, 2], rules)
+    expected = np.where((SCORES[:, 0] == 4) & (SCORES[:, 1] == 4), "Top",
+                        np.where(SCORES[:, 0] >= 3, "Large", "Autres"))
+    np.testing.assert_array_equal(labels, expected)
+
+
+def test_frame_round_trip_treats_empty_names_as_missing():
+    frame = rules_to_frame(DEFAULT_SEGMENT_RULES)
+    assert frame_to_rules(frame) == DEFAULT_SEGMENT_RULES
+    frame.loc[0, "name"] = np.nan
+    errors = validate_segment_rules(frame_to_rules(frame))
+    assert any("nom manquant" in error for error in errors)
+    assert not any("nan" in error for error in errors)
+
+
+@pytest.mark.parametrize("content", [
+    '{"version": 1, "segments": [{"name": "Champ',
+    '{"version": 1}',
+    '[1, 2]',
+    json.dumps({"version": 1, "segments": [{"name": "Champions", "r_min": 9}]}),
+    json.dumps({"version": 1, "segments": [{"name": "Autres"}]}),
+])
+def test_invalid_file_falls_back_to_defaults(tmp_path, content):
+    path = tmp_path / "segment_rules.json"
+    path.write_text(content, encoding="utf-8")
+    with pytest.warns(RuntimeWarning, match="Règles par défaut"):
+        rules = load_segment_rules(str(path))
+    assert rules == DEFAULT_SEGMENT_RULES
+
+
+def test_save_round_trip_leaves_no_temporary_file(tmp_path):
+    path = tmp_path / "config" / "segment_rules.json"
+    rules = [{"name": "Actifs", "code": "444", "r_min": 3}]
+    save_segment_rules(rules, str(path))
+    assert load_segment_rules(str(path)) == rules
+    assert os.listdir(path.parent) == ["segment_rules.json"]
+
+    with pytest.raises(ValueError):
+        save_segment_rules([{"name": ""}], str(path))
+    assert load_segment_rules(str(path)) == rules
+
+
+def test_saved_rules_compiled_once_per_file_version(tmp_path):
+    path = str(tmp_path / "segment_rules.json")
+    assert compile_saved_segment_rules(path) is compile_saved_segment_rules(path)
+
+    save_segment_rules([{"name": "Tous", "r_min": 1}], path)
+    assign = compile_saved_segment_rules(path)
+    assert assign is compile_saved_segment_rules(path)
+    assert set(assign(SCORES[:, 0], SCORES[:, 1], SCORES[:, 2])) == {"Tous"}
+
+    save_segment_rules([{"name": "Récents", "r_min": 4}], path)
+    labels = compile_saved_segment_rules(path)(pd.Series([4, 1]), pd.Series([1, 1]), pd.Series([1, 1]))
+    assert list(labels) == ["Récents", "Autres"]
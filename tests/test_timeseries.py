@@ -0,0 +1,65 @@
+"""
+Sous-échantillonnage des séries longues : LTTB de référence, enveloppe min/max, type de trace
+"""
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import pytest
+
+from utils.timeseries import WEBGL_POINT_THRESHOLD, lttb_indices, minmax_indices, time_series_trace
+
+
+def _lttb_reference(x, y, n_out):
+    """LTTB classique, point par point (Steinarsson, 2013)."""
+    n = len(y)
+    every = (n - 2) / (n_out - 2)
+    selected = [0]
+    a = 0
+    for i in range(n_out - 2):
+        next_start = int(np.floor((i + 1) * every)) + 1
+        next_stop = min(int(np.floor((i + 2) * every)) + 1, n)
+        avg_x = np.mean(x[next_start:next_stop])
+        avg_y = np.mean(y[next_start:next_stop])
+        start, stop = int(np.floor(i * every)) + 1, next_start
+        best, best_area = start, -1.0
+        for j in range(start, stop):
+            area = abs((x[a] - avg_x) * (y[j] - y[a]) - (x[a] - x[j]) * (avg_y - y[a]))
+            if area > best_area:
+                best, best_area = j, area
+        selected.append(best)
+        a = best
+    selected.append(n - 1)
+    return np.array(selected)
+
+
+@pytest.mark.parametrize("n, n_out", [(1000, 50), (1237, 101), (20, 7)])
+def test_lttb_matches_reference(n, n_out):
+    rng = np.random.default_rng(n)
+    x = np.sort(rng.uniform(0, 1000, n))
+    y = np.cumsum(rng.normal(size=n))
+    np.testing.assert_array_equal(lttb_indices(x, y, n_out), _lttb_reference(x, y, n_out))
+
+
+def test_lttb_accepts_datetimes():
+    x = pd.date_range("2011-01-01", periods=500, freq="h").to_numpy()
+    y = np.sin(np.arange(500) / 10)
+    numeric = x.astype("datetime64[ns]").astype(np.int64).astype(float)
+    np.testing.assert_array_equal(lttb_indices(x, y, 40), _lttb_reference(numeric, y, 40))
+
+
+def test_minmax_keeps_every_bucket_extreme():
+    rng = np.random.default_rng(4)
+    y = rng.normal(size=10_000)
+    y[1234], y[8765] = 50.0, -50.0
+    indices = minmax_indices(y, 200)
+    assert len(indices) <= 200
+    assert np.all(np.diff(indices) > 0)
+    assert {1234, 8765} <= set(indices.tolist())
+    assert y[indices].max() == y.max() and y[indices].min() == y.min()
+
+
+def test_trace_type_follows_point_budget():
+    x = np.arange(5000)
+    assert isinstance(time_series_trace(x[:WEBGL_POINT_THRESHOLD], x[:WEBGL_POINT_THRESHOLD]), go.Scatter)
+    trace = time_series_trace(x, np.sin(x), max_points=1500)
+    assert isinstance(trace, go.Scattergl) and len(trace.y) == 1500
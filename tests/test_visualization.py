@@ -0,0 +1,33 @@
+"""
+Formats des tableaux : toutes les pages passent par les formats nommés de TABLE_FORMATS
+"""
+import ast
+import glob
+import os
+
+import pytest
+
+from conftest import APP_DIR
+from utils.visualization import TABLE_FORMATS
+
+PAGES = [os.path.join(APP_DIR, "streamlit_app.py")] + sorted(glob.glob(os.path.join(APP_DIR, "pages", "*.py")))
+
+
+def _show_table_formats(path):
+    """Valeurs littérales des arguments formats= de chaque appel à show_table d'un fichier."""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call) and getattr(node.func, "id", None) == "show_table":
+            for keyword in node.keywords:
+                if keyword.arg == "formats" and isinstance(keyword.value, ast.Dict):
+                    for value in keyword.value.values:
+                        # **{colonne: "gbp" for colonne in ...} : valeur de la compréhension
+                        value = value.value if isinstance(value, ast.DictComp) else value
+                        yield ast.literal_eval(value)
+
+
+@pytest.mark.parametrize("path", PAGES, ids=os.path.basename)
+def test_pages_use_named_table_formats(path):
+    unknown = [value for value in _show_table_formats(path) if value not in TABLE_FORMATS]
+    assert not unknown, f"Formats non nommés : {unknown}"